@@ -1,15 +1,44 @@
 import os
 import re
+import json
 from email import policy
 from email.parser import BytesParser
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from llm_client import chat_completion, truncate_to_tokens, MAX_CONCURRENCY, MODEL, TEMPERATURE
+from a2p_prefilter import load_default_prefilter
+import metrics
 
 
-# Read API key from environment variables
-api_key = os.getenv("OPENAI_API_KEY")
+# Classification rules shared by the single-message and batched prompts
+CLASSIFICATION_RULES = (
+    "You are an expert in classifying emails as Application-to-Person (A2P) or Person-to-Person (P2P). "
+    "A2P emails are system-generated messages, such as order confirmations, payment receipts, or booking notifications. "
+    "P2P emails are personal conversations between individuals.\n\n"
+    "Rules for A2P Classification:\n"
+    "- Includes messages triggered by user actions (e.g., order confirmations, payment receipts, shipping updates, booking confirmations).\n"
+    "- Messages containing keywords like 'Order', 'Receipt', 'Shipped', 'Confirmation', or 'Departure time' are A2P.\n"
+    "- Formal messages providing status updates.\n"
+    "- Excludes promotional emails, marketing, and newsletters.\n\n"
+)
+
+CLASSIFICATION_PROMPT = CLASSIFICATION_RULES + (
+    "Response Format:\n"
+    "- If A2P, respond with: 'This is A2P.'\n"
+    "- If P2P, respond with: 'This is P2P.'"
+)
+
+BATCH_CLASSIFICATION_PROMPT = CLASSIFICATION_RULES + (
+    "You will receive several messages, each starting with a line '### MESSAGE <id>'. "
+    "Classify every message independently.\n\n"
+    "Response Format:\n"
+    "- Respond only with JSON: {\"verdicts\": [{\"id\": \"<id>\", \"label\": \"A2P\" or \"P2P\"}, ...]}\n"
+    "- Include exactly one verdict for every message id."
+)
+
+# Batched classification settings (batch size 1 keeps one request per message)
+BATCH_SIZE = int(os.getenv("SERENA_CLASSIFY_BATCH_SIZE", "1"))
+BATCH_MAX_TOKENS = int(os.getenv("SERENA_CLASSIFY_BATCH_TOKENS", "8000"))
 
-# Initiate OpenAI client
-client = OpenAI(api_key=api_key)
 
 def classify_email(content):
     """
@@ -20,117 +49,329 @@ def classify_email(content):
 
     Returns:
         bool: True if classified as A2P, False otherwise.
+
+    Raises:
+        Exception: If the request fails (after the client's retries); a failure is never reported as P2P.
     """
     try:
-        prompt = {
-            "role": "system",
-            "content": (
-                "You are an expert in classifying emails as Application-to-Person (A2P) or Person-to-Person (P2P). "
-                "A2P emails are system-generated messages, such as order confirmations, payment receipts, or booking notifications. "
-                "P2P emails are personal conversations between individuals.\n\n"
-                "Rules for A2P Classification:\n"
-                "- Includes messages triggered by user actions (e.g., order confirmations, payment receipts, shipping updates, booking confirmations).\n"
-                "- Messages containing keywords like 'Order', 'Receipt', 'Shipped', 'Confirmation', or 'Departure time' are A2P.\n"
-                "- Formal messages providing status updates.\n"
-                "- Excludes promotional emails, marketing, and newsletters.\n\n"
-                "Response Format:\n"
-                "- If A2P, respond with: 'This is A2P.'\n"
-                "- If P2P, respond with: 'This is P2P.'"
-            )
-        }
+        prompt = {"role": "system", "content": CLASSIFICATION_PROMPT}
 
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[prompt, {"role": "user", "content": content.strip()}],
-            temperature=0.65,
+        response = chat_completion(
+            model=MODEL,
+            messages=[prompt, {"role": "user", "content": truncate_to_tokens(content.strip())}],
+            temperature=TEMPERATURE,
             max_tokens=50,
         )
 
-        response = completion.choices[0].message.content.strip()
         print(f"DEBUG: Model response: '{response}'")
 
         return bool(re.search(r'\bA2P\b', response, re.IGNORECASE))
 
     except Exception as e:
         print(f"Error classifying email: {e}")
-        return False
+        raise
 
 
-def process_txt_files(input_dirs, output_dir):
+def parse_batch_verdicts(response):
     """
-    Processes .txt files in multiple directories, classifies them as A2P or P2P, and saves A2P emails.
+    Parses the per-ID verdict list of a batched classification response.
 
     Args:
-        input_dirs (list): List of directories containing .txt files.
+        response (str): Model response.
+
+    Returns:
+        dict: Message ID -> True (A2P) / False (P2P); malformed entries are left out.
+    """
+    match = re.search(r"\{.*\}", response, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        verdicts = json.loads(match.group(0)).get("verdicts", [])
+    except (json.JSONDecodeError, AttributeError):
+        return {}
+
+    parsed = {}
+    for verdict in verdicts if isinstance(verdicts, list) else []:
+        if not isinstance(verdict, dict):
+            continue
+        label = str(verdict.get("label", "")).strip().upper()
+        if label in ("A2P", "P2P"):
+            parsed[str(verdict.get("id"))] = label == "A2P"
+    return parsed
+
+
+def classify_emails_batch(messages):
+    """
+    Classifies several messages with one GPT request.
+
+    Messages are numbered 1..n in the prompt, so the echoed IDs stay short whatever the message names are.
+    Messages whose verdict is missing or malformed are re-classified one by one with `classify_email`. If the
+    request itself fails (e.g. rate-limit retries are exhausted), every message is left unclassified rather than
+    sent again singly against the same limit.
+
+    Args:
+        messages (list): (message_id, content) tuples; IDs must be unique within the batch.
+
+    Returns:
+        dict: Message ID -> True if classified as A2P, False if P2P, None if the message could not be classified.
+    """
+    verdicts = {}
+    if len(messages) > 1:
+        user_content = "\n\n".join(f"### MESSAGE {index}\n{truncate_to_tokens(content.strip())}"
+                                   for index, (_, content) in enumerate(messages, 1))
+        try:
+            response = chat_completion(
+                model=MODEL,
+                messages=[{"role": "system", "content": BATCH_CLASSIFICATION_PROMPT},
+                          {"role": "user", "content": user_content}],
+                temperature=TEMPERATURE,
+                max_tokens=30 * len(messages) + 50,
+            )
+        except Exception as e:
+            print(f"Error classifying batch: {e}")
+            return {message_id: None for message_id, _ in messages}
+        try:
+            indexed = parse_batch_verdicts(response)
+            verdicts = {message_id: indexed[str(index)] for index, (message_id, _) in enumerate(messages, 1)
+                        if str(index) in indexed}
+        except Exception as e:
+            print(f"Unreadable batch verdicts: {e}")
+
+    results = {}
+    for message_id, content in messages:
+        if message_id in verdicts:
+            results[message_id] = verdicts[message_id]
+        else:
+            if len(messages) > 1:
+                print(f"DEBUG: No valid batch verdict for {message_id}, falling back to a single request.")
+            try:
+                results[message_id] = classify_email(content)
+            except Exception:
+                results[message_id] = None
+    return results
+
+
+def build_batches(token_estimates, max_batch_tokens=BATCH_MAX_TOKENS, max_batch_size=BATCH_SIZE):
+    """
+    Groups messages into batches whose total estimated size stays within the token budget.
+
+    Args:
+        token_estimates (list): (key, estimated_tokens) tuples.
+        max_batch_tokens (int): Maximum estimated input tokens per batch.
+        max_batch_size (int): Maximum number of messages per batch.
+
+    Returns:
+        list: Lists of keys; oversized messages get a batch of their own.
+    """
+    batches, current, current_tokens = [], [], 0
+    for key, tokens in token_estimates:
+        if current and (len(current) >= max_batch_size or current_tokens + tokens > max_batch_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(key)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def classify_texts(messages, prefilter=None):
+    """
+    Classifies message texts, batching the GPT requests.
+
+    Args:
+        messages (list): (name, content) tuples (names must be unique).
+        prefilter (A2PPrefilter): Optional local classifier; GPT is only called when it is not confident.
+
+    Returns:
+        dict: Name -> (is_a2p, decided_locally); is_a2p is None when GPT classification failed.
+    """
+    results, pending = {}, []
+    with metrics.stage_timer("prefilter", items=len(messages)):
+        for name, content in messages:
+            verdict = prefilter.classify(content) if prefilter is not None else None
+            if verdict is not None:
+                results[name] = (verdict, True)
+            else:
+                pending.append((name, content))
+
+    with metrics.stage_timer("classification", items=len(pending)):
+        verdicts = classify_emails_batch(pending)
+    for name, _ in pending:
+        results[name] = (verdicts[name], False)
+    return results
+
+
+def classify_txt_files(file_paths, prefilter=None):
+    """
+    Reads .txt files and classifies their content, batching the GPT requests.
+
+    Args:
+        file_paths (list): Paths of the text files (basenames must be unique).
+        prefilter (A2PPrefilter): Optional local classifier; GPT is only called when it is not confident.
+
+    Returns:
+        dict: File path -> (content, is_a2p, decided_locally); is_a2p is None when classification failed.
+    """
+    contents = {}
+    for file_path in file_paths:
+        with open(file_path, "r", encoding="utf-8", errors="replace") as file:
+            contents[file_path] = file.read()
+
+    verdicts = classify_texts([(os.path.basename(path), content) for path, content in contents.items()], prefilter)
+    return {path: (content, *verdicts[os.path.basename(path)]) for path, content in contents.items()}
+
+
+def classify_and_save_files(file_paths, output_dir, max_workers=None, prefilter=None, batch_size=None):
+    """
+    Classifies the given .txt files as A2P or P2P and saves A2P messages to `output_dir` as `a2p_<name>`.
+
+    Classification requests run on a bounded worker pool; every request goes through the shared
+    rate limiter in `llm_client`, so the configured RPM/TPM budgets hold regardless of the pool size.
+
+    Args:
+        file_paths (list): Paths of the text files (basenames must be unique).
         output_dir (str): Directory to save classified A2P .txt files.
+        max_workers (int): Number of concurrent classification requests (defaults to MAX_CONCURRENCY).
+        prefilter (A2PPrefilter): Local pre-classifier for confident cases (defaults to SERENA_PREFILTER).
+        batch_size (int): Maximum messages per GPT request (defaults to BATCH_SIZE); batches are
+            also capped at BATCH_MAX_TOKENS estimated input tokens.
+
+    Returns:
+        dict: File path -> True (A2P) / False (P2P); files that failed are left out.
     """
     os.makedirs(output_dir, exist_ok=True)
+    max_workers = max_workers or MAX_CONCURRENCY
+    batch_size = batch_size or BATCH_SIZE
+    if prefilter is None:
+        prefilter = load_default_prefilter()
 
-    total_files = 0
-    for input_dir in input_dirs:
-        txt_files = [f for f in os.listdir(input_dir) if f.endswith(".txt")]
-        total_files += len(txt_files)
+    # Token estimates come from the file size so files are only read by the workers
+    token_estimates = [(file_path, os.path.getsize(file_path) // 4 + 1) for file_path in file_paths]
+    batches = build_batches(token_estimates, max_batch_size=batch_size)
 
-        print(f"Processing {len(txt_files)} text files from {input_dir}...")
+    verdicts = {}
+    local_decisions = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(classify_txt_files, batch, prefilter): batch for batch in batches}
 
-        for idx, txt_file in enumerate(txt_files, start=1):
-            file_path = os.path.join(input_dir, txt_file)
+        idx = 0
+        for future in as_completed(futures):
             try:
-                with open(file_path, "r", encoding="utf-8", errors="replace") as file:
-                    content = file.read()
+                results = future.result()
+            except Exception as e:
+                results = {}
+                print(f"Error processing batch {futures[future]}: {e}")
 
-                is_a2p = classify_email(content)
-                print(f"DEBUG: {txt_file} classified as: {'A2P' if is_a2p else 'P2P'}")
+            for file_path in futures[future]:
+                idx += 1
+                if file_path not in results:
+                    continue
+                txt_file = os.path.basename(file_path)
+                try:
+                    content, is_a2p, decided_locally = results[file_path]
+                    if is_a2p is None:
+                        print(f"[{idx}/{len(file_paths)}] Not classified: {file_path}")
+                        continue
+                    local_decisions += decided_locally
+                    source = "pre-classifier" if decided_locally else "GPT"
+                    print(f"DEBUG: {txt_file} classified as: {'A2P' if is_a2p else 'P2P'} ({source})")
 
-                if is_a2p:
-                    output_path = os.path.join(output_dir, f"a2p_{txt_file}")
-                    with open(output_path, "w", encoding="utf-8", errors="replace") as dest_file:
-                        dest_file.write(content)
-                    print(f"[{idx}/{len(txt_files)}] Saved: {output_path}")
-                else:
-                    print(f"[{idx}/{len(txt_files)}] Discarded: {file_path}")
+                    if is_a2p:
+                        output_path = os.path.join(output_dir, f"a2p_{txt_file}")
+                        with open(output_path, "w", encoding="utf-8", errors="replace") as dest_file:
+                            dest_file.write(content)
+                        print(f"[{idx}/{len(file_paths)}] Saved: {output_path}")
+                    else:
+                        print(f"[{idx}/{len(file_paths)}] Discarded: {file_path}")
+                    verdicts[file_path] = is_a2p
 
-            except Exception as e:
-                print(f"Error processing {file_path}: {e}")
+                except Exception as e:
+                    print(f"Error processing {file_path}: {e}")
 
-    print(f"Processing completed. Total {total_files} files checked. A2P emails saved in {output_dir}.")
+    if prefilter is not None:
+        print(f"Pre-classifier decided {local_decisions}/{len(file_paths)} files without GPT.")
+    return verdicts
 
 
-def convert_text_to_html(input_directory, output_directory):
+def process_txt_files(input_dirs, output_dir, max_workers=None, prefilter=None, batch_size=None):
     """
-    Converts all .txt files in the input directory to HTML format.
+    Processes .txt files in multiple directories, classifies them as A2P or P2P, and saves A2P emails.
 
     Args:
-        input_directory (str): Directory containing text files.
-        output_directory (str): Directory for output HTML files.
+        input_dirs (list): List of directories containing .txt files.
+        output_dir (str): Directory to save classified A2P .txt files.
+        max_workers (int): Number of concurrent classification requests (defaults to MAX_CONCURRENCY).
+        prefilter (A2PPrefilter): Local pre-classifier for confident cases (defaults to SERENA_PREFILTER).
+        batch_size (int): Maximum messages per GPT request (defaults to BATCH_SIZE).
     """
-    os.makedirs(output_directory, exist_ok=True)
+    total_files = 0
+    for input_dir in input_dirs:
+        txt_files = [f for f in os.listdir(input_dir) if f.endswith(".txt")]
+        total_files += len(txt_files)
 
-    for file_name in os.listdir(input_directory):
-        file_path = os.path.join(input_directory, file_name)
+        print(f"Processing {len(txt_files)} text files from {input_dir} with {max_workers or MAX_CONCURRENCY} workers...")
+        classify_and_save_files([os.path.join(input_dir, f) for f in txt_files], output_dir,
+                                max_workers, prefilter, batch_size)
+
+    print(f"Processing completed. Total {total_files} files checked. A2P emails saved in {output_dir}.")
 
-        if file_name.endswith(".txt") and os.path.isfile(file_path):
-            try:
-                with open(file_path, "r", encoding="utf-8") as file:
-                    content = file.read()
 
-                html_content = f"""<!DOCTYPE html>
+def text_to_html(title, content):
+    """Renders a message text as an HTML document."""
+    return f"""<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{os.path.splitext(file_name)[0]}</title>
+    <title>{title}</title>
 </head>
 <body>
     <pre>{content}</pre>
 </body>
 </html>"""
 
-                output_file_path = os.path.join(output_directory, os.path.splitext(file_name)[0] + ".html")
-                with open(output_file_path, "w", encoding="utf-8") as html_file:
-                    html_file.write(html_content)
 
-                print(f"Converted: {file_name} -> {output_file_path}")
+def convert_text_file_to_html(file_path, output_directory):
+    """
+    Converts one .txt file to HTML format.
+
+    Args:
+        file_path (str): Path to the text file.
+        output_directory (str): Directory for the output HTML file.
+
+    Returns:
+        str: Path of the HTML file.
+    """
+    file_name = os.path.basename(file_path)
+    with open(file_path, "r", encoding="utf-8") as file:
+        content = file.read()
+
+    html_content = text_to_html(os.path.splitext(file_name)[0], content)
+
+    output_file_path = os.path.join(output_directory, os.path.splitext(file_name)[0] + ".html")
+    with open(output_file_path, "w", encoding="utf-8") as html_file:
+        html_file.write(html_content)
+
+    print(f"Converted: {file_name} -> {output_file_path}")
+    return output_file_path
 
+
+def convert_text_to_html(input_directory, output_directory):
+    """
+    Converts all .txt files in the input directory to HTML format.
+
+    Args:
+        input_directory (str): Directory containing text files.
+        output_directory (str): Directory for output HTML files.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+
+    for file_name in os.listdir(input_directory):
+        file_path = os.path.join(input_directory, file_name)
+
+        if file_name.endswith(".txt") and os.path.isfile(file_path):
+            try:
+                convert_text_file_to_html(file_path, output_directory)
             except Exception as e:
                 print(f"Error converting {file_name}: {e}")
@@ -1,11 +1,17 @@
 import os
 import json
+import queue
+import threading
 import traceback
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
 
 load_dotenv()
 import preprocess
+import metrics
+from corpus_store import CorpusStore, CORPUS_FILE, html_name
+from search_index import parse_query
+from highlighter import highlight_html
+from results_table import RecordTable, RecordFilter, parse_date
 from tkinter import Tk, Label, Button, Entry, filedialog, ttk, messagebox, Frame
 from tkinterweb import HtmlFrame  # Ensure `tkinterweb` is installed
 
@@ -47,6 +53,26 @@ KEY_COLORS = {
     "mobile_number": "magenta"
 }
 
+TABLE_ROW_HEIGHT = 20  # Fallback when the Treeview style does not define a row height
+TABLE_HEADING_HEIGHT = 24
+
+# Pipeline stages shown in the progress panel
+STAGE_LABELS = {
+    "extraction": "Extraction",
+    "classification": "Classification",
+    "html": "HTML",
+    "ner": "NER"
+}
+
+
+def format_eta(seconds):
+    """Formats an ETA in seconds as h:mm:ss ("?" while it is unknown)."""
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
 
 class TextToHtmlApp:
     def __init__(self, master):
@@ -54,8 +80,24 @@ class TextToHtmlApp:
         master.title("SERENA - Your Forensic AI-Assistant")
         master.geometry("1200x650")  
 
-        # ✅ Initialize extracted JSON storage
+        # ✅ Initialize extracted JSON storage; the table only shows the visible window of the table model
         self.normalized_json_list = None
+        self.table_model = RecordTable(list(KEY_MAPPING.keys()))
+        self.table_offset = 0
+        self.table_visible_rows = 3
+        self.table_render_pending = False
+
+        # ✅ Pipeline events are handed from the worker thread to the Tk main loop through this queue
+        self.pipeline_events = queue.Queue()
+        self.pipeline_thread = None
+        self.cancel_event = None
+        self.stage_progress = {}
+        self.tree_files = set()
+        self.case_folder = None
+        self.store = None
+
+        # ✅ HTML document name -> (text name, raw entities) of the open case, so lookups need no scan
+        self.document_index = {}
 
         self.left_frame = self.create_frame(master, "left")
         self.right_frame = self.create_frame(master, "right")
@@ -66,6 +108,19 @@ class TextToHtmlApp:
         self.create_button(self.left_frame, "🌟 Highlight All HTML Files", self.highlight_all_html, bg="#008CBA", fg="white")
         self.create_button(self.left_frame, "🔍 Highlight Selected File", self.highlight_selected_file, bg="#f44336", fg="white")
 
+        # ✅ Progress of the case being processed
+        self.progress_bar = ttk.Progressbar(self.left_frame, mode="determinate", maximum=100)
+        self.progress_bar.pack(fill="x", pady=(5, 0))
+        self.progress_label = Label(self.left_frame, text="Idle", font=("Arial", 9), justify="left", anchor="w")
+        self.progress_label.pack(fill="x")
+        self.cancel_button = self.create_button(self.left_frame, "⏹ Cancel Processing", self.cancel_processing, bg="#777", fg="white")
+        self.cancel_button.config(state="disabled")
+
+        # ✅ Search over the extracted records; matching documents replace the file list
+        self.search_entry = self.create_labeled_entry(self.left_frame, "Search (words, service:, date:, amount>, mobile:):")
+        self.search_entry.bind("<Return>", lambda event: self.search_records())
+        self.create_button(self.left_frame, "🔎 Search Records", self.search_records, bg="#6A1B9A", fg="white")
+
         # Tree view for HTML files
         self.tree_label = Label(self.left_frame, text="📄 HTML Files in Folder:", font=("Arial", 11, "bold"))
         self.tree_label.pack(pady=5)
@@ -108,7 +163,9 @@ class TextToHtmlApp:
 
     def create_button(self, parent, text, command, bg="#333", fg="white"):
         """Creates a styled button."""
-        Button(parent, text=text, command=command, bg=bg, fg=fg, font=("Arial", 10, "bold"), padx=10, pady=3).pack(pady=5)
+        button = Button(parent, text=text, command=command, bg=bg, fg=fg, font=("Arial", 10, "bold"), padx=10, pady=3)
+        button.pack(pady=5)
+        return button
 
     def create_file_tree(self, parent):
         """Creates a tree view to display HTML files."""
@@ -136,49 +193,317 @@ class TextToHtmlApp:
         return legend_frame
 
     def create_json_table(self, parent):
-        """Creates a table to display JSON data."""
+        """Creates the filter bar and a virtualized table to display JSON data (rows are drawn from the table model)."""
+        filter_frame = Frame(parent)
+        filter_frame.pack(fill="x", padx=10)
+        self.table_filters = {}
+        for key, label_text, width in [("service", "Service:", 16), ("date_from", "Date from:", 11), ("date_to", "to:", 11),
+                                       ("amount_min", "Amount from:", 8), ("amount_max", "to:", 8)]:
+            Label(filter_frame, text=label_text, font=("Arial", 9)).pack(side="left")
+            entry = Entry(filter_frame, width=width, font=("Arial", 9))
+            entry.pack(side="left", padx=(0, 5))
+            entry.bind("<Return>", lambda event: self.apply_table_filter())
+            self.table_filters[key] = entry
+        # ✅ Service names are filtered while typing
+        self.table_filters["service"].bind("<KeyRelease>", lambda event: self.apply_table_filter())
+        Button(filter_frame, text="Filter", command=self.apply_table_filter, font=("Arial", 9)).pack(side="left", padx=2)
+        Button(filter_frame, text="Clear", command=self.clear_table_filter, font=("Arial", 9)).pack(side="left", padx=2)
+        self.table_count_label = Label(filter_frame, text="", font=("Arial", 9))
+        self.table_count_label.pack(side="right")
+
         frame = ttk.Frame(parent)
         frame.pack(fill="both", expand=True, padx=10, pady=5)
 
         table = ttk.Treeview(frame, columns=KEY_COLUMNS, show="headings", height=3)
-        table.pack(fill="both", expand=True)
+        table.pack(side="left", fill="both", expand=True)
 
-        for column in KEY_COLUMNS:
-            table.heading(column, text=column)
+        for key, column in KEY_MAPPING.items():
+            table.heading(column, text=column, command=lambda key=key: self.sort_table(key))
             table.column(column, width=130, anchor="center")
+        table.tag_configure("evenrow", background="#f2f2f2")
+        table.tag_configure("oddrow", background="white")
 
-        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=table.yview)
-        scrollbar.pack(side="right", fill="y")
-        table.configure(yscrollcommand=scrollbar.set)
+        self.table_scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.scroll_table)
+        self.table_scrollbar.pack(side="right", fill="y")
+        table.bind("<Configure>", self.resize_table)
+        table.bind("<MouseWheel>", lambda event: self.scroll_table("scroll", -1 if event.delta > 0 else 1, "units"))
+        table.bind("<Button-4>", lambda event: self.scroll_table("scroll", -1, "units"))
+        table.bind("<Button-5>", lambda event: self.scroll_table("scroll", 1, "units"))
 
         return table
 
+    def set_table_records(self, records):
+        """Replaces the records of the JSON table, keeping the current sort order and filter."""
+        model = RecordTable(list(KEY_MAPPING.keys()), records)
+        if self.table_model.sort_column is not None:
+            model.sort(self.table_model.sort_column, self.table_model.descending)
+        model.set_filter(self.table_model.filter)
+        self.table_model, self.table_offset = model, 0
+        self.render_table()
+
+    def render_table(self):
+        """Draws the visible window of the table model into the Treeview."""
+        self.table_render_pending = False
+        total = len(self.table_model)
+        self.table_offset = max(0, min(self.table_offset, total - self.table_visible_rows))
+        self.json_table.delete(*self.json_table.get_children())
+        for position, row in enumerate(self.table_model.rows(self.table_offset, self.table_visible_rows), self.table_offset):
+            self.json_table.insert("", "end", values=row, tags=("evenrow" if position % 2 == 0 else "oddrow",))
+        if total:
+            self.table_scrollbar.set(self.table_offset / total, min(self.table_offset + self.table_visible_rows, total) / total)
+        else:
+            self.table_scrollbar.set(0, 1)
+        self.table_count_label.config(text=f"{total} of {len(self.table_model.records)} records")
+
+    def schedule_table_render(self):
+        """Redraws the table once the pending events are handled (records stream in one by one)."""
+        if not self.table_render_pending:
+            self.table_render_pending = True
+            self.master.after_idle(self.render_table)
+
+    def scroll_table(self, action, amount, unit=None):
+        """Handles scrollbar and mouse wheel scrolling by moving the visible window."""
+        if action == "moveto":
+            self.table_offset = int(float(amount) * len(self.table_model))
+        elif action == "scroll":
+            step = self.table_visible_rows if unit == "pages" else 1
+            self.table_offset += int(amount) * step
+        self.render_table()
+
+    def resize_table(self, event):
+        """Fits the visible window to the height of the table."""
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or TABLE_ROW_HEIGHT)
+        visible_rows = max(1, (event.height - TABLE_HEADING_HEIGHT) // row_height)
+        if visible_rows != self.table_visible_rows:
+            self.table_visible_rows = visible_rows
+            self.render_table()
+
+    def sort_table(self, key):
+        """Sorts the table by a column; clicking the same column again reverses the order."""
+        descending = self.table_model.sort_column == key and not self.table_model.descending
+        self.table_model.sort(key, descending)
+        for column_key, column in KEY_MAPPING.items():
+            arrow = (" ▼" if descending else " ▲") if column_key == key else ""
+            self.json_table.heading(column, text=column + arrow)
+        self.table_offset = 0
+        self.render_table()
+
+    def apply_table_filter(self):
+        """Filters the table by service name, action date range (YYYY/MM/DD) and amount range."""
+        values = {key: entry.get().strip() for key, entry in self.table_filters.items()}
+        try:
+            dates = [parse_date(values[key]) if values[key] else None for key in ("date_from", "date_to")]
+            amounts = [float(values[key].replace(",", "")) if values[key] else None for key in ("amount_min", "amount_max")]
+        except ValueError:
+            self.table_count_label.config(text="⚠ Invalid amount")
+            return
+        if any(values[key] and date is None for key, date in zip(("date_from", "date_to"), dates)):
+            self.table_count_label.config(text="⚠ Dates must be YYYY/MM/DD")
+            return
+        self.table_model.set_filter(RecordFilter(values["service"], *dates, *amounts))
+        self.table_offset = 0
+        self.render_table()
+
+    def clear_table_filter(self):
+        for entry in self.table_filters.values():
+            entry.delete(0, "end")
+        self.apply_table_filter()
+
     def browse_json_folder(self):
         """Allows the user to select a folder and process JSON & HTML files."""
+        if self.pipeline_thread is not None and self.pipeline_thread.is_alive():
+            messagebox.showwarning("Warning", "A case is already being processed.")
+            return
         folder = filedialog.askdirectory()
         if folder:
             self.input_folder_entry.delete(0, 'end')
             self.input_folder_entry.insert(0, folder)
-            self.json_folder_entry, self.html_folder_entry = preprocess.preprocess(folder)
+            if self.store is not None:
+                self.store.close()
+            self.case_folder, self.store = folder, None
+            self.normalized_json_list = []
+            self.set_table_records([])
             self.refresh_file_tree()
 
+            # ✅ Run the pipeline in the background; results and progress stream in through pipeline events
+            self.cancel_event = threading.Event()
+            self.stage_progress = {}
+            self.progress_bar["value"] = 0
+            self.progress_label.config(text="Starting...")
+            self.cancel_button.config(state="normal")
+            self.pipeline_thread = threading.Thread(target=self.run_pipeline, args=(folder, self.cancel_event), daemon=True)
+            self.pipeline_thread.start()
+            self.master.after(100, self.poll_pipeline_events)
+
+    def run_pipeline(self, folder, cancel_event):
+        """Runs preprocessing on a worker thread and reports the outcome as a final event."""
+        try:
+            json_dir, html_dir = preprocess.preprocess(folder, on_event=self.pipeline_events.put, cancel_event=cancel_event)
+            self.pipeline_events.put({"event": "finished", "json_dir": json_dir, "html_dir": html_dir,
+                                      "cancelled": cancel_event.is_set()})
+        except Exception as e:
+            traceback.print_exc()
+            self.pipeline_events.put({"event": "failed", "error": str(e)})
+
+    def poll_pipeline_events(self):
+        """Applies queued pipeline events on the Tk main thread."""
+        running = True
+        while True:
+            try:
+                event = self.pipeline_events.get_nowait()
+            except queue.Empty:
+                break
+            running = self.handle_pipeline_event(event) and running
+        if running:
+            self.master.after(100, self.poll_pipeline_events)
+
+    def cancel_processing(self):
+        """Stops the running case after the messages currently being processed (the next run resumes it)."""
+        if self.pipeline_thread is not None and self.pipeline_thread.is_alive():
+            self.cancel_event.set()
+            self.cancel_button.config(state="disabled")
+            self.update_progress()
+
+    def update_progress(self, status=None):
+        """Shows done/total, throughput, ETA and errors of each stage, the overall share of finished work and a status line."""
+        lines, done, total = [], 0, 0
+        for stage, label in STAGE_LABELS.items():
+            progress = self.stage_progress.get(stage)
+            if not progress or not progress["total"]:
+                continue
+            done, total = done + progress["done"], total + progress["total"]
+            line = f"{label}: {progress['done']}/{progress['total']}  {progress['rate']:.1f}/s  ETA {format_eta(progress['eta'])}"
+            if progress["errors"]:
+                line += f"  ⚠ {progress['errors']} errors"
+            lines.append(line)
+        if status:
+            lines.append(status)
+        elif self.cancel_event is not None and self.cancel_event.is_set():
+            lines.append("Cancelling after the current messages...")
+        self.progress_bar["value"] = 100 * done / total if total else 0
+        self.progress_label.config(text="\n".join(lines) or "Starting...")
+
+    def finish_progress(self, status):
+        """Shows the final status of a run and disables the cancel button."""
+        self.cancel_button.config(state="disabled")
+        self.update_progress(status)
+
+    def handle_pipeline_event(self, event):
+        """
+        Updates the progress panel, the file tree and the JSON table as messages complete.
+
+        Returns:
+            bool: False once the pipeline has stopped.
+        """
+        if event["event"] == "progress":
+            self.stage_progress[event["stage"]] = event
+            self.update_progress()
+        elif event["event"] == "html":
+            file_name = event["html_name"]
+            self.document_index.setdefault(file_name, (event["text"], None))
+            if file_name not in self.tree_files:
+                self.tree_files.add(file_name)
+                self.file_tree.insert("", "end", values=(file_name,))
+        elif event["event"] == "message_done":
+            self.document_index[event["html_name"]] = (event["text"], event["entities"])
+            self.normalized_json_list.append(event["record"])
+            self.table_model.append(event["record"])
+            self.schedule_table_render()
+        elif event["event"] == "finished":
+            # ✅ Show every record of the case, including those processed in earlier runs
+            from named_entitiy_recognition import load_cache
+            self.normalized_json_list = load_cache()
+            self.set_table_records(self.normalized_json_list)
+            self.refresh_file_tree()
+            self.finish_progress("⏹ Cancelled - select the folder again to resume." if event.get("cancelled")
+                                 else "✅ Processing completed.")
+            return False
+        elif event["event"] == "failed":
+            self.finish_progress("❌ Processing failed.")
+            messagebox.showerror("Error", f"Processing failed: {event['error']}")
+            return False
+        return True
+
+    def get_store(self):
+        """Returns the corpus store of the selected case (opened on first use), or None if there is none yet."""
+        if self.store is None and self.case_folder and os.path.exists(os.path.join(self.case_folder, CORPUS_FILE)):
+            self.store = CorpusStore(self.case_folder)
+        return self.store
+
+    def load_document_index(self):
+        """Rebuilds the document index of the case with a single query to the corpus store."""
+        store = self.get_store()
+        self.document_index = store.document_index() if store else {}
+
+    def lookup_document(self, file_name):
+        """
+        Finds the message behind an HTML document through the document index.
+
+        Documents missing from the index (e.g. written by another process) are looked up in the
+        corpus store once and then added to the index.
+
+        Returns:
+            tuple: (text name, raw entities dict or None), or None if there is no such document.
+        """
+        document = self.document_index.get(file_name)
+        if document is None:
+            store = self.get_store()
+            found = store.get_document(file_name) if store else None
+            if found is None:
+                return None
+            document = (found[0], found[2])
+        elif isinstance(document[1], str):
+            # Raw entities are decoded on first use only
+            document = (document[0], json.loads(document[1]))
+        self.document_index[file_name] = document
+        return document
+
     def refresh_file_tree(self):
-        """Refreshes the file tree to display available HTML files."""
+        """Refreshes the document index and the file tree to display available HTML files."""
+        self.file_tree.delete(*self.file_tree.get_children())
+        self.tree_label.config(text="📄 HTML Files in Folder:")
+        self.load_document_index()
+        self.tree_files = set(self.document_index)
+        for file_name in sorted(self.tree_files):
+            self.file_tree.insert("", "end", values=(file_name,))
+
+    def search_records(self):
+        """Lists the documents whose records match the search query (an empty query lists every document)."""
+        query = self.search_entry.get().strip()
+        if not query:
+            self.refresh_file_tree()
+            return
+        store = self.get_store()
+        if store is None:
+            messagebox.showwarning("Warning", "The selected case has not been processed yet.")
+            return
+        try:
+            results = store.search(limit=None, **parse_query(query))
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid search: {e}")
+            return
         self.file_tree.delete(*self.file_tree.get_children())
-        if hasattr(self, "html_folder_entry") and os.path.exists(self.html_folder_entry):
-            for file_name in os.listdir(self.html_folder_entry):
-                if file_name.endswith('.html'):
-                    self.file_tree.insert("", "end", values=(file_name,))
+        for result in results:
+            self.file_tree.insert("", "end", values=(html_name(result["name"]),))
+        self.tree_label.config(text=f"🔎 {len(results)} matching files:")
+
+    def save_highlighted_html(self, file_name, highlighted_content):
+        """Stores the highlighted HTML of a document in place of its current HTML."""
+        document = self.lookup_document(file_name)
+        if document:
+            store = self.get_store()
+            if store is None:
+                messagebox.showwarning("Warning", "The selected case has not been processed yet.")
+                return
+            store.set_html(document[0], highlighted_content)
 
     def highlight_all_html(self):
-        """Applies highlighting to all HTML files in the directory."""
-        if hasattr(self, "html_folder_entry") and hasattr(self, "json_folder_entry"):
-            for file_name in os.listdir(self.html_folder_entry):
-                if file_name.endswith('.html'):
-                    highlighted_content = self.load_and_highlight_html(file_name)
-                    if highlighted_content:
-                        with open(os.path.join(self.html_folder_entry, file_name), 'w', encoding='utf-8') as html_file:
-                            html_file.write(highlighted_content)
+        """Applies highlighting to all HTML files of the case."""
+        if self.get_store():
+            for file_name in sorted(self.document_index):
+                highlighted_content = self.load_and_highlight_html(file_name)
+                if highlighted_content:
+                    self.save_highlighted_html(file_name, highlighted_content)
             self.refresh_file_tree()
 
     def highlight_selected_file(self):
@@ -188,8 +513,7 @@ class TextToHtmlApp:
             file_name = self.file_tree.item(selected_item, 'values')[0]
             highlighted_content = self.load_and_highlight_html(file_name)
             if highlighted_content:
-                with open(os.path.join(self.html_folder_entry, file_name), 'w', encoding='utf-8') as html_file:
-                    html_file.write(highlighted_content)
+                self.save_highlighted_html(file_name, highlighted_content)
         self.refresh_file_tree()
 
     def open_html_file(self, event):
@@ -198,72 +522,45 @@ class TextToHtmlApp:
         if selected_item:
             file_name = self.file_tree.item(selected_item, 'values')[0]
             highlighted_content = self.load_and_highlight_html(file_name)
-            soup = BeautifulSoup(highlighted_content, 'html5lib')
-            clean_html = str(soup)
             self.html_viewer.load_html(
                 highlighted_content if highlighted_content else "<html><body><p>No highlights applied.</p></body></html>")
 
     def load_and_highlight_html(self, file_name):
-        """Loads an HTML file, finds the corresponding JSON data, and applies highlights."""
-        json_dir = getattr(self, "json_folder_entry", "")
-        html_dir = getattr(self, "html_folder_entry", "")
-
-        if json_dir and html_dir:
-            for json_file_name in os.listdir(json_dir):
-                if json_file_name.endswith('.json'):
-                    json_file_path = os.path.join(json_dir, json_file_name)
-                    with open(json_file_path, 'r', encoding='utf-8') as json_file:
-                        json_data = json.load(json_file)
-
-                    source_path = json_data.get("source_path", "")
-                    if os.path.basename(source_path).replace('.txt', '.html') == file_name:
-                        html_file_path = os.path.join(html_dir, file_name)
-                        if os.path.exists(html_file_path):
-                            with open(html_file_path, 'r', encoding='utf-8') as html_file:
-                                return self.highlight_json_in_html_content(html_file.read(), json_data)
+        """Loads an HTML document with its extracted JSON data (found through the document index) and applies highlights."""
+        document = self.lookup_document(file_name)
+        if document and document[1] is not None:
+            store = self.get_store()
+            if store is None:
+                messagebox.showwarning("Warning", "The selected case has not been processed yet.")
+                return None
+            html_content = store.get_html(document[0])
+            if html_content is not None:
+                return self.highlight_json_in_html_content(html_content, document[1])
         return None
 
     def highlight_json_in_html_content(self, html_content, json_data):
-        """Highlights JSON values in the HTML content while avoiding tag attributes and redundant span tags."""
-        soup = BeautifulSoup(html_content, "html.parser")
-
-        def highlight_text(text, value, color):
-            """Highlights text only if it's not already inside a <span>."""
-            if value in text and f'<span' not in text:
-                return text.replace(value, f'<span style="background-color: {color};">{value}</span>')
-            return text
-
-        # JSON 값이 있는 경우에만 하이라이트 적용
-        for key, color in KEY_COLORS.items():
-            value = json_data.get(key)
-            if isinstance(value, str) and value.strip():  # 값이 문자열이고 공백이 아닐 때만 실행
-                for text_node in soup.find_all(string=True):
-                    if text_node.parent.name not in ['script', 'style'] and not text_node.parent.attrs:
-                        updated_text = highlight_text(text_node, value, color)
-                        if updated_text != text_node:
-                            text_node.replace_with(BeautifulSoup(updated_text, "html.parser"))
-
-        return str(soup)
+        """Highlights JSON values (including list items) in the HTML content in a single pass over its text."""
+        return highlight_html(html_content, json_data, KEY_COLORS)
 
 
     def load_json_table(self):
         """Loads extracted and normalized JSON data into the table."""
-        self.json_table.delete(*self.json_table.get_children())
+        self.set_table_records([])
 
-        if not hasattr(self, "json_folder_entry") or not os.path.exists(self.json_folder_entry):
-            messagebox.showerror("Error", "JSON folder is not selected or does not exist.")
+        if not self.case_folder:
+            messagebox.showerror("Error", "Case folder is not selected.")
             return
 
-        if not hasattr(self, "normalized_json_list"):
+        if not self.normalized_json_list:
             self.normalized_json_list = []
 
         if self.normalized_json_list:
             print(f"DEBUG: Using cached JSON data ({len(self.normalized_json_list)} objects)")
         else:
-            print(f"DEBUG: Calling extract_keywords() for folder -> {self.json_folder_entry}")
+            print("DEBUG: Loading records from cache.json")
 
-            from named_entitiy_recognition import extract_keywords
-            extracted_data = extract_keywords([self.json_folder_entry], self.json_folder_entry)
+            from named_entitiy_recognition import load_cache
+            extracted_data = load_cache()
 
             if extracted_data:
                 self.normalized_json_list = extracted_data
@@ -275,13 +572,7 @@ class TextToHtmlApp:
             messagebox.showwarning("Warning", "No valid data extracted from files.")
             return
 
-        for i, json_data in enumerate(self.normalized_json_list):
-            row = [json_data.get(key, "") for key in KEY_MAPPING.keys()]
-            tag = "evenrow" if i % 2 == 0 else "oddrow"
-            self.json_table.insert("", "end", values=row, tags=(tag,))
-
-        self.json_table.tag_configure("evenrow", background="#f2f2f2")
-        self.json_table.tag_configure("oddrow", background="white")
+        self.set_table_records(self.normalized_json_list)
 
 
 def main():
@@ -290,6 +581,10 @@ def main():
     app = TextToHtmlApp(root)
     root.mainloop()
 
+    # ✅ Rewrite the case's metrics report so it includes the highlighting done in this session
+    if metrics.ENABLED and app.case_folder:
+        metrics.write_reports(os.path.join(app.case_folder, metrics.REPORT_NAME))
+
 
 if __name__ == "__main__":
     main() 
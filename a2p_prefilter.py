@@ -0,0 +1,291 @@
+import os
+import re
+import sys
+import json
+import math
+import random
+import argparse
+from collections import Counter
+from corpus_store import CorpusStore, CORPUS_FILE
+
+
+# Header/body rules as (pattern, log-odds weight); positive weights point to A2P, negative to P2P
+SENDER_RULES = [
+    (re.compile(r"no[-_.]?reply|do[-_.]?not[-_.]?reply", re.IGNORECASE), 2.5),
+    (re.compile(r"\b(notifications?|alerts?|info|support|receipts?|orders?|billing|service|account|mailer|auto)\b",
+                re.IGNORECASE), 1.0),
+]
+SUBJECT_RULE = (re.compile(
+    r"\b(order|receipt|invoice|shipped|shipping|delivery|delivered|booking|reservation|confirm\w*|payment|"
+    r"transaction|ticket|itinerary|boarding|registration|subscription|verification|purchase)\b", re.IGNORECASE), 2.0)
+BODY_RULE = (re.compile(
+    r"(order (number|no\.?|#)|tracking number|receipt|payment amount|booking (id|number|reference)|"
+    r"confirmation (code|number)|boarding pass|total( amount)?:|amount paid)", re.IGNORECASE), 1.0)
+SHORT_CODE_RULE = (re.compile(r"^(from|sender):\s*\+?\d{3,6}(\.0)?\s*$", re.IGNORECASE | re.MULTILINE), 2.5)
+WEB_MESSAGE_RULE = (re.compile(r"\[(web msg|web sent|web발신)\]", re.IGNORECASE), 2.5)
+CHAT_SERVICE_RULE = (re.compile(r"^\[[^\]]*(notification|official|service)[^\]]*\]", re.IGNORECASE | re.MULTILINE), 1.0)
+MARKETING_RULE = (re.compile(r"\b(unsubscribe|newsletter|% off|sale ends|limited time|promo code)\b", re.IGNORECASE), -1.5)
+PERSONAL_SMS_RULE = (re.compile(r"^from:\s*\+?\d{9,15}(\.0)?\s*$", re.IGNORECASE | re.MULTILINE), -0.5)
+
+# P2P evidence, only scored when the message has no links, reply keywords or transactional fields. Casual
+# chat language alone clears the default threshold; a personal number alone does not (automated notices
+# are also sent from long numbers).
+AUTOMATED_CONTENT = re.compile(
+    r"https?://|www\.|\breply\s+(stop|help|y|yes|n|no|c|\d)\b|\b(stop|end) to (end|stop|opt|cancel|unsubscribe)|"
+    r"\bopt[- ]?out\b|\bunsubscribe\b", re.IGNORECASE)
+PLAIN_PERSONAL_SMS_RULE = (PERSONAL_SMS_RULE[0], -1.5)
+CONVERSATION_RULE = (re.compile(
+    r"\b(lol|lmao|haha+|hehe|omg|btw|idk|omw|thx|xoxo|gonna|wanna|gotta|ya|yeah|yep|nope|u|ur|miss you|"
+    r"love you|see you|see ya|call me|text me|on my way|be there|running late|how are you|what's up|sup)\b",
+    re.IGNORECASE), -2.5)
+
+TOKEN_PATTERN = re.compile(r"[a-z]+|\d+")
+DEFAULT_THRESHOLD = float(os.getenv("SERENA_PREFILTER_THRESHOLD", "0.9"))
+
+
+def get_header(content, name):
+    """Returns the value of a `Name: value` header line in a preprocessed text message."""
+    match = re.search(rf"^{name}:\s*(.*)$", content, re.IGNORECASE | re.MULTILINE)
+    return match.group(1).strip() if match else ""
+
+
+def rule_log_odds(content):
+    """
+    Scores a message with the header and body rules.
+
+    Args:
+        content (str): Preprocessed message text.
+
+    Returns:
+        float: Log-odds that the message is A2P (0 means no evidence).
+    """
+    score = 0.0
+    sender = get_header(content, "From")
+    subject = get_header(content, "Subject")
+
+    for pattern, weight in SENDER_RULES:
+        if sender and pattern.search(sender):
+            score += weight
+    if subject and SUBJECT_RULE[0].search(subject):
+        score += SUBJECT_RULE[1]
+
+    transactional = BODY_RULE[0].search(content)
+    if transactional:
+        score += BODY_RULE[1]
+    elif MARKETING_RULE[0].search(content):
+        score += MARKETING_RULE[1]
+
+    automated = False
+    for pattern, weight in (SHORT_CODE_RULE, WEB_MESSAGE_RULE, CHAT_SERVICE_RULE):
+        if pattern.search(content):
+            score += weight
+            automated = True
+
+    if transactional or automated or AUTOMATED_CONTENT.search(content):
+        if PERSONAL_SMS_RULE[0].search(content):
+            score += PERSONAL_SMS_RULE[1]
+        return score
+
+    for pattern, weight in (PLAIN_PERSONAL_SMS_RULE, CONVERSATION_RULE):
+        if pattern.search(content):
+            score += weight
+    return score
+
+
+def tokenize(text):
+    """Splits text into lowercase unigram and bigram features (numbers are reduced to their length)."""
+    words = [w if not w.isdigit() else f"<num{min(len(w), 8)}>" for w in TOKEN_PATTERN.findall(text.lower())]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def sigmoid(x):
+    if x < -30:
+        return 0.0
+    if x > 30:
+        return 1.0
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+class A2PPrefilter:
+    """
+    Local A2P/P2P pre-classifier that decides confident messages without calling GPT.
+
+    Combines the header/body rules with an optional TF-IDF + logistic regression model in log-odds space.
+    Messages whose probability falls between (1 - threshold) and threshold are left to the LLM.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, idf=None, weights=None, bias=0.0):
+        self.threshold = threshold
+        self.idf = idf or {}
+        self.weights = weights or {}
+        self.bias = bias
+
+    def vectorize(self, text):
+        """Returns the L2-normalised sublinear TF-IDF vector of a text as a sparse dict."""
+        counts = Counter(t for t in tokenize(text) if t in self.idf)
+        vector = {t: (1.0 + math.log(c)) * self.idf[t] for t, c in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {t: v / norm for t, v in vector.items()}
+
+    def model_log_odds(self, text):
+        """Returns the logistic regression log-odds (0 when no model is trained)."""
+        if not self.weights:
+            return 0.0
+        return self.bias + sum(self.weights.get(t, 0.0) * v for t, v in self.vectorize(text).items())
+
+    def predict_proba(self, content):
+        """
+        Args:
+            content (str): Preprocessed message text.
+
+        Returns:
+            float: Probability that the message is A2P.
+        """
+        return sigmoid(rule_log_odds(content) + self.model_log_odds(content))
+
+    def classify(self, content):
+        """
+        Decides confident cases locally.
+
+        Returns:
+            bool or None: True (A2P), False (P2P), or None when the message must go to the LLM.
+        """
+        probability = self.predict_proba(content)
+        if probability >= self.threshold:
+            return True
+        if probability <= 1.0 - self.threshold:
+            return False
+        return None
+
+    def train(self, texts, labels, epochs=15, learning_rate=0.5, l2=1e-4, min_df=2):
+        """
+        Fits the TF-IDF vocabulary and the logistic regression weights with SGD.
+
+        Args:
+            texts (list): Preprocessed message texts.
+            labels (list): True for A2P, False for P2P.
+            epochs (int): Passes over the training data.
+            learning_rate (float): SGD step size.
+            l2 (float): L2 regularisation strength.
+            min_df (int): Minimum number of documents a feature must appear in.
+        """
+        document_frequency = Counter()
+        for text in texts:
+            document_frequency.update(set(tokenize(text)))
+        n_docs = len(texts)
+        self.idf = {t: math.log((1 + n_docs) / (1 + df)) + 1.0 for t, df in document_frequency.items() if df >= min_df}
+
+        samples = [(self.vectorize(text), rule_log_odds(text), 1.0 if label else 0.0) for text, label in zip(texts, labels)]
+        positives = sum(1 for _, _, y in samples if y) or 1
+        negatives = (len(samples) - positives) or 1
+        class_weight = {1.0: len(samples) / (2.0 * positives), 0.0: len(samples) / (2.0 * negatives)}
+
+        self.weights, self.bias = {}, 0.0
+        rng = random.Random(0)
+        for epoch in range(epochs):
+            rng.shuffle(samples)
+            step = learning_rate / (1.0 + epoch)
+            for vector, rule_score, y in samples:
+                z = self.bias + rule_score + sum(self.weights.get(t, 0.0) * v for t, v in vector.items())
+                gradient = (sigmoid(z) - y) * class_weight[y]
+                self.bias -= step * gradient
+                for t, v in vector.items():
+                    w = self.weights.get(t, 0.0)
+                    self.weights[t] = w - step * (gradient * v + l2 * w)
+
+        self.weights = {t: w for t, w in self.weights.items() if abs(w) > 1e-4}
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"threshold": self.threshold, "bias": self.bias, "idf": self.idf, "weights": self.weights},
+                      f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, threshold=None):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(threshold or data.get("threshold", DEFAULT_THRESHOLD), data["idf"], data["weights"], data["bias"])
+
+
+def load_training_data(case_dirs):
+    """
+    Builds labelled examples from already processed case folders.
+
+    Cases with a corpus store contribute every classified message with its stored verdict. For
+    other cases, every file in `<case>/text/` is labelled A2P if a matching `a2p_<name>` exists in
+    `<case>/A2P-classified-text/`, and P2P otherwise.
+
+    Args:
+        case_dirs (list): Processed case folders (sample-a2p-dataset layout).
+
+    Returns:
+        tuple: (texts, labels)
+    """
+    texts, labels = [], []
+    for case_dir in case_dirs:
+        if os.path.exists(os.path.join(case_dir, CORPUS_FILE)):
+            store = CorpusStore(case_dir)
+            for text, is_a2p in store.classified_texts():
+                texts.append(text)
+                labels.append(is_a2p)
+            store.close()
+            continue
+
+        text_dir = os.path.join(case_dir, "text")
+        a2p_dir = os.path.join(case_dir, "A2P-classified-text")
+        if not os.path.isdir(text_dir) or not os.path.isdir(a2p_dir):
+            print(f"Skipping {case_dir}: not a processed case folder.")
+            continue
+        a2p_files = set(os.listdir(a2p_dir))
+        for file_name in os.listdir(text_dir):
+            if file_name.endswith(".txt"):
+                with open(os.path.join(text_dir, file_name), "r", encoding="utf-8", errors="replace") as f:
+                    texts.append(f.read())
+                labels.append(f"a2p_{file_name}" in a2p_files)
+    return texts, labels
+
+
+def load_default_prefilter():
+    """
+    Loads the pre-classifier configured by SERENA_PREFILTER.
+
+    Values: unset/"off" disables it, "rules" uses the header/body rules only,
+    anything else is the path of a trained model file.
+
+    Returns:
+        A2PPrefilter or None
+    """
+    setting = os.getenv("SERENA_PREFILTER", "off")
+    if setting.lower() in ("", "0", "off"):
+        return None
+    if setting.lower() == "rules":
+        return A2PPrefilter()
+    return A2PPrefilter.load(setting)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the local A2P pre-classifier from processed case folders.")
+    parser.add_argument("case_dirs", nargs="+", help="Processed case folders (with a corpus store or text/ and A2P-classified-text/).")
+    parser.add_argument("-o", "--output", default="a2p_prefilter.json", help="Model file to write.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Confidence threshold.")
+    args = parser.parse_args(argv)
+
+    texts, labels = load_training_data(args.case_dirs)
+    if not texts:
+        print("No training data found.")
+        return 1
+
+    prefilter = A2PPrefilter(threshold=args.threshold)
+    prefilter.train(texts, labels)
+    prefilter.save(args.output)
+
+    decided = [prefilter.classify(text) for text in texts]
+    confident = [(d, y) for d, y in zip(decided, labels) if d is not None]
+    accuracy = sum(d == y for d, y in confident) / len(confident) if confident else 0.0
+    print(f"Trained on {len(texts)} messages ({sum(labels)} A2P). "
+          f"{len(confident)} decided locally with {accuracy:.1%} training accuracy. Saved: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,411 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+from data_preprocessing import save_eml_to_txt, save_excel_rows_to_txt, split_messagingapp_files
+from A2P_classifying import CLASSIFICATION_PROMPT, classify_email, convert_text_to_html
+from named_entitiy_recognition import (extraction_request, local_extraction, parse_extraction_response,
+                                       process_text_with_gpt, load_cache, save_cache)
+from normalization import normalize_records
+from a2p_prefilter import load_default_prefilter
+from dedup import Deduplicator, DEDUP_ENABLED, dedup_records
+from llm_client import (apply_request_defaults, cache_key, get_cache, is_cacheable, is_valid, truncate_to_tokens,
+                        MODEL, TEMPERATURE)
+from structured_output import parse_json_object
+
+
+TERMINAL_FAILURES = ("failed", "expired", "cancelled")
+STATE_FILE = "batch_state.json"
+
+
+class OpenAIBatchClient:
+    """Submits, polls and fetches jobs with the OpenAI Batch API."""
+
+    def __init__(self, client=None):
+        if client is None:
+            from llm_client import client
+        self.client = client
+
+    def submit(self, input_path):
+        """Uploads a JSONL request file and starts a batch job. Returns the job ID."""
+        with open(input_path, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id, endpoint="/v1/chat/completions", completion_window="24h"
+        )
+        return batch.id
+
+    def poll(self, job_id):
+        """Returns the job status (validating, in_progress, finalizing, completed, failed, expired, ...)."""
+        return self.client.batches.retrieve(job_id).status
+
+    def fetch(self, job_id, output_path):
+        """Downloads the result JSONL of a completed job to `output_path`."""
+        batch = self.client.batches.retrieve(job_id)
+        with open(output_path, "w", encoding="utf-8") as f:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    f.write(self.client.files.content(file_id).text.rstrip("\n") + "\n")
+        return output_path
+
+
+class LocalBatchClient:
+    """
+    File-based stand-in for the Batch API.
+
+    Each job is a folder `<root_dir>/<job_id>/` holding `input.jsonl`; the job completes once
+    `output.jsonl` appears there (written by an external worker), or immediately when a
+    `responder(body) -> str` function is given.
+    """
+
+    def __init__(self, root_dir, responder=None):
+        self.root_dir = root_dir
+        self.responder = responder
+        os.makedirs(root_dir, exist_ok=True)
+
+    def submit(self, input_path):
+        job_id = f"batch_{uuid.uuid4().hex}"
+        os.makedirs(os.path.join(self.root_dir, job_id))
+        shutil.copyfile(input_path, os.path.join(self.root_dir, job_id, "input.jsonl"))
+        return job_id
+
+    def poll(self, job_id):
+        job_dir = os.path.join(self.root_dir, job_id)
+        output_path = os.path.join(job_dir, "output.jsonl")
+        if os.path.exists(output_path):
+            return "completed"
+        if self.responder is None:
+            return "in_progress"
+
+        with open(os.path.join(job_dir, "input.jsonl"), "r", encoding="utf-8") as src, \
+                open(output_path + ".tmp", "w", encoding="utf-8") as dst:
+            for line in src:
+                request = json.loads(line)
+                content = self.responder(request["body"])
+                body = {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}
+                dst.write(json.dumps({"custom_id": request["custom_id"],
+                                      "response": {"status_code": 200, "body": body}, "error": None}) + "\n")
+        os.replace(output_path + ".tmp", output_path)
+        return "completed"
+
+    def fetch(self, job_id, output_path):
+        shutil.copyfile(os.path.join(self.root_dir, job_id, "output.jsonl"), output_path)
+        return output_path
+
+
+def load_state(state_path):
+    """Loads the checkpointed batch state (empty if none)."""
+    if os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state, state_path):
+    """Writes the batch state atomically so an interrupted run can resume."""
+    with open(state_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(state_path + ".tmp", state_path)
+
+
+def read_batch_output(output_path):
+    """
+    Parses a Batch API result file.
+
+    Returns:
+        dict: custom_id -> response content (None for failed requests).
+    """
+    results = {}
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            try:
+                if response.get("status_code") != 200:
+                    raise ValueError(record.get("error") or response)
+                results[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"].strip()
+            except (KeyError, IndexError, TypeError, AttributeError, ValueError) as e:
+                print(f"Batch request {record.get('custom_id')} failed: {e}")
+                results[record["custom_id"]] = None
+    return results
+
+
+def run_batch_stage(stage_name, requests, batch_client, state, state_path, work_dir, validate=None):
+    """
+    Advances one batch stage: submit on the first call, then poll, then fetch.
+
+    Requests already answered by the response cache are not submitted (only temperature-0 requests are cached).
+
+    Args:
+        stage_name (str): Stage key in the state file ("classification" or "extraction").
+        requests (callable): Returns a list of (custom_id, source_path, body) tuples; only called on submission.
+        batch_client: Object with submit/poll/fetch methods.
+        state (dict): Checkpointed state (updated in place and saved).
+        state_path (str): Path of the state file.
+        work_dir (str): Folder for the request/result JSONL files.
+        validate (callable): Response check shared with `chat_completion`; responses it rejects are
+            neither taken from nor written to the response cache.
+
+    Returns:
+        tuple: (status, results, sources) where results maps custom_id -> content once completed.
+    """
+    stage = state.get(stage_name)
+    cache = get_cache()
+
+    if stage is None:
+        sources, keys, cached, lines = {}, {}, {}, []
+        for custom_id, source_path, body in requests():
+            sources[custom_id] = source_path
+            params = {k: v for k, v in body.items() if k not in ("model", "messages")}
+            keys[custom_id] = cache_key(body["model"], body["messages"], params) if is_cacheable(params) else None
+            response = cache.get(keys[custom_id]) if cache and keys[custom_id] else None
+            if response is not None and is_valid(response, validate):
+                cached[custom_id] = response
+            else:
+                lines.append({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body})
+
+        stage = {"status": "completed", "job_id": None, "sources": sources, "keys": keys, "cached": cached}
+        if lines:
+            input_path = os.path.join(work_dir, f"batch_{stage_name}_input.jsonl")
+            with open(input_path, "w", encoding="utf-8") as f:
+                for line in lines:
+                    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            stage["job_id"] = batch_client.submit(input_path)
+            stage["status"] = "submitted"
+            print(f"Submitted {stage_name} batch {stage['job_id']} with {len(lines)} requests "
+                  f"({len(cached)} answered from cache).")
+        state[stage_name] = stage
+        save_state(state, state_path)
+
+    if stage["status"] in ("submitted", "in_progress"):
+        status = batch_client.poll(stage["job_id"])
+        if status in TERMINAL_FAILURES:
+            print(f"{stage_name} batch {stage['job_id']} ended with status '{status}'; it will be resubmitted.")
+            del state[stage_name]
+            save_state(state, state_path)
+            return status, None, None
+        if status != "completed":
+            return status, None, None
+        stage["status"] = "completed"
+        save_state(state, state_path)
+
+    results = dict(stage["cached"])
+    if stage["job_id"]:
+        output_path = os.path.join(work_dir, f"batch_{stage_name}_output.jsonl")
+        if not os.path.exists(output_path):
+            batch_client.fetch(stage["job_id"], output_path + ".tmp")
+            os.replace(output_path + ".tmp", output_path)
+        for custom_id, content in read_batch_output(output_path).items():
+            results[custom_id] = content
+            if content is not None and cache and stage["keys"].get(custom_id) and is_valid(content, validate):
+                cache.put(stage["keys"][custom_id], MODEL, content)
+
+    return "completed", results, stage["sources"]
+
+
+def run_batch_classification(input_dirs, output_dir, batch_client, state, state_path, work_dir):
+    """
+    Batch counterpart of `process_txt_files`: classifies all .txt files with one batch job and
+    saves A2P messages to `output_dir`.
+
+    Returns:
+        str: Stage status ("completed" once the results are ingested, "incomplete" while files whose batch
+            request and single retry both failed are pending).
+    """
+    if state.get("classification", {}).get("status") == "ingested":
+        return "completed"
+    os.makedirs(output_dir, exist_ok=True)
+    prefilter = load_default_prefilter()
+    local_verdicts = {}
+    deduplicator = Deduplicator() if DEDUP_ENABLED else None
+    duplicates = {}  # File -> file with the same or a near-identical message that is sent instead
+
+    def requests():
+        file_paths = [os.path.join(input_dir, f) for input_dir in input_dirs
+                      for f in sorted(os.listdir(input_dir)) if f.endswith(".txt")]
+        for idx, file_path in enumerate(file_paths):
+            with open(file_path, "r", encoding="utf-8", errors="replace") as file:
+                content = file.read()
+            verdict = prefilter.classify(content) if prefilter is not None else None
+            if verdict is not None:
+                local_verdicts[file_path] = verdict
+                continue
+            representative = deduplicator.assign(file_path, content)[0] if deduplicator is not None else None
+            if representative is not None:
+                duplicates[file_path] = representative
+                continue
+            body = apply_request_defaults({"temperature": TEMPERATURE, "max_tokens": 50})
+            body.update({"model": MODEL, "messages": [
+                {"role": "system", "content": CLASSIFICATION_PROMPT},
+                {"role": "user", "content": truncate_to_tokens(content.strip())}]})
+            yield f"cls-{idx}", file_path, body
+
+    status, results, sources = run_batch_stage(
+        "classification", requests, batch_client, state, state_path, work_dir)
+    if local_verdicts and "classification" in state:
+        # Pre-classifier decisions are only made on submission, so keep them for the resumed run
+        state["classification"]["local"] = local_verdicts
+        save_state(state, state_path)
+    if duplicates and "classification" in state:
+        state["classification"]["duplicates"] = duplicates
+        save_state(state, state_path)
+    if status != "completed":
+        return status
+
+    verdicts = dict(state["classification"].get("local", {}))
+    fallback = state["classification"].setdefault("fallback", {})  # Verdicts of failed batch lines, sent again
+    pending = []
+    for custom_id, file_path in sources.items():
+        response = results.get(custom_id)
+        if response is not None:
+            verdicts[file_path] = bool(re.search(r"\bA2P\b", response, re.IGNORECASE))
+        elif file_path in fallback:
+            verdicts[file_path] = fallback[file_path]
+        else:
+            try:
+                with open(file_path, "r", encoding="utf-8", errors="replace") as file:
+                    fallback[file_path] = verdicts[file_path] = classify_email(file.read())
+            except Exception as e:
+                print(f"Classification of {file_path} failed again ({e}); it stays pending.")
+                pending.append(file_path)
+    if pending:
+        # The batch results are kept, so the next run only sends the pending files again
+        save_state(state, state_path)
+        print(f"Batch classification incomplete: {len(pending)} files are still pending.")
+        return "incomplete"
+    for file_path, representative in state["classification"].get("duplicates", {}).items():
+        verdicts[file_path] = verdicts[representative]
+
+    for file_path, is_a2p in verdicts.items():
+        if is_a2p:
+            output_path = os.path.join(output_dir, f"a2p_{os.path.basename(file_path)}")
+            shutil.copyfile(file_path, output_path)
+            print(f"Saved: {output_path}")
+
+    print(f"Batch classification ingested: {sum(verdicts.values())}/{len(verdicts)} files classified as A2P.")
+    state["classification"]["status"] = "ingested"
+    save_state(state, state_path)
+    return "completed"
+
+
+def run_batch_extraction(input_dirs, output_dir, batch_client, state, state_path, work_dir):
+    """
+    Batch counterpart of `extract_keywords`: extracts keywords for all A2P .txt files with one batch
+    job, saves raw JSON for highlighting and appends normalized records to the JSON cache.
+
+    Returns:
+        str: Stage status ("completed" once the results are ingested).
+    """
+    if state.get("extraction", {}).get("status") == "ingested":
+        return "completed"
+    os.makedirs(output_dir, exist_ok=True)
+
+    def requests():
+        file_paths = [os.path.join(input_dir, f) for input_dir in input_dirs
+                      for f in sorted(os.listdir(input_dir)) if f.lower().endswith(".txt")]
+        for idx, file_path in enumerate(file_paths):
+            with open(file_path, "r", encoding="utf-8") as file:
+                content = file.read()
+            messages, params, _ = extraction_request(content)
+            body = apply_request_defaults({"temperature": TEMPERATURE, **params})
+            body.update({"model": MODEL, "messages": messages})
+            yield f"ner-{idx}", file_path, body
+
+    status, results, sources = run_batch_stage(
+        "extraction", requests, batch_client, state, state_path, work_dir, validate=parse_json_object)
+    if status != "completed":
+        return status
+
+    extracted_json_list = []
+    for custom_id, file_path in sources.items():
+        response = results.get(custom_id)
+        try:
+            if response is None:
+                raise ValueError("batch request failed")
+            # Locally extracted fields are recomputed from the text rather than stored with the job
+            with open(file_path, "r", encoding="utf-8") as file:
+                local_fields = local_extraction(file.read())
+            extracted_json = parse_extraction_response(response, file_path, local_fields)
+        except Exception as e:
+            print(f"Re-running extraction for {file_path} ({e})")
+            extracted_json = process_text_with_gpt(file_path)
+
+        raw_output_path = os.path.join(output_dir, f"raw_{os.path.basename(file_path)}.json")
+        with open(raw_output_path, "w", encoding="utf-8") as raw_file:
+            json.dump(extracted_json, raw_file, ensure_ascii=False, indent=4)
+        extracted_json_list.append(extracted_json)
+
+    save_cache(dedup_records(normalize_records(extracted_json_list), load_cache()))
+
+    print(f"Batch extraction ingested: {len(sources)} records saved in {output_dir}.")
+    state["extraction"]["status"] = "ingested"
+    save_state(state, state_path)
+    return "completed"
+
+
+def run_bulk_case(dir_name, batch_client, wait=False, poll_interval=60):
+    """
+    Processes a case folder with batch jobs. Each call advances the checkpointed state
+    (preprocess -> classification batch -> HTML -> extraction batch), so the process may exit
+    while a job is pending and be re-run later to resume.
+
+    Args:
+        dir_name (str): Case folder with emls/, textmessage/ and messagingapp/.
+        batch_client: OpenAIBatchClient, LocalBatchClient or any object with submit/poll/fetch.
+        wait (bool): Keep polling until all stages are complete.
+        poll_interval (float): Seconds between polls when waiting.
+
+    Returns:
+        str: "completed" or the status of the pending stage.
+    """
+    state_path = os.path.join(dir_name, STATE_FILE)
+    state = load_state(state_path)
+    text_output_dir = os.path.join(dir_name, "text")
+    a2p_classified_dir = os.path.join(dir_name, "A2P-classified-text")
+    html_output_dir = os.path.join(dir_name, "A2P-classified-html")
+    keyword_output_dir = os.path.join(dir_name, "A2P-classified-json")
+
+    if not state.get("preprocessed"):
+        print("Step 1: Data Preprocessing...")
+        for folder in ["emls", "textmessage", "messagingapp"]:
+            os.makedirs(os.path.join(dir_name, folder), exist_ok=True)
+        save_eml_to_txt(os.path.join(dir_name, "emls"), text_output_dir)
+        save_excel_rows_to_txt(os.path.join(dir_name, "textmessage"), text_output_dir)
+        split_messagingapp_files(os.path.join(dir_name, "messagingapp"), text_output_dir)
+        state["preprocessed"] = True
+        save_state(state, state_path)
+
+    while True:
+        status = run_batch_classification([text_output_dir], a2p_classified_dir, batch_client,
+                                          state, state_path, dir_name)
+        if status == "completed":
+            convert_text_to_html(a2p_classified_dir, html_output_dir)
+            status = run_batch_extraction([a2p_classified_dir], keyword_output_dir, batch_client,
+                                          state, state_path, dir_name)
+        if status == "completed" or not wait:
+            print(f"Bulk processing status: {status}")
+            return status
+        time.sleep(poll_interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process a case folder with OpenAI Batch API jobs (resumable).")
+    parser.add_argument("case_dir", help="Case folder with emls/, textmessage/ and messagingapp/.")
+    parser.add_argument("--local", metavar="DIR", help="Use the file-based batch stand-in rooted at DIR.")
+    parser.add_argument("--wait", action="store_true", help="Poll until the case is complete.")
+    parser.add_argument("--poll-interval", type=float, default=60, help="Seconds between polls.")
+    args = parser.parse_args(argv)
+
+    batch_client = LocalBatchClient(args.local) if args.local else OpenAIBatchClient()
+    status = run_bulk_case(args.case_dir, batch_client, wait=args.wait, poll_interval=args.poll_interval)
+    return 0 if status == "completed" else 3
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import subprocess
+import tempfile
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+
+BASELINE_FILE = "benchmark_baseline.json"
+TOLERANCE = 0.2  # Allowed throughput drop / peak memory growth against the baseline
+STAGES = ["preprocessing", "classification", "html", "ner", "highlight", "pipeline"]
+WORK_DIR = "work"  # Store shared by the per-stage runs (each stage reads the output of the previous one)
+
+# Same colors as the GUI legend (KEY_COLORS in SERENA-GUI.py)
+HIGHLIGHT_COLORS = {"service_name": "yellow", "action_datetime": "lightgreen", "message_datetime": "lightblue",
+                    "action_keyword": "pink", "address1": "silver", "address2": "plum", "amount": "peachpuff",
+                    "item": "lavender", "mobile_number": "magenta"}
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (None where it cannot be measured)."""
+    try:
+        import resource
+    except ImportError:
+        return windows_peak_rss_mb()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def windows_peak_rss_mb():
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return round(counters.PeakWorkingSetSize / (1024 * 1024), 1)
+    except (ImportError, AttributeError, OSError):
+        return None
+
+
+def in_chunks(items, size):
+    return [items[start:start + size] for start in range(0, len(items), max(size, 1))]
+
+
+def bench_preprocessing(case_dir, store):
+    """Converts every input of the case and stores the extracted messages."""
+    from pipeline import discover_inputs, extraction_task
+    from data_preprocessing import convert_input_files
+
+    inputs = discover_inputs(case_dir)
+    tasks = [extraction_task(case_dir, rel_path, converter, store.dir_name) for rel_path, converter in inputs]
+    count = 0
+    for (rel_path, _), (stored, error) in zip(inputs, convert_input_files(tasks)):
+        if error:
+            raise RuntimeError(f"{rel_path}: {error}")
+        count += len(stored)
+    return count
+
+
+def bench_classification(case_dir, store):
+    """Classifies every stored text with the pipeline's batch size and worker count (no duplicate skipping)."""
+    from A2P_classifying import classify_texts, BATCH_SIZE
+    from a2p_prefilter import load_default_prefilter
+    from llm_client import MAX_CONCURRENCY
+
+    prefilter = load_default_prefilter()
+
+    def classify(names):
+        texts = store.get_texts(names)
+        for name, (is_a2p, _) in classify_texts(list(texts.items()), prefilter).items():
+            if is_a2p is None:
+                raise RuntimeError(f"{name}: GPT classification failed")
+            store.set_classification(name, is_a2p)
+        return len(texts)
+
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+        return sum(executor.map(classify, in_chunks(store.text_names(), BATCH_SIZE)))
+
+
+def bench_html(case_dir, store):
+    from A2P_classifying import text_to_html
+    from corpus_store import html_name
+
+    names = store.text_names(a2p=True)
+    for name in names:
+        store.set_html(name, text_to_html(os.path.splitext(html_name(name))[0], store.get_text(name)))
+    return len(names)
+
+
+def bench_ner(case_dir, store):
+    """Extracts and normalizes the entities of every A2P text in batches of the pipeline's NER batch size."""
+    from named_entitiy_recognition import extract_keywords_from_texts
+    from pipeline import NER_BATCH_SIZE
+    from llm_client import MAX_CONCURRENCY
+
+    def extract(names):
+        texts = store.get_texts(names)
+        results = extract_keywords_from_texts(list(texts.items()))
+        for name, (extracted_json, normalized_json) in results.items():
+            store.set_entities(name, extracted_json, normalized_json)
+        return len(texts)
+
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+        return sum(executor.map(extract, in_chunks(store.text_names(a2p=True), NER_BATCH_SIZE)))
+
+
+def bench_highlight(case_dir, store):
+    from highlighter import highlight_html
+
+    documents = store.document_index()
+    for document_name in documents:
+        _, html, entities = store.get_document(document_name)
+        highlight_html(html, entities or {}, HIGHLIGHT_COLORS)
+    return len(documents)
+
+
+def bench_pipeline(case_dir, store):
+    """Streams a fresh copy of the case through the whole pipeline."""
+    from pipeline import Pipeline
+
+    run_dir = os.path.join(os.path.dirname(store.dir_name), "pipeline_run")
+    shutil.rmtree(run_dir, ignore_errors=True)
+    for folder in ["emls", "textmessage", "messagingapp"]:
+        shutil.copytree(os.path.join(case_dir, folder), os.path.join(run_dir, folder))
+    pipeline = Pipeline(run_dir)
+    pipeline.run()
+    return pipeline.counts["texts"]
+
+
+def run_stage(stage, case_dir, work_dir):
+    """
+    Runs one stage in this process (see `--run-stage`).
+
+    Returns:
+        dict: items, seconds, items_per_second and peak_rss_mb (the process's peak, including imports).
+    """
+    from corpus_store import CorpusStore
+
+    if stage == "preprocessing":
+        shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir, exist_ok=True)
+    store = CorpusStore(work_dir)
+    function = globals()[f"bench_{stage}"]
+    try:
+        started = time.perf_counter()
+        items = function(case_dir, store)
+        seconds = time.perf_counter() - started
+    finally:
+        store.close()
+    return {"items": items, "seconds": round(seconds, 3),
+            "items_per_second": round(items / seconds, 1) if seconds > 0 else 0.0,
+            "peak_rss_mb": peak_rss_mb()}
+
+
+def measure_stage(stage, case_dir, work_dir, verbose=False):
+    """Runs a stage in a child process so its peak memory is not inflated by earlier stages."""
+    command = [sys.executable, os.path.abspath(__file__), "--run-stage", stage, "--case", case_dir,
+               "--work", work_dir]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=None if verbose else subprocess.DEVNULL,
+                            text=True)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(f"Stage {stage} failed (exit code {result.returncode}).")
+    if verbose:
+        print("\n".join(lines[:-1]))
+    return json.loads(lines[-1])
+
+
+def same_settings(report, baseline):
+    """True when both reports used the same corpus and mock server settings."""
+    def settings(result):
+        corpus, mock = result.get("corpus", {}), result.get("mock", {})
+        return ([corpus.get(key) for key in ("messages", "seed")] +
+                [mock.get(key) for key in ("latency", "jitter", "error_rate", "requests_per_minute")])
+    return settings(report) == settings(baseline)
+
+
+def compare(report, baseline, tolerance=TOLERANCE):
+    """
+    Compares per-stage throughput and peak memory with a baseline report.
+
+    Returns:
+        list: Regression messages (empty when every stage is within the tolerance).
+    """
+    regressions = []
+    for stage, result in report["stages"].items():
+        expected = baseline.get("stages", {}).get(stage)
+        if not expected:
+            continue
+        if expected["items_per_second"] and result["items_per_second"] < expected["items_per_second"] * (1 - tolerance):
+            regressions.append(f"{stage}: {result['items_per_second']} items/s "
+                               f"(baseline {expected['items_per_second']})")
+        if expected.get("peak_rss_mb") and result.get("peak_rss_mb") and \
+                result["peak_rss_mb"] > expected["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{stage}: {result['peak_rss_mb']} MB peak memory "
+                               f"(baseline {expected['peak_rss_mb']})")
+    return regressions
+
+
+def run_benchmark(messages=1000, seed=0, stages=STAGES, latency=0.02, jitter=0.0, error_rate=0.0, requests_per_minute=0,
+                  output_dir=None, verbose=False):
+    """
+    Generates a synthetic case, serves GPT requests from the mock server and measures every stage.
+
+    Args:
+        messages (int): Size of the synthetic corpus.
+        seed (int): Corpus seed (the same seed gives the same corpus).
+        stages (list): Stages to measure, in pipeline order; classification and NER need the earlier stages.
+        latency (float): Seconds the mock server waits per request.
+        jitter (float): Extra random latency per request.
+        error_rate (float): Share of requests answered with HTTP 500 (retried by `llm_client`).
+        requests_per_minute (int): Mock rate limit (0 = none).
+        output_dir (str): Folder for the corpus and stores (a temporary folder, removed afterwards, by default).
+        verbose (bool): Show the output of the stages.
+
+    Returns:
+        dict: Benchmark report with the settings and per-stage results.
+    """
+    from synthetic_corpus import generate_case
+    from mock_openai_server import MockOpenAIServer
+
+    temporary = output_dir is None
+    output_dir = output_dir or tempfile.mkdtemp(prefix="serena_benchmark_")
+    case_dir = os.path.join(output_dir, "case")
+    shutil.rmtree(case_dir, ignore_errors=True)
+    generated = generate_case(case_dir, messages=messages, seed=seed)
+
+    server = MockOpenAIServer(latency=latency, jitter=jitter, error_rate=error_rate,
+                              requests_per_minute=requests_per_minute, seed=seed).start()
+    # Child processes reach the mock server and never reuse cached responses
+    environment = dict(os.environ)
+    os.environ.update(OPENAI_API_KEY=os.getenv("OPENAI_API_KEY") or "benchmark", OPENAI_BASE_URL=server.url,
+                      SERENA_LLM_CACHE="off")
+    results = {}
+    try:
+        for stage in stages:
+            print(f"Measuring {stage}...")
+            results[stage] = measure_stage(stage, case_dir, os.path.join(output_dir, WORK_DIR), verbose)
+    finally:
+        os.environ.clear()
+        os.environ.update(environment)
+        server.stop()
+        if temporary:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    return {
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {"messages": messages, "seed": seed, **generated},
+        "mock": {"latency": latency, "jitter": jitter, "error_rate": error_rate,
+                 "requests_per_minute": requests_per_minute, **server.stats},
+        "stages": results,
+    }
+
+
+def print_report(report, baseline=None):
+    print(f"{'stage':<16}{'items':>9}{'seconds':>10}{'items/s':>11}{'peak MB':>10}{'baseline items/s':>18}")
+    for stage, result in report["stages"].items():
+        expected = (baseline or {}).get("stages", {}).get(stage, {}).get("items_per_second", "")
+        print(f"{stage:<16}{result['items']:>9}{result['seconds']:>10}{result['items_per_second']:>11}"
+              f"{str(result['peak_rss_mb']):>10}{expected:>18}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure per-stage throughput and memory on a synthetic corpus with a mock GPT server. "
+                    "Exit code 1 when a stage regressed against the baseline.")
+    parser.add_argument("-n", "--messages", type=int, default=1000, help="Messages in the synthetic corpus.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--latency", type=float, default=0.02, help="Mock GPT latency per request in seconds.")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=0, help="Mock rate limit in requests per minute.")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help=f"Baseline report (default {BASELINE_FILE}).")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline.")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="Allowed relative throughput drop / memory growth (default 0.2).")
+    parser.add_argument("-o", "--output", help="Write the JSON report to this file.")
+    parser.add_argument("--keep", metavar="DIR", help="Generate the corpus in DIR and keep it.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the output of the stages.")
+    parser.add_argument("--run-stage", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--work", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_stage:
+        # Child process: the stage's own output goes to stderr, the result is the last stdout line
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        result = run_stage(args.run_stage, args.case, args.work)
+        print(json.dumps(result), file=stdout)
+        return 0
+
+    report = run_benchmark(args.messages, args.seed, args.stages, args.latency, args.jitter, args.error_rate,
+                           args.rpm, args.keep, args.verbose)
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not same_settings(report, baseline):
+            print(f"{args.baseline} was measured with a different corpus or mock server settings; not comparing.")
+            baseline = None
+
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Baseline saved to {args.baseline}.")
+        return 0
+
+    regressions = compare(report, baseline, args.tolerance) if baseline else []
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
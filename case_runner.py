@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+import contextlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from manifest import MANIFEST_FILE
+from preprocess import run_case
+from llm_client import MAX_CONCURRENCY, configure_concurrency
+import metrics
+
+
+INPUT_FOLDERS = ["emls", "textmessage", "messagingapp"]
+RUN_SUMMARY_FILE = "serena_run.json"  # Written to every case folder after its run
+MAX_FAILURES_LISTED = 100  # Per case; the error count covers all of them
+
+# Exit codes (3 matches batch_processing: the case still has unfinished work)
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_INCOMPLETE = 3
+EXIT_INTERRUPTED = 130
+
+
+def is_case_folder(path):
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE)) or any(
+        os.path.isdir(os.path.join(path, folder)) for folder in INPUT_FOLDERS)
+
+
+def discover_cases(paths):
+    """
+    Expands the command-line paths into case folders.
+
+    A path is a case when it has a manifest or one of emls/, textmessage/ and messagingapp/;
+    otherwise each of its subfolders that is a case is used (a directory of cases).
+
+    Returns:
+        tuple: (case folders, paths that are neither a case nor contain one)
+    """
+    cases, invalid = [], []
+    for path in paths:
+        if os.path.isdir(path) and is_case_folder(path):
+            cases.append(path)
+            continue
+        children = [os.path.join(path, name) for name in sorted(os.listdir(path))] if os.path.isdir(path) else []
+        children = [child for child in children if os.path.isdir(child) and is_case_folder(child)]
+        if children:
+            cases.extend(children)
+        else:
+            invalid.append(path)
+    return list(dict.fromkeys(os.path.normpath(case) for case in cases)), invalid
+
+
+def process_case(dir_name, cancel_event):
+    """
+    Runs one case and summarizes it.
+
+    Returns:
+        dict: case, status ("completed", "partial", "cancelled", "skipped" or "failed"), started, elapsed,
+        errors and the first failures, plus the pipeline summary (see `Pipeline.summary`) when it ran.
+    """
+    failures, errors = [], [0]
+    lock = threading.Lock()
+
+    def on_event(event):
+        if event["event"] != "error":
+            return
+        with lock:
+            errors[0] += 1
+            if len(failures) < MAX_FAILURES_LISTED:
+                failures.append({key: event[key] for key in ("stage", "text", "error")})
+
+    summary = {"case": dir_name, "started": datetime.now().isoformat(timespec="seconds")}
+    started = time.monotonic()
+    try:
+        pipeline, _ = run_case(dir_name, on_event=on_event, cancel_event=cancel_event)
+    except Exception as e:
+        summary.update(status="failed", error=str(e))
+        pipeline = None
+    else:
+        if pipeline is None:
+            summary["status"] = "skipped"
+        else:
+            summary["status"] = "cancelled" if pipeline.cancelled else "partial" if errors[0] else "completed"
+            summary.update(pipeline.summary())
+    summary.update(elapsed=round(time.monotonic() - started, 1), errors=errors[0], failures=failures)
+
+    if pipeline is not None:
+        try:
+            with open(os.path.join(dir_name, RUN_SUMMARY_FILE), "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"Could not write {RUN_SUMMARY_FILE} for {dir_name}: {e}")
+    return summary
+
+
+def exit_code(summaries, interrupted=False):
+    """0 when every case completed, 1 if a case failed, 3 if a case has messages left to retry, 130 if interrupted."""
+    if interrupted:
+        return EXIT_INTERRUPTED
+    statuses = {summary["status"] for summary in summaries}
+    if "failed" in statuses:
+        return EXIT_FAILED
+    if statuses & {"partial", "cancelled"}:
+        return EXIT_INCOMPLETE
+    return EXIT_OK
+
+
+def run_cases(cases, jobs=2, cancel_event=None, on_case_done=None):
+    """
+    Processes case folders concurrently; GPT requests of all cases share the limits of `llm_client`.
+
+    Args:
+        cases (list): Case folders.
+        jobs (int): Cases processed at the same time.
+        cancel_event (threading.Event): Set to stop every case at message boundaries (they resume on the next run).
+        on_case_done (callable): Receives each case summary as it finishes.
+
+    Returns:
+        list: Case summaries in the order of `cases`.
+    """
+    cancel_event = cancel_event or threading.Event()
+    summaries = {}
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = {executor.submit(process_case, case, cancel_event): case for case in cases}
+        for future in as_completed(futures):
+            summaries[futures[future]] = future.result()
+            if on_case_done is not None:
+                on_case_done(summaries[futures[future]])
+    return [summaries[case] for case in cases]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Process case folders without the GUI. Exit codes: 0 all cases completed, 1 a case failed, "
+                    "3 messages are left to retry (run again to resume), 130 interrupted.")
+    parser.add_argument("paths", nargs="+", help="Case folders, or folders containing case folders.")
+    parser.add_argument("-j", "--jobs", type=int, default=2, help="Cases processed at the same time (default 2).")
+    parser.add_argument("--llm-concurrency", type=int, default=MAX_CONCURRENCY,
+                        help="GPT requests in flight across all cases (default SERENA_MAX_CONCURRENCY).")
+    parser.add_argument("-o", "--summary", help="Write the JSON summary to this file instead of stdout.")
+    parser.add_argument("--metrics", metavar="PREFIX",
+                        help="Write run metrics to PREFIX.json and PREFIX.prom (Prometheus text format).")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Hide per-message output of the pipeline.")
+    args = parser.parse_args(argv)
+
+    cases, invalid = discover_cases(args.paths)
+    for path in invalid:
+        print(f"Not a case folder: {path}", file=sys.stderr)
+    configure_concurrency(args.llm_concurrency)
+    if args.metrics:
+        metrics.enable()
+
+    def on_case_done(summary):
+        print(f"{summary['case']}: {summary['status']} in {summary['elapsed']}s "
+              f"({summary['errors']} errors)", file=sys.stderr)
+
+    started = time.monotonic()
+    cancel_event, done = threading.Event(), threading.Event()
+    summaries, interrupted = [], []
+
+    def interrupt(signum, frame):
+        # A second Ctrl+C stops immediately
+        print("Interrupted; finishing the messages in progress (Ctrl+C again to quit)...", file=sys.stderr)
+        interrupted.append(signum)
+        cancel_event.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    def run():
+        try:
+            summaries.extend(run_cases(cases, args.jobs, cancel_event, on_case_done))
+        finally:
+            done.set()
+
+    # Cases run on a worker thread so the main thread stays free to handle Ctrl+C
+    previous_handler = signal.signal(signal.SIGINT, interrupt)
+    try:
+        with open(os.devnull, "w") if args.quiet else contextlib.nullcontext(sys.stdout) as output:
+            with contextlib.redirect_stdout(output):
+                threading.Thread(target=run, daemon=True).start()
+                while not done.wait(0.5):
+                    pass
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+
+    summaries += [{"case": path, "status": "failed", "error": "not a case folder"} for path in invalid]
+    code = exit_code(summaries, bool(interrupted))
+    totals = {key: sum(summary.get("llm", {}).get(key, 0) for summary in summaries)
+              for key in ("requests", "cache_hits", "prompt_tokens", "completion_tokens")}
+    result = {"exit_code": code, "elapsed": round(time.monotonic() - started, 1), "llm": totals, "cases": summaries}
+
+    if metrics.ENABLED:
+        metrics.write_reports(args.metrics or metrics.REPORT_NAME)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import os
+import re
+from a2p_prefilter import BODY_RULE, WEB_MESSAGE_RULE
+
+
+CHAT_WINDOW_MINUTES = int(os.getenv("SERENA_CHAT_WINDOW_MINUTES", "10"))  # Max gap inside one sender window
+CHAT_SENDER_FILTER = os.getenv("SERENA_CHAT_SENDER_FILTER", "on").lower() != "off"
+
+TIME = r"(?:오전|오후)? ?\d{1,2}:\d{2}(?::\d{2})?(?: ?[AP]M)?"
+DATE = r"[A-Z][a-z]+ \d{1,2}, \d{4}|\d{4}\. ?\d{1,2}\. ?\d{1,2}\.|\d{4}년 \d{1,2}월 \d{1,2}일"
+
+# First line of a chat message; following lines up to the next match belong to the same message
+CHAT_MESSAGE_PATTERNS = [
+    # [FunFun Cinema] [4:40 PM] Your order has been received!
+    re.compile(rf"\[(?P<sender>[^\]]{{1,80}})\] \[(?P<time>{TIME})\] ?(?P<text>.*)"),
+    # October 9, 2024, 03:33, cheetahDelivery: Your driver is coming!  /  2024. 12. 14. 12:37, NowWaiting: ...
+    re.compile(rf"(?P<date>{DATE}),? (?P<time>{TIME}), (?P<sender>[^:\n]{{1,80}}?) ?: (?P<text>.*)"),
+    # 1/2/25, 8:38 PM - Sender: text  /  [1/2/25, 8:38:01 PM] Sender: text
+    re.compile(rf"\[?(?P<date>\d{{1,2}}[./]\d{{1,2}}[./]\d{{2,4}}),? (?P<time>{TIME})\]?(?: -)? "
+               rf"(?P<sender>[^:\n]{{1,80}}?): (?P<text>.*)"),
+    # 20:38<TAB>Sender<TAB>text
+    re.compile(rf"(?P<time>{TIME})\t(?P<sender>[^\t\n]{{1,80}})\t(?P<text>.*)"),
+]
+
+# Sender name words of businesses, channels and bots
+SERVICE_WORDS = {
+    "notification", "notifications", "notice", "alert", "alerts", "official", "service", "services", "support",
+    "info", "bot", "channel", "team", "bank", "card", "pay", "payment", "delivery", "express", "shipping",
+    "courier", "logistics", "airline", "airlines", "air", "hotel", "booking", "reservation", "store", "shop",
+    "shopping", "mall", "market", "clinic", "hospital", "pharmacy", "cinema", "center", "centre", "restaurant",
+    "taxi", "mobile", "telecom", "insurance", "verification", "verify", "auth", "coupon", "noreply",
+}
+SERVICE_WORDS_KO = ["알림", "공식", "고객센터", "은행", "카드", "페이", "배송", "택배", "쇼핑", "예약", "인증"]
+SHORT_CODE = re.compile(r"[#*+]?\d{3,6}")
+AUTOMATED_TEXT = re.compile(r"https?://|www\.|[■※▶☞①]")
+
+
+def sender_words(sender):
+    """Splits a sender name into lower-case words, including camelCase parts ("cheetahDelivery")."""
+    return {word.lower() for word in re.findall(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+", sender)}
+
+
+def looks_automated(line):
+    """Checks a message line for typical notification content (links, order/receipt fields, bullet symbols)."""
+    return bool(AUTOMATED_TEXT.search(line) or BODY_RULE[0].search(line) or WEB_MESSAGE_RULE[0].search(line))
+
+
+def match_message(line, patterns=CHAT_MESSAGE_PATTERNS):
+    """
+    Checks whether a line starts a chat message.
+
+    Returns:
+        tuple or None: (pattern, match) for the first matching pattern.
+    """
+    for pattern in patterns:
+        match = pattern.match(line)
+        if match:
+            return pattern, match
+    return None
+
+
+def scan_chat_senders(lines):
+    """
+    Streams over a chat log once to find its message format and per-sender statistics.
+
+    The first message format found is used for the rest of the log.
+
+    Args:
+        lines (iterable): Lines of the chat log.
+
+    Returns:
+        tuple: (message pattern or None, {sender: {"messages": int, "automated": int}})
+    """
+    patterns, senders = CHAT_MESSAGE_PATTERNS, {}
+    current, flagged = None, False
+    for line in lines:
+        found = match_message(line, patterns)
+        if found:
+            patterns = (found[0],)
+            current = senders.setdefault(found[1].group("sender").strip(), {"messages": 0, "automated": 0})
+            current["messages"] += 1
+            flagged = False
+        if current is not None and not flagged and looks_automated(line):
+            current["automated"] += 1
+            flagged = True
+    return (patterns[0] if len(patterns) == 1 else None), senders
+
+
+def is_a2p_sender(sender, stats, sender_count):
+    """
+    Decides whether a chat participant looks like a business, service account or bot.
+
+    A sender qualifies through a short-code name, a service word in its name, being the only
+    participant of the chat (one-way channels), or when most of its messages look automated.
+
+    Args:
+        sender (str): Sender name.
+        stats (dict): {"messages", "automated"} counts from `scan_chat_senders`.
+        sender_count (int): Number of participants in the chat.
+    """
+    if SHORT_CODE.fullmatch(sender) or sender_words(sender) & SERVICE_WORDS:
+        return True
+    if any(word in sender for word in SERVICE_WORDS_KO):
+        return True
+    return sender_count == 1 or stats["automated"] * 2 >= stats["messages"] > 0
+
+
+def parse_minutes(time_text):
+    """Converts "4:40 PM", "오후 8:38" or "03:33" to minutes after midnight."""
+    match = re.search(r"(\d{1,2}):(\d{2})", time_text)
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2))
+    if ("PM" in time_text or "오후" in time_text) and hour < 12:
+        hour += 12
+    elif ("AM" in time_text or "오전" in time_text) and hour == 12:
+        hour = 0
+    return hour * 60 + minute
+
+
+def parse_chat_messages(lines, pattern):
+    """
+    Breaks the lines of one day section into messages.
+
+    Args:
+        lines (list): Lines of the section.
+        pattern (re.Pattern): Message format of the chat (from `scan_chat_senders`).
+
+    Returns:
+        list: (sender, minutes or None, lines) per message; text before the first message has sender None.
+    """
+    messages = []
+    for line in lines:
+        match = pattern.match(line)
+        if match:
+            messages.append((match.group("sender").strip(), parse_minutes(match.group("time")), [line]))
+        elif messages:
+            messages[-1][2].append(line)
+        elif line.strip():
+            messages.append((None, None, [line]))
+    return messages
+
+
+def group_chat_windows(messages, gap_minutes=CHAT_WINDOW_MINUTES):
+    """
+    Groups consecutive messages of the same sender that are at most `gap_minutes` apart.
+
+    Returns:
+        list: (sender, lines) per window.
+    """
+    windows = []
+    previous_sender, previous_minutes = object(), None
+    for sender, minutes, lines in messages:
+        same_window = (sender == previous_sender and minutes is not None and previous_minutes is not None
+                       and 0 <= minutes - previous_minutes <= gap_minutes)
+        if same_window:
+            windows[-1][1].extend(lines)
+        else:
+            windows.append((sender, list(lines)))
+        previous_sender, previous_minutes = sender, minutes
+    return windows
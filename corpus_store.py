@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+from manifest import TEXT_DIR, A2P_TEXT_DIR, HTML_DIR, JSON_DIR
+from search_index import SearchIndex
+
+
+CORPUS_FILE = "serena_corpus.sqlite3"
+MMAP_SIZE = int(os.getenv("SERENA_CORPUS_MMAP_MB", "256")) * 1024 * 1024  # Memory-mapped read window
+
+
+def html_name(text_name):
+    """Name of the HTML document of a text (as in A2P-classified-html/)."""
+    return f"a2p_{os.path.splitext(text_name)[0]}.html"
+
+
+def raw_json_name(text_name):
+    """Name of the raw entity file of a text (as in A2P-classified-json/)."""
+    return f"raw_a2p_{text_name}.json"
+
+
+class CorpusStore:
+    """
+    Single-file store of every message of a case and the output of each stage.
+
+    One SQLite row per text holds the extracted message, the A2P verdict, the rendered HTML,
+    the raw GPT entities and the normalized record, replacing the four per-message files of
+    text/, A2P-classified-text/, A2P-classified-html/ and A2P-classified-json/. Reads go through
+    SQLite's memory-mapped I/O, and `export` recreates the directory layout when files are needed.
+    The same file holds the case's search index (see `search_index.SearchIndex`), which is updated
+    whenever a record is stored, replaced or deleted.
+    """
+
+    def __init__(self, dir_name):
+        """
+        Args:
+            dir_name (str): Case folder; the store is `<dir_name>/serena_corpus.sqlite3`.
+        """
+        self.dir_name = dir_name
+        self.path = os.path.join(dir_name, CORPUS_FILE)
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "name TEXT PRIMARY KEY, source TEXT, text TEXT NOT NULL, a2p INTEGER, "
+            "html_name TEXT, html TEXT, entities TEXT, record TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_html_name ON messages(html_name)")
+        self.search_index = SearchIndex(self.conn)
+        self.conn.commit()
+        if self.search_index.is_stale():
+            print(f"Indexed {self.rebuild_search_index()} records for search.")
+
+    def put_texts(self, source, messages):
+        """
+        Stores the messages extracted from one input, replacing earlier versions and their stage outputs.
+
+        Args:
+            source (str): Input path relative to the case folder.
+            messages (list): (text name, text) tuples.
+        """
+        with self.lock, self.conn:
+            self.search_index.remove([name for name, _ in messages])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO messages (name, source, text) VALUES (?, ?, ?)",
+                [(name, source, text) for name, text in messages],
+            )
+
+    def _update(self, name, **fields):
+        columns = ", ".join(f"{column} = ?" for column in fields)
+        with self.lock, self.conn:
+            self.conn.execute(f"UPDATE messages SET {columns} WHERE name = ?", (*fields.values(), name))
+
+    def set_classification(self, name, is_a2p):
+        self._update(name, a2p=int(is_a2p))
+
+    def set_html(self, name, html):
+        self._update(name, html_name=html_name(name), html=html)
+
+    def set_entities(self, name, entities, record):
+        """Stores the raw GPT entities (used for highlighting) and the normalized record of a text, and indexes it for search."""
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE messages SET entities = ?, record = ? WHERE name = ?",
+                              (json.dumps(entities, ensure_ascii=False), json.dumps(record, ensure_ascii=False), name))
+            row = self.conn.execute("SELECT text FROM messages WHERE name = ?", (name,)).fetchone()
+            if row:
+                self.search_index.add(name, row[0], record)
+
+    def _fetch(self, query, params=()):
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def get_text(self, name):
+        rows = self._fetch("SELECT text FROM messages WHERE name = ?", (name,))
+        return rows[0][0] if rows else None
+
+    def get_texts(self, names):
+        """Returns {name: text} for the given text names (missing names are left out)."""
+        found = {}
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            rows = self._fetch(f"SELECT name, text FROM messages WHERE name IN ({','.join('?' * len(chunk))})", chunk)
+            found.update(rows)
+        return found
+
+    def get_document(self, document_name):
+        """
+        Looks up a message by its HTML document name (as listed in the GUI).
+
+        Returns:
+            tuple: (text name, HTML, raw entities dict or None), or None if there is no such document.
+        """
+        rows = self._fetch("SELECT name, html, entities FROM messages WHERE html_name = ?", (document_name,))
+        if not rows:
+            return None
+        name, html, entities = rows[0]
+        return name, html, json.loads(entities) if entities else None
+
+    def get_html(self, name):
+        rows = self._fetch("SELECT html FROM messages WHERE name = ?", (name,))
+        return rows[0][0] if rows else None
+
+    def document_index(self):
+        """
+        Reads the HTML document name, text name and raw entities of every rendered message in one query.
+
+        Returns:
+            dict: {document name: (text name, raw entities JSON string or None)}
+        """
+        return {document_name: (name, entities) for document_name, name, entities in self._fetch(
+            "SELECT html_name, name, entities FROM messages WHERE html IS NOT NULL")}
+
+    def classified_texts(self):
+        """Returns (text, is_a2p) for every classified text."""
+        return [(text, bool(a2p)) for text, a2p in self._fetch(
+            "SELECT text, a2p FROM messages WHERE a2p IS NOT NULL ORDER BY name")]
+
+    def records(self):
+        """Returns the normalized records of every extracted text, ordered by text name."""
+        return [json.loads(row[0]) for row in self._fetch(
+            "SELECT record FROM messages WHERE record IS NOT NULL ORDER BY name")]
+
+    def text_names(self, a2p=None):
+        """Returns the names of all texts, or only the A2P (True) or P2P (False) ones, sorted."""
+        if a2p is None:
+            return [row[0] for row in self._fetch("SELECT name FROM messages ORDER BY name")]
+        return [row[0] for row in self._fetch("SELECT name FROM messages WHERE a2p = ? ORDER BY name", (int(a2p),))]
+
+    def html_names(self):
+        """Returns the names of all rendered HTML documents, sorted."""
+        return [row[0] for row in self._fetch(
+            "SELECT html_name FROM messages WHERE html IS NOT NULL ORDER BY html_name")]
+
+    def delete(self, names):
+        with self.lock, self.conn:
+            self.search_index.remove(names)
+            self.conn.executemany("DELETE FROM messages WHERE name = ?", [(name,) for name in names])
+
+    def clear(self):
+        """Deletes every message (used when the case is processed again from scratch)."""
+        with self.lock, self.conn:
+            self.search_index.clear()
+            self.conn.execute("DELETE FROM messages")
+
+    def search(self, **conditions):
+        """Searches the extracted records (see `SearchIndex.search` for the conditions)."""
+        with self.lock:
+            return self.search_index.search(**conditions)
+
+    def rebuild_search_index(self):
+        """Re-indexes every stored record; returns the number of records."""
+        with self.lock, self.conn:
+            return self.search_index.rebuild()
+
+    def counts(self):
+        """Returns the number of texts, A2P texts, HTML documents and extracted records."""
+        row = self._fetch("SELECT COUNT(*), COUNT(CASE WHEN a2p = 1 THEN 1 END), COUNT(html), COUNT(record) "
+                          "FROM messages")[0]
+        return dict(zip(["texts", "a2p", "html", "records"], row))
+
+    def export(self, output_dir=None):
+        """
+        Writes the store out in the per-file layout of earlier versions:
+        text/<name>, A2P-classified-text/a2p_<name>, A2P-classified-html/a2p_<stem>.html
+        and A2P-classified-json/raw_a2p_<name>.json.
+
+        Args:
+            output_dir (str): Destination folder (defaults to the case folder).
+
+        Returns:
+            int: Number of files written.
+        """
+        output_dir = output_dir or self.dir_name
+        folders = [os.path.join(output_dir, folder) for folder in [TEXT_DIR, A2P_TEXT_DIR, HTML_DIR, JSON_DIR]]
+        for folder in folders:
+            os.makedirs(folder, exist_ok=True)
+        text_dir, a2p_dir, html_dir, json_dir = folders
+
+        def write(path, content):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+
+        # A separate read-only cursor streams rows without holding them all in memory
+        written = 0
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            for name, text, a2p, document_name, html, entities in conn.execute(
+                    "SELECT name, text, a2p, html_name, html, entities FROM messages ORDER BY name"):
+                write(os.path.join(text_dir, name), text)
+                written += 1
+                if a2p:
+                    write(os.path.join(a2p_dir, f"a2p_{name}"), text)
+                    written += 1
+                if html is not None:
+                    write(os.path.join(html_dir, document_name), html)
+                    written += 1
+                if entities is not None:
+                    write(os.path.join(json_dir, raw_json_name(name)),
+                          json.dumps(json.loads(entities), ensure_ascii=False, indent=4))
+                    written += 1
+        finally:
+            conn.close()
+        return written
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or export the message store of a processed case.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Write text/, A2P-classified-*/ files from the store.")
+    export_parser.add_argument("case_dir", help="Processed case folder.")
+    export_parser.add_argument("-o", "--output", help="Destination folder (defaults to the case folder).")
+    stats_parser = subparsers.add_parser("stats", help="Print message counts.")
+    stats_parser.add_argument("case_dir", help="Processed case folder.")
+    # Searching is provided by search_index.py (python search_index.py <case_dir> <query>)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(os.path.join(args.case_dir, CORPUS_FILE)):
+        print(f"No {CORPUS_FILE} in {args.case_dir}.")
+        return 1
+
+    store = CorpusStore(args.case_dir)
+    try:
+        if args.command == "export":
+            written = store.export(args.output)
+            print(f"Exported {written} files to {args.output or args.case_dir}.")
+        else:
+            print(json.dumps(store.counts()))
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,56 @@
 import os
 import re
+import hashlib
+import time
+import itertools
+import multiprocessing
+import openpyxl
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from email_body import extract_body
+from corpus_store import CorpusStore
+import metrics
+from chat_parser import (CHAT_SENDER_FILTER, scan_chat_senders, is_a2p_sender, parse_chat_messages,
+                         group_chat_windows)
 from email import policy
 from email.parser import BytesParser
 
 
+INGEST_WORKERS = int(os.getenv("SERENA_INGEST_WORKERS", "0")) or os.cpu_count() or 1
+INGEST_CHUNKSIZE = 32  # Files handed to a worker process at a time
+MIN_PARALLEL_FILES = 64  # Below this, files are converted in-process
+SPREADSHEET_CHUNK_ROWS = 5000  # Spreadsheet rows formatted and written at a time
+STORE_CHUNK_MESSAGES = 1000  # Messages written to the corpus store per transaction
+SPREADSHEET_EXTENSIONS = (".xlsx", ".csv")
+
+# Day headers of messenger chat exports, matched against whole (stripped) lines
+WEEKDAY = r"(?:Mon|Tues|Wednes|Thurs|Fri|Satur|Sun)day"
+MONTH = (r"(?:Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?|Sep(?:t(?:ember)?)?"
+         r"|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)")
+DATE_HEADER_PATTERNS = [
+    # --------------- Thursday, January 2, 2025 ---------------
+    re.compile(r"-{15,}\s*[A-Za-z]+,\s*[A-Za-z]+\s*\d{1,2},\s*\d{4}\s*-{15,}"),
+    # --------------- 2025년 1월 2일 목요일 ---------------
+    re.compile(r"-{15,}\s*\d{4}년\s*\d{1,2}월\s*\d{1,2}일(?:\s*\S요일)?\s*-{15,}"),
+    # --------------- 2025-01-02 --------------- / ----- 2025.01.02 Thursday -----
+    re.compile(rf"-{{5,}}\s*\d{{4}}[-./]\d{{1,2}}[-./]\d{{1,2}}\.?(?:\s*\(?{WEEKDAY}\)?)?\s*-{{5,}}", re.IGNORECASE),
+    # Thursday, January 2, 2025
+    re.compile(rf"{WEEKDAY},?\s+{MONTH}\.?\s+\d{{1,2}},?\s+\d{{4}}", re.IGNORECASE),
+    # Thursday, 2 January 2025
+    re.compile(rf"{WEEKDAY},?\s+\d{{1,2}}\s+{MONTH}\.?,?\s+\d{{4}}", re.IGNORECASE),
+    # 2025년 1월 2일 목요일
+    re.compile(r"\d{4}년\s*\d{1,2}월\s*\d{1,2}일\s*\S요일"),
+    # 2025.01.02 Thursday / 2025/01/02(Thu)
+    re.compile(r"\d{4}[./]\d{1,2}[./]\d{1,2}\s*\(?(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun)[a-z]*\)?", re.IGNORECASE),
+]
+
+
 def extract_email_content(file_path):
     """
     Extracts email headers and body content (supports multipart emails).
 
+    The body is reduced to one compact text alternative unless SERENA_EMAIL_BODY is "raw" (see `email_body`).
+
     Args:
         file_path (str): Path to the .eml file.
 
@@ -25,125 +67,500 @@ def extract_email_content(file_path):
         "Date": message.get("Date", "Unknown"),
     }
 
-    body = ""
-    if message.is_multipart():
-        for part in message.walk():
-            if part.get_content_type() in ["text/plain", "text/html"]:
-                charset = part.get_content_charset() or "utf-8"
-                body += part.get_payload(decode=True).decode(charset, errors="replace")
-    else:
-        charset = message.get_content_charset() or "utf-8"
-        body = message.get_payload(decode=True).decode(charset, errors="replace")
+    return {"headers": headers, "body": extract_body(message)}
+
+
+def iter_eml_messages(eml_path, output_name):
+    """
+    Extracts one .eml file as a single message.
+
+    Args:
+        eml_path (str): Path to the .eml file.
+        output_name (str): Name of the message's text file.
+
+    Yields:
+        tuple: (text name, text)
+    """
+    extracted_content = extract_email_content(eml_path)
+    yield output_name, (
+        f"From: {extracted_content['headers']['From']}\n"
+        f"To: {extracted_content['headers']['To']}\n"
+        f"Subject: {extracted_content['headers']['Subject']}\n"
+        f"Date: {extracted_content['headers']['Date']}\n\n"
+        f"Body:\n{extracted_content['body']}"
+    )
+
+
+def write_messages(messages, output_dir):
+    """
+    Saves (text name, text) messages as .txt files.
+
+    Returns:
+        list: Paths of the saved text files.
+    """
+    saved = []
+    for name, text in messages:
+        file_path = os.path.join(output_dir, name)
+        with open(file_path, "w", encoding="utf-8") as txt_file:
+            txt_file.write(text)
+        saved.append(file_path)
+    return saved
+
+
+def store_messages(messages, dir_name, source, chunk_size=STORE_CHUNK_MESSAGES):
+    """
+    Writes (text name, text) messages into the corpus store of a case, `chunk_size` messages at a time.
+
+    Only one chunk is held in memory; if extraction fails part-way, the messages already stored are deleted again.
+
+    Args:
+        messages (iterable): (text name, text) tuples.
+        dir_name (str): Case folder holding the corpus store.
+        source (str): Input path relative to the case folder.
+        chunk_size (int): Messages per transaction.
+
+    Returns:
+        list: (text name, length in characters) tuples of the stored messages.
+    """
+    store = CorpusStore(dir_name)
+    stored = []
+    try:
+        messages = iter(messages)
+        while chunk := list(itertools.islice(messages, chunk_size)):
+            # Newlines are translated as when a saved text file is read back in text mode
+            chunk = [(name, text.replace("\r\n", "\n").replace("\r", "\n")) for name, text in chunk]
+            store.put_texts(source, chunk)
+            stored.extend((name, len(text)) for name, text in chunk)
+    except Exception:
+        store.delete([name for name, _ in stored])
+        raise
+    finally:
+        store.close()
+    return stored
+
+
+def convert_eml_file(eml_path, output_dir, output_name):
+    """
+    Extracts one .eml file and saves it as a .txt file.
+
+    Args:
+        eml_path (str): Path to the .eml file.
+        output_dir (str): Directory to save the text file.
+        output_name (str): Name of the text file.
 
-    return {"headers": headers, "body": body}
+    Returns:
+        list: Paths of the saved text files.
+    """
+    saved = write_messages(iter_eml_messages(eml_path, output_name), output_dir)
+    print(f"Saved: {saved[0]}")
+    return saved
 
 
-def save_eml_to_txt(input_dir, output_dir):
+def iter_files(input_dir, extension):
     """
-    Extracts and saves email content from .eml files as .txt files.
+    Recursively yields the files under `input_dir` ending with `extension`, in a deterministic order.
+
+    Args:
+        input_dir (str): Root directory.
+        extension (str): File extension (case-insensitive), e.g. ".eml".
+    """
+    stack = [input_dir]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file() and entry.name.lower().endswith(extension):
+                yield entry.path
+        stack.extend(reversed(subdirectories))
+
+
+def eml_output_name(rel_path):
+    """
+    Builds a stable text file name for an .eml file from its path relative to the emls folder,
+    so names do not change when other files are added or removed.
+
+    Args:
+        rel_path (str): Path of the .eml file relative to the emls folder.
+
+    Returns:
+        str: e.g. "eml_inbox_Your_Order_Receipt_1a2b3c4d.txt"
+    """
+    rel_path = rel_path.replace(os.sep, "/")
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", os.path.splitext(rel_path)[0]).strip("_")[:60]
+    digest = hashlib.sha1(rel_path.encode("utf-8")).hexdigest()[:8]
+    return f"eml_{slug}_{digest}.txt"
+
+
+def convert_input_file(task):
+    """
+    Converts one input file (process pool entry point).
+
+    Args:
+        task (tuple): (input_path, converter, output_dir, output_name, source) where converter is
+            "eml", "excel" or "messagingapp" and output_name is only used for emails.
+            With a source (input path relative to the case folder), output_dir is the case folder
+            and the messages go into its corpus store instead of text files.
+
+    Returns:
+        tuple: (saved text file paths or stored (text name, length) tuples, error message or None)
+    """
+    input_path, converter, output_dir, output_name, source = task
+    try:
+        if converter == "eml":
+            messages = iter_eml_messages(input_path, output_name)
+        elif converter == "excel":
+            messages = iter_excel_messages(input_path)
+        else:
+            messages = iter_messagingapp_messages(input_path)
+        if source is not None:
+            return store_messages(messages, output_dir, source), None
+        return write_messages(messages, output_dir), None
+    except Exception as e:
+        return [], str(e)
+
+
+def timed_convert_input_file(task):
+    """`convert_input_file` that also returns its duration in seconds (measured in the worker process)."""
+    started = time.perf_counter()
+    result = convert_input_file(task)
+    return result, time.perf_counter() - started
+
+
+def convert_input_files(tasks, max_workers=None, chunksize=INGEST_CHUNKSIZE, min_parallel=MIN_PARALLEL_FILES):
+    """
+    Converts input files on a process pool (MIME parsing is CPU-bound), yielding results in task order.
+
+    Small workloads are converted in-process to avoid the pool start-up cost.
+
+    Args:
+        tasks (list): Tasks for `convert_input_file`.
+        max_workers (int): Worker processes (defaults to SERENA_INGEST_WORKERS or the CPU count).
+        chunksize (int): Tasks sent to a worker at a time.
+        min_parallel (int): Fewer tasks than this are converted in-process.
+
+    Yields:
+        tuple: (saved text file paths or stored (text name, length) tuples, error message or None)
+    """
+    max_workers = max_workers or INGEST_WORKERS
+    timed = metrics.ENABLED
+    results = convert_tasks(timed_convert_input_file if timed else convert_input_file, tasks, max_workers,
+                            chunksize, min_parallel)
+    try:
+        for task, result in zip(tasks, results):
+            if timed:
+                # Worker processes keep no metrics, so their conversion times are recorded here
+                result, seconds = result
+                metrics.observe_stage(f"extraction_{task[1]}", seconds, error=bool(result[1]))
+            yield result
+    finally:
+        # Closing the pool generator cancels conversions that have not started
+        results.close()
+
+
+def convert_tasks(function, tasks, max_workers, chunksize, min_parallel):
+    if max_workers <= 1 or len(tasks) < max(min_parallel, 2):
+        yield from map(function, tasks)
+        return
+
+    # "spawn" keeps workers safe when the caller (GUI, pipeline) is multi-threaded
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        yield from executor.map(function, tasks, chunksize=chunksize)
+
+
+def save_eml_to_txt(input_dir, output_dir, max_workers=None):
+    """
+    Extracts and saves email content from .eml files (searched recursively) as .txt files.
 
     Args:
         input_dir (str): Directory containing .eml files.
         output_dir (str): Directory to save processed text files.
+        max_workers (int): Worker processes (defaults to SERENA_INGEST_WORKERS or the CPU count).
     """
     os.makedirs(output_dir, exist_ok=True)
 
-    for idx, eml_file in enumerate((f for f in os.listdir(input_dir) if f.endswith(".eml")), start=1):
-        try:
-            extracted_content = extract_email_content(os.path.join(input_dir, eml_file))
-            txt_content = (
-                f"From: {extracted_content['headers']['From']}\n"
-                f"To: {extracted_content['headers']['To']}\n"
-                f"Subject: {extracted_content['headers']['Subject']}\n"
-                f"Date: {extracted_content['headers']['Date']}\n\n"
-                f"Body:\n{extracted_content['body']}"
-            )
-            save_path = os.path.join(output_dir, f"eml_{idx}.txt")
-            with open(save_path, "w", encoding="utf-8") as f:
-                f.write(txt_content)
-
-            print(f"Saved: {save_path}")
-        except Exception as e:
-            print(f"Failed to process {eml_file}: {e}")
+    eml_paths = list(iter_files(input_dir, ".eml"))
+    tasks = [(path, "eml", output_dir, eml_output_name(os.path.relpath(path, input_dir)), None)
+             for path in eml_paths]
+
+    for eml_path, (_, error) in zip(eml_paths, convert_input_files(tasks, max_workers)):
+        if error:
+            print(f"Failed to process {eml_path}: {error}")
+
+
+def column_labels(header):
+    """
+    Names spreadsheet columns the way pandas does, so the "column: value" lines keep their wording.
+
+    Blank headers become "Unnamed: <index>" and repeated headers get a ".1", ".2", ... suffix.
+    """
+    labels, seen = [], {}
+    for index, value in enumerate(header):
+        label = f"Unnamed: {index}" if value is None or value == "" else str(value)
+        if label in seen:
+            seen[label] += 1
+            label = f"{label}.{seen[label]}"
+        else:
+            seen[label] = 0
+        labels.append(label)
+    return labels
+
+
+def iter_spreadsheet_chunks(path, chunk_rows=SPREADSHEET_CHUNK_ROWS):
+    """
+    Streams the rows of a .xlsx or .csv file in chunks without loading the whole file.
+
+    Workbooks are opened read-only and every worksheet is read; the first row of a sheet is its header.
+
+    Args:
+        path (str): Path to the spreadsheet.
+        chunk_rows (int): Rows per chunk.
+
+    Yields:
+        tuple: (sheet index, sheet name, row number of the first row in the chunk, DataFrame of the rows)
+    """
+    if path.lower().endswith(".csv"):
+        first_row = 1
+        for frame in pd.read_csv(path, chunksize=chunk_rows, dtype=str, encoding_errors="replace"):
+            yield 0, None, first_row, frame
+            first_row += len(frame)
+        return
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet_index, sheet in enumerate(workbook.worksheets):
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            labels = column_labels(header)
+            width = len(labels)
+
+            first_row, chunk = 1, []
+            for row in rows:
+                chunk.append(row[:width] + (None,) * (width - len(row)))
+                if len(chunk) == chunk_rows:
+                    yield sheet_index, sheet.title, first_row, pd.DataFrame(chunk, columns=labels, dtype=object)
+                    first_row, chunk = first_row + len(chunk), []
+            if chunk:
+                yield sheet_index, sheet.title, first_row, pd.DataFrame(chunk, columns=labels, dtype=object)
+    finally:
+        workbook.close()
+
+
+def format_rows(frame):
+    """
+    Formats every row of a chunk as "column: value" lines, one column at a time.
+
+    Returns:
+        pandas.Series: The text of each row (missing values are written as "nan").
+    """
+    values = frame.astype(object).where(frame.notna(), "nan").astype(str)
+    columns = [f"{label}: " + values[label] for label in frame.columns]
+    return columns[0].str.cat(columns[1:], sep="\n") if len(columns) > 1 else columns[0]
+
+
+def iter_excel_messages(excel_path):
+    """
+    Yields every row of one spreadsheet (.xlsx, all worksheets, or .csv) as a message.
+
+    Rows are read and formatted in chunks, so memory use does not grow with the size of the export.
+    Rows of the first sheet are named "<file>_msg_<row>.txt" and rows of any further sheet
+    "<file>_<sheet>_msg_<row>.txt", where <row> is the row's position below the header. Empty rows are skipped.
+
+    Args:
+        excel_path (str): Path to the .xlsx or .csv file.
+
+    Yields:
+        tuple: (text name, text)
+    """
+    stem = os.path.splitext(os.path.basename(excel_path))[0]
+
+    for sheet_index, sheet_name, first_row, frame in iter_spreadsheet_chunks(excel_path):
+        prefix = stem if sheet_index == 0 else f"{stem}_{re.sub(r'[^A-Za-z0-9]+', '_', sheet_name).strip('_')}"
+        non_empty = frame.notna().any(axis=1).to_numpy()
+        row_numbers = range(first_row, first_row + len(frame))
+        texts = format_rows(frame)
+
+        for row_number, text, keep in zip(row_numbers, texts, non_empty):
+            if keep:
+                yield f"{prefix}_msg_{row_number}.txt", text
+        print(f"Extracted rows {first_row}-{first_row + len(frame) - 1} of {os.path.basename(excel_path)}"
+              f"{f' ({sheet_name})' if sheet_name else ''}")
+
+
+def convert_excel_file(excel_path, output_dir):
+    """
+    Saves every row of one spreadsheet (.xlsx, all worksheets, or .csv) as an individual .txt file.
+
+    Args:
+        excel_path (str): Path to the .xlsx or .csv file.
+        output_dir (str): Directory to save text files.
+
+    Returns:
+        list: Paths of the saved text files.
+    """
+    return write_messages(iter_excel_messages(excel_path), output_dir)
 
 
 def save_excel_rows_to_txt(input_directory, output_dir):
     """
-    Extracts rows from Excel files and saves them as individual .txt files.
+    Extracts rows from spreadsheet files (.xlsx and .csv) and saves them as individual .txt files.
 
     Args:
-        input_directory (str): Directory containing .xlsx files.
+        input_directory (str): Directory containing .xlsx or .csv files.
         output_dir (str): Directory to save text files.
     """
     os.makedirs(output_dir, exist_ok=True)
 
-    excel_files = [f for f in os.listdir(input_directory) if f.endswith(".xlsx")]
+    excel_files = sorted(f for f in os.listdir(input_directory) if f.lower().endswith(SPREADSHEET_EXTENSIONS))
 
     if not excel_files:
-        print("No .xlsx files found. Skipping.")
+        print("No .xlsx or .csv files found. Skipping.")
         return
 
-    for excel_file in (f for f in os.listdir(input_directory) if f.endswith(".xlsx")):
+    for excel_file in excel_files:
         try:
-            df = pd.read_excel(os.path.join(input_directory, excel_file))
+            convert_excel_file(os.path.join(input_directory, excel_file), output_dir)
+        except Exception as e:
+            print(f"Error processing {excel_file}: {e}")
 
-            for index, row in df.iterrows():
-                file_name = f"{os.path.splitext(excel_file)[0]}_msg_{index + 1}.txt"
-                with open(os.path.join(output_dir, file_name), "w", encoding="utf-8") as txt_file:
-                    txt_file.write("\n".join(f"{col}: {val}" for col, val in row.items()))
 
-                print(f"Saved: {file_name}")
+def find_date_header(line, patterns=DATE_HEADER_PATTERNS):
+    """
+    Checks whether a chat log line is a day header.
 
-        except Exception as e:
-            print(f"Error processing {excel_file}: {e}")
+    Returns:
+        re.Pattern or None: The first pattern matching the (stripped) line.
+    """
+    stripped = line.strip()
+    if not stripped or len(stripped) > 200:
+        return None
+    for pattern in patterns:
+        if pattern.fullmatch(stripped):
+            return pattern
+    return None
 
 
-def split_messagingapp_files(input_directory, output_directory):
+def iter_chat_sections(file_path):
     """
-    Splits chat logs from messaging apps into separate files based on date headers.
+    Splits one messaging app chat log into day sections based on date headers, reading it line by line.
+
+    Sections are emitted as soon as the next header is reached, so only one day is held in memory.
+    The first header format found (see DATE_HEADER_PATTERNS) is used for the rest of the file,
+    so a message that merely looks like a date in another format does not start a new day.
 
     Args:
-        input_directory (str): Directory containing text files from messaging apps.
-        output_directory (str): Directory to save processed text files.
+        file_path (str): Path to the chat log.
+
+    Yields:
+        tuple: (part number, header line, section lines); part 1 is any text before the first header.
+            A log without headers is yielded whole with part number None.
     """
-    os.makedirs(output_directory, exist_ok=True)
+    header_patterns = DATE_HEADER_PATTERNS
+    part, header, section = 1, None, []
 
-    date_pattern = r"-{15,}\s*[A-Za-z]+,\s*[A-Za-z]+\s*\d{1,2},\s*\d{4}\s*-{15,}"
+    with open(file_path, "r", encoding="utf-8") as file:
+        for line in file:
+            pattern = find_date_header(line, header_patterns)
+            if pattern is None:
+                section.append(line)
+                continue
 
+            yield part, header, section
+            header_patterns = (pattern,)
+            part, header, section = part + 1, line.strip(), []
 
-    for file_name in (f for f in os.listdir(input_directory) if f.endswith(".txt")):
-        file_path = os.path.join(input_directory, file_name)
+    yield (part if part > 1 else None), header, section
 
-        try:
-            with open(file_path, "r", encoding="utf-8") as file:
-                content = file.read()
 
-            # Splitting based on date headers
-            sections = re.split(date_pattern, content)
+def iter_messagingapp_messages(file_path):
+    """
+    Splits one messaging app chat log into per-sender message windows.
 
-            if len(sections) > 1:
-                for i, section in enumerate(sections):
-                    section = section.strip()
-                    if not section:  # Skip empty sections
-                        continue
+    Each day section is broken into messages (sender, time, text; see `chat_parser`), and consecutive
+    messages of one sender form a window named "<file>_part<day>_w<n>.txt" that starts with the day header.
+    Unless SERENA_CHAT_SENDER_FILTER is "off", windows of senders that do not look like a business,
+    service account or bot are dropped before classification. Sections whose messages cannot be
+    parsed are kept whole as "<file>_part<day>.txt" (or "<file>_original.txt" without date headers).
 
-                    output_file_name = f"{os.path.splitext(file_name)[0]}_part{i + 1}.txt"
-                    output_file_path = os.path.join(output_directory, output_file_name)
+    Args:
+        file_path (str): Path to the chat log.
 
-                    with open(output_file_path, "w", encoding="utf-8") as output_file:
-                        output_file.write(section)
+    Yields:
+        tuple: (text name, text)
+    """
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    with open(file_path, "r", encoding="utf-8") as file:
+        message_pattern, senders = scan_chat_senders(file)
+    a2p_senders = {sender for sender, stats in senders.items() if is_a2p_sender(sender, stats, len(senders))}
+
+    kept = total = 0
+    for part, header, lines in iter_chat_sections(file_path):
+        base = f"{stem}_original" if part is None else f"{stem}_part{part}"
+        messages = parse_chat_messages(lines, message_pattern) if message_pattern else []
+
+        if not messages:
+            text = "".join(lines)
+            if part is None:
+                # If no valid split is found, keep the file as is
+                yield f"{base}.txt", text
+            elif text.strip():  # Skip empty sections
+                yield f"{base}.txt", text.strip()
+            continue
+
+        for index, (sender, window_lines) in enumerate(group_chat_windows(messages), 1):
+            total += 1
+            if CHAT_SENDER_FILTER and sender is not None and sender not in a2p_senders:
+                continue
+            kept += 1
+            body = "".join(window_lines).strip()
+            yield f"{base}_w{index}.txt", f"{header}\n{body}" if header else body
+
+    if total:
+        print(f"{os.path.basename(file_path)}: {kept}/{total} chat windows from "
+              f"{len(a2p_senders)}/{len(senders)} A2P-like senders")
+
+
+def split_messagingapp_file(file_path, output_directory):
+    """
+    Splits one messaging app chat log into separate files, one per message window.
 
-                    print(f"Saved: {output_file_path}")
+    Args:
+        file_path (str): Path to the chat log.
+        output_directory (str): Directory to save processed text files.
 
-            else:
-                # If no valid split is found, save the file as is
-                output_file_name = f"{os.path.splitext(file_name)[0]}_original.txt"
-                output_file_path = os.path.join(output_directory, output_file_name)
+    Returns:
+        list: Paths of the saved text files.
+    """
+    saved = write_messages(iter_messagingapp_messages(file_path), output_directory)
+    for output_file_path in saved:
+        print(f"Saved: {output_file_path}")
+    return saved
 
-                with open(output_file_path, "w", encoding="utf-8") as output_file:
-                    output_file.write(content)
 
-                print(f"Saved (No Split Needed): {output_file_path}")
+def split_messagingapp_files(input_directory, output_directory, max_workers=None):
+    """
+    Splits chat logs from messaging apps into per-sender message windows (see `iter_messagingapp_messages`).
 
-        except Exception as e:
-            print(f"Error processing {file_name}: {e}")
+    Args:
+        input_directory (str): Directory containing text files from messaging apps.
+        output_directory (str): Directory to save processed text files.
+        max_workers (int): Worker processes (defaults to SERENA_INGEST_WORKERS or the CPU count).
+    """
+    os.makedirs(output_directory, exist_ok=True)
+
+    file_names = sorted(f for f in os.listdir(input_directory) if f.endswith(".txt"))
+    tasks = [(os.path.join(input_directory, file_name), "messagingapp", output_directory, None, None)
+             for file_name in file_names]
+
+    # Chat exports are few but can be large, so each one goes to its own worker process
+    for file_name, (saved, error) in zip(file_names, convert_input_files(tasks, max_workers, chunksize=1,
+                                                                         min_parallel=2)):
+        if error:
+            print(f"Error processing {file_name}: {error}")
+        for output_file_path in saved:
+            print(f"Saved: {output_file_path}")
@@ -0,0 +1,134 @@
+import os
+import re
+import json
+import hashlib
+import threading
+
+
+DEDUP_ENABLED = os.getenv("SERENA_DEDUP", "on").lower() != "off"
+SIMHASH_DISTANCE = int(os.getenv("SERENA_DEDUP_DISTANCE", "3"))  # Max differing SimHash bits for near duplicates (-1: exact only)
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3  # Words per shingle
+MIN_NEAR_WORDS = 8  # Shorter messages are only matched exactly
+
+WORD = re.compile(r"\w+")
+DIGITS = re.compile(r"\d+")
+WHITESPACE = re.compile(r"\s+")
+
+
+def exact_hash(text):
+    """Hash of a message text with whitespace runs collapsed."""
+    return hashlib.sha1(WHITESPACE.sub(" ", text).strip().encode("utf-8")).hexdigest()
+
+
+def record_hash(record):
+    """Hash of a record's canonical JSON form (key order does not matter)."""
+    return hashlib.sha1(json.dumps(record, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def dedup_records(records, existing=()):
+    """
+    Drops records that are identical to an earlier one (hash-based, order preserving).
+
+    Args:
+        records (list): Records to add.
+        existing (list): Records already kept; new records identical to them are dropped too.
+
+    Returns:
+        list: `existing` followed by the distinct new records.
+    """
+    kept, seen = list(existing), {record_hash(record) for record in existing}
+    for record in records:
+        key = record_hash(record)
+        if key not in seen:
+            seen.add(key)
+            kept.append(record)
+    return kept
+
+
+def shingles(text):
+    """Lower-cased word shingles with digits masked, so order numbers, dates and amounts do not separate templates."""
+    words = [DIGITS.sub("0", word) for word in WORD.findall(text.lower())]
+    if len(words) <= SHINGLE_SIZE:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+
+
+def simhash(text):
+    """
+    64-bit SimHash of a text's shingles.
+
+    Returns:
+        int or None: Fingerprint, or None for messages too short to compare reliably.
+    """
+    features = shingles(text)
+    if len(features) + SHINGLE_SIZE - 1 < MIN_NEAR_WORDS:
+        return None
+    bit_strings = [format(int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big"),
+                          "064b") for feature in features]
+    majority = len(bit_strings) / 2
+    return int("".join("1" if column.count("1") > majority else "0" for column in zip(*bit_strings)), 2)
+
+
+class Deduplicator:
+    """
+    Assigns incoming messages to clusters of exact and near duplicates.
+
+    The first message of a cluster is its representative. Exact duplicates have the same text up
+    to whitespace; near duplicates have SimHash fingerprints at most `distance` bits apart. Near
+    duplicate candidates are found through `distance + 1` bands of the fingerprint: by the pigeonhole
+    principle two fingerprints within `distance` bits agree on at least one band, so each message is
+    only compared with representatives sharing a band.
+    """
+
+    def __init__(self, distance=SIMHASH_DISTANCE):
+        self.distance = distance
+        self.exact = {}  # Text hash -> (representative, True if the text is identical to the representative's)
+        self.fingerprints = {}  # Representative -> SimHash
+        self.band_count = max(distance + 1, 1)
+        self.band_width = -(-SIMHASH_BITS // self.band_count)
+        self.bands = [{} for _ in range(self.band_count)]
+        self.lock = threading.Lock()
+        self.duplicates = 0
+        self.near_duplicates = 0
+
+    def band_keys(self, fingerprint):
+        mask = (1 << self.band_width) - 1
+        return [(fingerprint >> (band * self.band_width)) & mask for band in range(self.band_count)]
+
+    def find_near(self, fingerprint):
+        for band, key in zip(self.bands, self.band_keys(fingerprint)):
+            for candidate in band.get(key, ()):
+                if bin(fingerprint ^ self.fingerprints[candidate]).count("1") <= self.distance:
+                    return candidate
+        return None
+
+    def assign(self, name, text):
+        """
+        Places a message in a cluster.
+
+        Returns:
+            tuple: (representative name or None if the message starts a new cluster, True for an exact duplicate)
+        """
+        key = exact_hash(text)
+        with self.lock:
+            if key in self.exact:
+                representative, identical = self.exact[key]
+                self.duplicates += 1
+                self.near_duplicates += not identical
+                return representative, identical
+
+            fingerprint = simhash(text) if self.distance >= 0 else None
+            representative = self.find_near(fingerprint) if fingerprint is not None else None
+            if representative is not None:
+                self.exact[key] = (representative, False)
+                self.duplicates += 1
+                self.near_duplicates += 1
+                return representative, False
+
+            self.exact[key] = (name, True)
+            if fingerprint is not None:
+                self.fingerprints[name] = fingerprint
+                for band, band_key in zip(self.bands, self.band_keys(fingerprint)):
+                    band.setdefault(band_key, []).append(name)
+            return None, False
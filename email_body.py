@@ -0,0 +1,145 @@
+import os
+import re
+from bs4 import BeautifulSoup, NavigableString
+
+
+EMAIL_BODY_MODE = os.getenv("SERENA_EMAIL_BODY", "lean").lower()  # "lean" or "raw" (every text part verbatim)
+
+DROP_TAGS = ["script", "style", "head", "title", "meta", "link", "noscript", "svg", "template", "object", "iframe"]
+BLOCK_TAGS = ["p", "div", "tr", "table", "li", "ul", "ol", "h1", "h2", "h3", "h4", "h5", "h6", "section",
+              "article", "header", "footer", "blockquote", "center", "hr", "dd", "dt", "pre", "address"]
+# A zero size only hides the element when nothing but a unit follows the 0 ("font-size:0.9em" is visible)
+ZERO_SIZE = r"\s*:\s*0(?:px|pt|em|rem|%)?\s*(?:!important)?\s*(?:;|$)"
+HIDDEN_STYLE = re.compile(rf"display\s*:\s*none|visibility\s*:\s*hidden|max-height{ZERO_SIZE}|font-size{ZERO_SIZE}",
+                          re.IGNORECASE)
+TRACKING_SRC = re.compile(r"pixel|beacon|track|/open|/o\.gif|spacer|blank\.gif", re.IGNORECASE)
+INVISIBLE_CHARS = re.compile(r"[\u200b\u200c\u200d\u034f\u00ad\ufeff\u2060]")
+SPACES = re.compile(r"[ \t\u00a0\u2007\u202f]+")
+
+# Boilerplate footer lines (unsubscribe links, legal notices, "sent to" notices)
+FOOTER_LINE = re.compile(
+    r"unsubscribe|view (this )?(e-?mail )?(it )?in (your |a )?(web )?browser|manage (your )?(e-?mail |subscription )?"
+    r"preferences|privacy (policy|notice|statement)|terms (of (use|service)|and conditions|& conditions)|"
+    r"all rights reserved|^©|^copyright\b|you (are )?receiv(ed|ing) this (e-?mail|message|newsletter)|"
+    r"this (e-?mail|message) was sent (to|by|from)|(please )?do not reply to this (e-?mail|message)|"
+    r"add .{1,60} to your address book|update your (e-?mail )?preferences",
+    re.IGNORECASE,
+)
+MAX_FOOTER_LINE = 300
+
+
+def is_tracking_image(img):
+    """Checks whether an <img> is a tracking pixel (1x1, hidden, or pointing to a tracking URL)."""
+    size = [str(img.get(attribute, "")).strip().lower().replace("px", "") for attribute in ("width", "height")]
+    if any(value in ("0", "1") for value in size):
+        return True
+    if HIDDEN_STYLE.search(img.get("style", "")):
+        return True
+    return bool(TRACKING_SRC.search(img.get("src", "")))
+
+
+def html_to_text(html):
+    """
+    Converts an HTML email body to compact text.
+
+    Scripts, styles, hidden preheaders and tracking pixels are removed, images are replaced by their
+    alt text, and each innermost table row becomes one "cell | cell | cell" line so tables keep
+    their structure. Layout tables that only wrap other tables do not produce rows of their own.
+
+    Args:
+        html (str): HTML source.
+
+    Returns:
+        str: Plain text with one block per line.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(DROP_TAGS):
+        tag.decompose()
+    for tag in soup.find_all(style=HIDDEN_STYLE):
+        tag.decompose()
+    for img in soup.find_all("img"):
+        alt = img.get("alt", "").strip()
+        if alt and not is_tracking_image(img):
+            img.replace_with(NavigableString(f" {alt} "))
+        else:
+            img.decompose()
+    for br in soup.find_all("br"):
+        br.replace_with(NavigableString("\n"))
+
+    for row in [row for row in soup.find_all("tr") if row.find("table") is None]:
+        cells = [cell.get_text(" ", strip=True) for cell in row.find_all(["td", "th"])]
+        row.replace_with(NavigableString("\n" + " | ".join(cell for cell in cells if cell) + "\n"))
+
+    for tag in soup.find_all(BLOCK_TAGS):
+        tag.insert_before(NavigableString("\n"))
+        tag.insert_after(NavigableString("\n"))
+
+    return soup.get_text()
+
+
+def compact_text(text, strip_footers=True):
+    """
+    Normalizes whitespace, drops invisible padding characters, repeated lines and boilerplate footer lines.
+
+    Args:
+        text (str): Body text.
+        strip_footers (bool): Remove lines matching FOOTER_LINE.
+
+    Returns:
+        str: Compact body text.
+    """
+    lines, previous = [], None
+    for line in INVISIBLE_CHARS.sub("", text).splitlines():
+        line = SPACES.sub(" ", line).strip()
+        if line in ("", "|"):
+            if lines and lines[-1] != "":
+                lines.append("")
+            continue
+        if line == previous:
+            continue
+        if strip_footers and len(line) <= MAX_FOOTER_LINE and FOOTER_LINE.search(line):
+            continue
+        lines.append(line)
+        previous = line
+    return "\n".join(lines).strip()
+
+
+def decode_part(part):
+    """Decodes a text MIME part with its declared charset (falling back to UTF-8)."""
+    payload = part.get_payload(decode=True) or b""
+    charset = part.get_content_charset() or "utf-8"
+    try:
+        return payload.decode(charset, errors="replace")
+    except LookupError:
+        return payload.decode("utf-8", errors="replace")
+
+
+def extract_body(message, mode=None):
+    """
+    Extracts the body of an email message.
+
+    In "lean" mode only one alternative is used (HTML converted with `html_to_text`, or the plain
+    text part when there is no HTML), followed by compaction. "raw" mode concatenates every
+    text/plain and text/html part verbatim, as earlier versions did.
+
+    Args:
+        message (email.message.EmailMessage): Parsed message.
+        mode (str): "lean" or "raw" (defaults to SERENA_EMAIL_BODY).
+
+    Returns:
+        str: Body text.
+    """
+    mode = mode or EMAIL_BODY_MODE
+    if mode == "raw":
+        if not message.is_multipart():
+            return decode_part(message)
+        return "".join(decode_part(part) for part in message.walk()
+                       if part.get_content_type() in ["text/plain", "text/html"])
+
+    part = message.get_body(preferencelist=("html", "plain"))
+    if part is None:
+        return ""
+    text = decode_part(part)
+    if part.get_content_type() == "text/html":
+        text = html_to_text(text)
+    return compact_text(text)
@@ -0,0 +1,156 @@
+import re
+from collections import Counter
+from normalization import (CURRENCY_SYMBOLS, CURRENCY_WORDS, CURRENCY_CODES, TIMEZONE_OFFSETS, parse_number,
+                           detect_currency, parse_datetime)
+
+
+MAX_HINTS = 10  # Candidates of each kind passed to GPT
+
+WEEKDAY = r"(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun)[a-z]*\.?,?"
+MONTH = (r"(?:Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?|Sep(?:t(?:ember)?)?"
+         r"|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)")
+TIMEZONE = r"(?:" + "|".join(sorted(TIMEZONE_OFFSETS, key=len, reverse=True)) + r")\b|[+-]\d{2}:?\d{2}\b"
+TIME = rf"(?:[AaPp][Mm] )?\d{{1,2}}:\d{{2}}(?::\d{{2}})?(?: ?[AaPp]\.?[Mm]\.?)?(?: ?(?:{TIMEZONE}))?"
+DATE = re.compile(
+    r"(?<![\w/.-])(?:"
+    rf"(?:{WEEKDAY} )?{MONTH}\.? \d{{1,2}}(?:st|nd|rd|th)?(?:,? \d{{4}})?"  # July 20, 2018 / Sat, Nov 25
+    rf"|(?:{WEEKDAY} )?\d{{1,2}}(?:st|nd|rd|th)? {MONTH}\.?,? \d{{4}}"  # Fri, 20 Jul 2018
+    rf"|\d{{1,2}}-{MONTH}-\d{{2,4}}"  # 01-Oct-2022
+    r"|\d{4}[-/.]\d{1,2}[-/.]\d{1,2}"  # 2024-10-09 / 2024.11.23
+    r"|\d{1,2}/\d{1,2}/\d{2,4}"  # 10/09/2024
+    r"|\d{4}년 ?\d{1,2}월 ?\d{1,2}일"
+    rf")(?:,? (?:at )?{TIME})?(?![\w/])",
+    re.IGNORECASE)
+# Header lines holding the message's own timestamp (emails, text message exports)
+MESSAGE_DATE_LINE = re.compile(r"^(?:date|sent|received|timestamp(?:-date|-time)?)\s*:(.*)$",
+                               re.IGNORECASE | re.MULTILINE)
+
+SYMBOLS = "|".join(re.escape(symbol) for symbol, _ in CURRENCY_SYMBOLS)
+CODES = "|".join(sorted(CURRENCY_CODES))
+WORDS = "|".join(CURRENCY_WORDS)
+AMOUNT_NUMBER = r"\d{1,3}(?:,\d{3})+(?:\.\d{1,2})?|\d+(?:\.\d{1,2})?"
+AMOUNT = re.compile(
+    rf"-?(?:\b(?:{CODES}) ?|(?:{SYMBOLS}) ?)(?P<prefixed>{AMOUNT_NUMBER})(?: ?(?:{CODES})\b)?"  # $18.00, USD 13.50
+    rf"|(?<![\w.,])(?P<suffixed>{AMOUNT_NUMBER}) ?(?:(?:{CODES}|{WORDS})\b|{SYMBOLS})")  # 6.90 USD, 10,000원
+
+PHONE = re.compile(
+    r"(?<![\w.+-])(?:\+?\d{1,3}[ .-]?)?(?:\(\+?\d{1,4}\)[ .-]?)?\d{2,4}[ .-]\d{3,4}[ .-]\d{3,4}(?![\w-])"  # 123-456-7890
+    r"|(?<![\w.+-])\+\d{9,14}(?!\w)"  # +821098017712
+    r"|(?<![\w.+-])01[016789]\d{7,8}(?!\w)")  # Korean mobile numbers without separators
+LABELED_PHONE = re.compile(r"\b(?:phone(?: number)?|mobile|cell|tel|contact)\b[^\w+]{0,4}(\+?\d[\d ().-]{7,}\d)",
+                           re.IGNORECASE)
+REFERENCE_ID = re.compile(
+    r"\b(?:order|booking|reservation|confirmation|transaction|invoice|tracking|itinerary|payment|appointment|ticket)"
+    r"(?: ?(?:#|no\.?|number|id|code))?\s*[:#|]*\s*#?(?=[A-Z_-]*\d)([A-Z0-9][A-Z0-9_-]{4,})\b",
+    re.IGNORECASE)
+
+
+def unique(values):
+    return list(dict.fromkeys(values))[:MAX_HINTS]
+
+
+def overlaps(span, spans):
+    return any(span[0] < end and start < span[1] for start, end in spans)
+
+
+def find_reference_ids(text):
+    """Returns (value, span) of order, booking, transaction and tracking IDs that follow such a label."""
+    return [(match.group(1), match.span(1)) for match in REFERENCE_ID.finditer(text)]
+
+
+def find_datetimes(text):
+    """Returns (value, span) of every date expression, with its time and timezone when they follow it."""
+    return [(match.group(0).rstrip(".,"), match.span()) for match in DATE.finditer(text)]
+
+
+def find_amounts(text):
+    """Returns (value, span, number, currency code) of every amount written with a currency symbol, code or word."""
+    amounts = []
+    for match in AMOUNT.finditer(text):
+        try:
+            number = float(parse_number(match.group("prefixed") or match.group("suffixed")))
+        except ValueError:
+            continue
+        value = match.group(0).strip()
+        amounts.append((value, match.span(), -number if value.startswith("-") else number, detect_currency(value)))
+    return amounts
+
+
+def find_phone_numbers(text, excluded_spans=()):
+    """Returns (value, span) of phone numbers; labeled numbers ("Phone: ...") come first."""
+    labeled = [(match.group(1).strip(), match.span(1)) for match in LABELED_PHONE.finditer(text)]
+    found = labeled + [(match.group(0), match.span()) for match in PHONE.finditer(text)
+                       if not overlaps(match.span(), [span for _, span in labeled])]
+    return [(value, span) for value, span in found
+            if not overlaps(span, excluded_spans) and sum(c.isdigit() for c in value) >= 9]
+
+
+def find_message_datetime(text, datetimes):
+    """
+    Picks the message's own timestamp: the date in a Date/Sent/timestamp header line, or else the first
+    date of the text (the day header of a chat window).
+
+    Returns:
+        tuple: (value, span), or None if the text has no dates.
+    """
+    for line in MESSAGE_DATE_LINE.finditer(text):
+        for value, span in datetimes:
+            if line.start(1) <= span[0] < line.end(1):
+                return value, span
+    return datetimes[0] if datetimes else None
+
+
+def highest_amount(amounts):
+    """Highest positive amount in the currency used most often (the total of a receipt, not a line item)."""
+    amounts = [amount for amount in amounts if amount[2] > 0]
+    if not amounts:
+        return None
+    currencies = Counter(currency for _, _, _, currency in amounts)
+    currency = currencies.most_common(1)[0][0]
+    return max((amount for amount in amounts if amount[3] == currency), key=lambda amount: amount[2])[0]
+
+
+def extract_structured_fields(text):
+    """
+    Extracts the pattern-based fields of a message locally.
+
+    mobile_number, amount (the highest in the main currency) and message_datetime are always filled
+    (NULL when absent), exactly as they appear in the text. action_datetime is filled when the text has
+    at most one date besides the message timestamp; with several candidates it is left to GPT.
+
+    Args:
+        text (str): Message text.
+
+    Returns:
+        tuple: ({field: value} of the fields decided locally,
+                {"reference_ids", "dates": candidates} passed to GPT as hints)
+    """
+    reference_ids = find_reference_ids(text)
+    datetimes = find_datetimes(text)
+    amounts = find_amounts(text)
+    excluded = [span for _, span in reference_ids + datetimes] + [span for _, span, _, _ in amounts]
+    phone_numbers = find_phone_numbers(text, excluded)
+
+    message_datetime = find_message_datetime(text, datetimes)
+    # The same moment written twice ("October 26, 2024, at 13:05" / "October 26, 2024, 13:05") is one candidate
+    candidates = {}
+    for value, span in datetimes:
+        if message_datetime is None or (span != message_datetime[1] and value != message_datetime[0]):
+            candidates.setdefault(parse_datetime(value) or value, value)
+    action_datetimes = unique(candidates.values())
+    amount = highest_amount(amounts)
+
+    fields = {
+        "message_datetime": message_datetime[0] if message_datetime else "NULL",
+        "amount": amount or "NULL",
+        "mobile_number": phone_numbers[0][0] if phone_numbers else "NULL",
+    }
+    if len(action_datetimes) <= 1:
+        fields["action_datetime"] = action_datetimes[0] if action_datetimes else "NULL"
+
+    # Reference numbers keep GPT from taking them for items; dates are only listed when GPT has to choose one
+    hints = {
+        "reference_ids": unique(value for value, _ in reference_ids),
+        "dates": action_datetimes if "action_datetime" not in fields else [],
+    }
+    return fields, {kind: values for kind, values in hints.items() if values}
@@ -0,0 +1,123 @@
+import re
+import html
+import metrics
+
+
+MIN_VALUE_LENGTH = 2  # Shorter values ("1", "$") would light up most of a receipt
+MISSING_VALUES = {"null", "none", "n/a"}
+SKIP_TAGS = {"head", "title", "script", "style"}
+
+MARKUP = re.compile(r"<!--.*?-->|<[^>]*>", re.DOTALL)
+TAG_NAME = re.compile(r"<(/?)([a-zA-Z][\w-]*)")
+HIGHLIGHT_SPAN = '<span style="background-color: {color};">{text}</span>'
+
+
+def iter_values(json_data, key_colors):
+    """
+    Yields (value, color) for every highlightable extracted value, in `key_colors` order.
+
+    String fields and the string items of list fields (such as "item") are used; empty and
+    "NULL" values are skipped.
+    """
+    for key, color in key_colors.items():
+        value = json_data.get(key)
+        for item in value if isinstance(value, list) else [value]:
+            if isinstance(item, str):
+                item = item.strip()
+                if len(item) >= MIN_VALUE_LENGTH and item.lower() not in MISSING_VALUES:
+                    yield item, color
+
+
+def build_matcher(json_data, key_colors):
+    """
+    Compiles every extracted value of a record into one pattern.
+
+    Alternatives are ordered longest first, so a scan returns the longest value starting at each
+    position and matches never overlap. A value extracted for several keys keeps the color of the
+    first key.
+
+    Args:
+        json_data (dict): Raw extracted entities of a message.
+        key_colors (dict): {field: highlight color}.
+
+    Returns:
+        tuple: (compiled pattern, {value: color}), or None if there is nothing to highlight.
+    """
+    colors = {}
+    for value, color in iter_values(json_data, key_colors):
+        colors.setdefault(value, color)
+    if not colors:
+        return None
+    pattern = re.compile("|".join(re.escape(value) for value in sorted(colors, key=len, reverse=True)))
+    return pattern, colors
+
+
+def highlight_text(text, matcher):
+    """Wraps every match in a text segment in a highlight span (the segment is returned unchanged if nothing matches)."""
+    pattern, colors = matcher
+    escaped = "&" in text
+    plain = html.unescape(text) if escaped else text
+    parts, position = [], 0
+    for match in pattern.finditer(plain):
+        value = match.group()
+        parts.append(plain[position:match.start()])
+        parts.append(HIGHLIGHT_SPAN.format(color=colors[value], text=html.escape(value, quote=False) if escaped else value))
+        position = match.end()
+    if not parts:
+        return text
+    parts.append(plain[position:])
+    if escaped:
+        # Plain parts are at even positions and need their entities back
+        parts = [html.escape(part, quote=False) if i % 2 == 0 else part for i, part in enumerate(parts)]
+    return "".join(parts)
+
+
+def highlight_html(html_content, json_data, key_colors):
+    """
+    Highlights the extracted values of a record in an HTML document with a single scan.
+
+    Text between tags is matched against one pattern built from all values; tags, the document
+    head, scripts and styles, and text inside existing highlight spans are copied unchanged, so
+    highlighting a document twice does not nest spans.
+
+    Args:
+        html_content (str): HTML document.
+        json_data (dict): Raw extracted entities of the message.
+        key_colors (dict): {field: highlight color}.
+
+    Returns:
+        str: Highlighted HTML.
+    """
+    with metrics.stage_timer("highlight"):
+        return highlight_markup(html_content, build_matcher(json_data, key_colors))
+
+
+def highlight_markup(html_content, matcher):
+    """Applies a matcher from `build_matcher` to the text of an HTML document (see `highlight_html`)."""
+    if matcher is None:
+        return html_content
+
+    output, position = [], 0
+    skipped, highlighted = 0, 0
+
+    def copy_text(end):
+        text = html_content[position:end]
+        output.append(highlight_text(text, matcher) if text and not skipped and not highlighted else text)
+
+    for markup in MARKUP.finditer(html_content):
+        copy_text(markup.start())
+        tag = markup.group()
+        name = TAG_NAME.match(tag)
+        if name and not tag.endswith("/>"):
+            closing, tag_name = name.group(1) == "/", name.group(2).lower()
+            if tag_name in SKIP_TAGS:
+                skipped = max(skipped - 1, 0) if closing else skipped + 1
+            elif tag_name == "span":
+                if closing:
+                    highlighted = max(highlighted - 1, 0)
+                elif highlighted or "background-color" in tag:
+                    highlighted += 1
+        output.append(tag)
+        position = markup.end()
+    copy_text(len(html_content))
+    return "".join(output)
@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class LLMCache:
+    """
+    Persistent, content-addressed cache of GPT responses stored in SQLite.
+
+    Entries are keyed by a SHA-256 hash of (model, messages, parameters), so identical
+    requests are answered locally across runs, cases and processes.
+    """
+
+    def __init__(self, path, max_entries=200000, max_age_days=90):
+        """
+        Args:
+            path (str): SQLite database file.
+            max_entries (int): Maximum number of cached responses (least recently used are evicted).
+            max_age_days (float): Responses older than this are evicted (0 = never).
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL, accessed REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        self.conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(model, messages, params):
+        """
+        Builds the cache key for a request.
+
+        Args:
+            model (str): Model name.
+            messages (list): Chat messages (system prompt and input text).
+            params (dict): Remaining request parameters (temperature, token limits, ...).
+
+        Returns:
+            str: Hex digest identifying the request.
+        """
+        payload = json.dumps({"model": model, "messages": messages, "params": params},
+                             sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returns the cached response for `key`, or None."""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and (not self.max_age or now - row[1] <= self.max_age):
+                self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                self.conn.commit()
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, model, response):
+        """Stores a response, evicting old entries every 1000 writes."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            self.conn.commit()
+            self.puts += 1
+        if self.puts % 1000 == 0:
+            self.evict()
+
+    def evict(self):
+        """Removes expired entries and trims the cache to `max_entries`."""
+        with self.lock:
+            if self.max_age:
+                self.conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+            count = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self.conn.commit()
+
+    def stats(self):
+        """Returns hit/miss counters and the number of stored entries."""
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
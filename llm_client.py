@@ -0,0 +1,321 @@
+import os
+import time
+import random
+import threading
+import contextlib
+import openai
+from openai import OpenAI
+from llm_cache import LLMCache
+import metrics
+
+
+# Read API key from environment variables.
+# Set OPENAI_BASE_URL to point the client at any OpenAI-compatible server (e.g. a local mock).
+api_key = os.getenv("OPENAI_API_KEY")
+
+# Initiate OpenAI client (retries are handled below so that they go through the rate limiter)
+client = OpenAI(api_key=api_key, max_retries=0)
+
+# Rate-limit budgets and retry settings (0 disables a budget)
+REQUESTS_PER_MINUTE = int(os.getenv("SERENA_REQUESTS_PER_MINUTE", "0"))
+TOKENS_PER_MINUTE = int(os.getenv("SERENA_TOKENS_PER_MINUTE", "0"))
+MODEL = os.getenv("SERENA_MODEL", "gpt-4o")  # Chat model of every request, online and in Batch API jobs
+MAX_CONCURRENCY = int(os.getenv("SERENA_MAX_CONCURRENCY", "4"))
+MAX_RETRIES = int(os.getenv("SERENA_MAX_RETRIES", "5"))
+BACKOFF_BASE = 1.0  # seconds
+BACKOFF_CAP = 60.0  # seconds
+
+# Persistent response cache ("off" disables it); only temperature-0 requests are cached, so sampled answers are
+# never replayed. Requests use TEMPERATURE (0 unless SERENA_TEMPERATURE samples), and deterministic mode forces 0.
+LLM_CACHE_PATH = os.getenv("SERENA_LLM_CACHE", os.path.join(os.path.expanduser("~"), ".serena", "llm_cache.sqlite3"))
+TEMPERATURE = float(os.getenv("SERENA_TEMPERATURE", "0"))
+DETERMINISTIC = os.getenv("SERENA_DETERMINISTIC", "0") == "1"
+MAX_INPUT_TOKENS = int(os.getenv("SERENA_MAX_INPUT_TOKENS", "8000"))  # Per message sent to GPT (0 = no limit)
+
+
+def estimate_tokens(text):
+    """
+    Roughly estimates the number of tokens in a text (about 4 characters per token).
+
+    Args:
+        text (str or int): Text to measure, or its length in characters.
+
+    Returns:
+        int: Estimated token count.
+    """
+    length = text if isinstance(text, int) else len(text)
+    return length // 4 + 1
+
+
+def truncate_to_tokens(text, max_tokens=MAX_INPUT_TOKENS):
+    """
+    Shortens an oversized message to about `max_tokens`, keeping its beginning and end.
+
+    Args:
+        text (str): Message text.
+        max_tokens (int): Token budget (0 = no limit).
+
+    Returns:
+        str: The text, or its first three quarters and last quarter of the budget around an omission marker.
+    """
+    tokens = estimate_tokens(text)
+    if max_tokens <= 0 or tokens <= max_tokens:
+        return text
+    # About 4 characters per token: three quarters of the budget from the start, one quarter from the end
+    head, tail = text[:max_tokens * 3], text[-max_tokens:]
+    return f"{head}\n[... about {tokens - max_tokens} tokens omitted ...]\n{tail}"
+
+
+class TokenBucket:
+    """Thread-safe token bucket that refills continuously at a per-minute rate."""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        """
+        Takes `amount` tokens from the bucket (it may go into debt).
+
+        Returns:
+            float: Seconds the caller has to wait before the reservation is covered.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RateLimiter:
+    """Schedules requests so that both the requests-per-minute and tokens-per-minute budgets are respected."""
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, tokens):
+        """Blocks until one request using `tokens` tokens may be sent."""
+        wait = 0.0
+        if self.request_bucket:
+            wait = max(wait, self.request_bucket.reserve(1))
+        if self.token_bucket:
+            wait = max(wait, self.token_bucket.reserve(tokens))
+        if wait > 0:
+            time.sleep(wait)
+
+
+rate_limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+
+
+def configure_rate_limits(requests_per_minute=0, tokens_per_minute=0):
+    """
+    Replaces the shared rate limiter used by every GPT call.
+
+    Args:
+        requests_per_minute (int): Request budget per minute (0 = unlimited).
+        tokens_per_minute (int): Token budget per minute (0 = unlimited).
+    """
+    global rate_limiter
+    rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+
+request_slots = None  # Caps GPT requests in flight across every pipeline of the process (None = no cap)
+
+
+def configure_concurrency(max_requests=0):
+    """
+    Sets the number of GPT requests that may be in flight at once, shared by every caller in the process.
+
+    Args:
+        max_requests (int): Request limit (0 = unlimited; each pipeline is still bounded by its worker count).
+    """
+    global request_slots
+    request_slots = threading.BoundedSemaphore(max_requests) if max_requests else None
+
+
+class UsageCounter:
+    """Thread-safe totals of the GPT requests made on behalf of one case."""
+
+    def __init__(self):
+        self.requests = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.lock = threading.Lock()
+
+    def add(self, requests=0, cache_hits=0, prompt_tokens=0, completion_tokens=0):
+        with self.lock:
+            self.requests += requests
+            self.cache_hits += cache_hits
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def snapshot(self):
+        with self.lock:
+            return {"requests": self.requests, "cache_hits": self.cache_hits,
+                    "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens}
+
+
+_usage = threading.local()
+
+
+def use_usage_counter(counter):
+    """Counts the GPT requests of the calling thread in `counter` (None stops counting)."""
+    _usage.counter = counter
+
+
+def record_usage(**counts):
+    counter = getattr(_usage, "counter", None)
+    if counter is not None:
+        counter.add(**counts)
+
+
+def is_retryable(error):
+    """Returns True for rate-limit (429), server-side (5xx) and connection errors."""
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    return isinstance(error, openai.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+def backoff_delay(attempt, error=None):
+    """
+    Computes a jittered exponential backoff delay, honouring a Retry-After header when present.
+
+    Args:
+        attempt (int): Zero-based retry attempt.
+        error (Exception): The error that triggered the retry.
+
+    Returns:
+        float: Seconds to sleep.
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after:
+            return float(retry_after) + random.uniform(0, BACKOFF_BASE)
+    except ValueError:
+        pass
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def create_chat_completion(**kwargs):
+    """
+    Sends a chat completion request through the shared rate limiter, retrying 429/5xx errors with backoff.
+
+    Args:
+        **kwargs: Arguments for `client.chat.completions.create`.
+
+    Returns:
+        ChatCompletion: The API response.
+    """
+    prompt_text = "".join(str(message.get("content", "")) for message in kwargs.get("messages", []))
+    max_output = kwargs.get("max_completion_tokens") or kwargs.get("max_tokens") or 0
+    tokens = estimate_tokens(prompt_text) + max_output
+
+    for attempt in range(MAX_RETRIES + 1):
+        rate_limiter.acquire(tokens)
+        started = time.perf_counter()
+        try:
+            with request_slots or contextlib.nullcontext():
+                completion = client.chat.completions.create(**kwargs)
+            usage = getattr(completion, "usage", None)
+            prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+            record_usage(requests=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            metrics.record_llm_request(kwargs.get("model", ""), time.perf_counter() - started, "ok",
+                                       prompt_tokens, completion_tokens)
+            return completion
+        except Exception as e:
+            final = attempt == MAX_RETRIES or not is_retryable(e)
+            metrics.record_llm_request(kwargs.get("model", ""), time.perf_counter() - started,
+                                       "error" if final else "retry")
+            if final:
+                raise
+            delay = backoff_delay(attempt, e)
+            print(f"Retrying GPT request in {delay:.1f}s ({attempt + 1}/{MAX_RETRIES}): {e}")
+            time.sleep(delay)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Returns the shared response cache (opened on first use), or None if caching is disabled."""
+    global _cache
+    if LLM_CACHE_PATH.lower() == "off":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(LLM_CACHE_PATH)
+        return _cache
+
+
+def apply_request_defaults(params):
+    """Applies run-wide request settings (deterministic mode) to the request parameters."""
+    params = dict(params)
+    if DETERMINISTIC:
+        params["temperature"] = 0
+    return params
+
+
+def is_cacheable(params):
+    """Only deterministic requests (temperature 0) may be answered from the cache."""
+    return params.get("temperature") == 0
+
+
+def cache_key(model, messages, params):
+    """Returns the response-cache key of a request (the `store` flag does not affect the answer)."""
+    return LLMCache.make_key(model, messages, {k: v for k, v in params.items() if k != "store"})
+
+
+def chat_completion(model, messages, use_cache=True, validate=None, **params):
+    """
+    Returns the text of a chat completion, answering identical temperature-0 requests from the persistent cache.
+
+    Args:
+        model (str): Model name.
+        messages (list): Chat messages.
+        use_cache (bool): Whether to read from and write to the response cache (sampled requests never are).
+        validate (callable): Called with the response; if it raises, the response is neither cached nor
+            taken from the cache, so asking again makes a new request.
+        **params: Remaining request parameters (temperature, max_tokens, ...).
+
+    Returns:
+        str: The stripped response content.
+    """
+    params = apply_request_defaults(params)
+
+    cache = get_cache() if use_cache and is_cacheable(params) else None
+    key = None
+    if cache:
+        key = cache_key(model, messages, params)
+        cached = cache.get(key)
+        if cached is not None and is_valid(cached, validate):
+            record_usage(cache_hits=1)
+            metrics.record_cache_hit(model)
+            return cached
+
+    completion = create_chat_completion(model=model, messages=messages, **params)
+    response = (completion.choices[0].message.content or "").strip()
+
+    if validate is not None:
+        validate(response)
+    if cache:
+        cache.put(key, model, response)
+    return response
+
+
+def is_valid(response, validate):
+    if validate is None:
+        return True
+    try:
+        validate(response)
+        return True
+    except Exception:
+        return False
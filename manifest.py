@@ -0,0 +1,141 @@
+import os
+import json
+import hashlib
+
+
+MANIFEST_FILE = "serena_manifest.json"
+MANIFEST_VERSION = 4  # 2: corpus store, 3: chat sender windows, 4: lean email bodies
+
+# Case sub-folders holding each stage's outputs
+TEXT_DIR = "text"
+A2P_TEXT_DIR = "A2P-classified-text"
+HTML_DIR = "A2P-classified-html"
+JSON_DIR = "A2P-classified-json"
+
+
+def file_sha256(path):
+    """Returns the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    Per-case record of every input file (content hash, mtime, size) and of the outputs each stage
+    produced for it, so that a re-run only processes new or changed inputs.
+
+    Layout of `serena_manifest.json`:
+        inputs: {input path relative to the case: {"sha256", "mtime", "size", "texts": [text names]}}
+        texts:  {text name: {"source", "classification", "html", "ner"}}
+    Stage values are None until the stage has run for that text; the outputs themselves (including the
+    normalized records) are kept in the case's corpus store (`corpus_store.CorpusStore`).
+    """
+
+    def __init__(self, dir_name, store=None):
+        """
+        Args:
+            dir_name (str): Case folder.
+            store (CorpusStore): Store whose rows are deleted together with removed inputs
+                (and cleared when the manifest is from an earlier version).
+        """
+        self.dir_name = dir_name
+        self.store = store
+        self.path = os.path.join(dir_name, MANIFEST_FILE)
+        self.data = {"version": MANIFEST_VERSION, "inputs": {}, "texts": {}}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.data.update(data)
+                # Earlier manifests also held each text's normalized record, which the store already keeps
+                for entry in self.texts.values():
+                    entry.pop("record", None)
+            else:
+                print("Case manifest is from an earlier version; every input will be processed again.")
+                if store is not None:
+                    store.clear()
+
+    @property
+    def inputs(self):
+        return self.data["inputs"]
+
+    @property
+    def texts(self):
+        return self.data["texts"]
+
+    def save(self):
+        """Writes the manifest atomically so a crash never leaves it half-written."""
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=1)
+        os.replace(self.path + ".tmp", self.path)
+
+    def input_changed(self, rel_path):
+        """
+        Checks whether an input file is new or its content changed since it was last processed.
+
+        The content hash is only computed when the size or mtime differs from the recorded values.
+
+        Returns:
+            str or None: The new content hash if the input must be (re)processed, otherwise None.
+        """
+        full_path = os.path.join(self.dir_name, rel_path)
+        stat = os.stat(full_path)
+        entry = self.inputs.get(rel_path)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return None
+
+        sha256 = file_sha256(full_path)
+        if entry and entry["sha256"] == sha256:
+            entry["mtime"] = stat.st_mtime  # touched but unchanged
+            return None
+        return sha256
+
+    def record_input(self, rel_path, sha256, text_paths):
+        """Records an extracted input together with the text files it produced."""
+        stat = os.stat(os.path.join(self.dir_name, rel_path))
+        text_names = [os.path.basename(path) for path in text_paths]
+        self.inputs[rel_path] = {"sha256": sha256, "mtime": stat.st_mtime, "size": stat.st_size, "texts": text_names}
+        for name in text_names:
+            self.texts[name] = {"source": rel_path, "classification": None, "html": None, "ner": None}
+
+    def output_paths(self, text_name):
+        """Returns every file a text may have in the exported directory layout."""
+        entry = self.texts.get(text_name, {})
+        paths = [os.path.join(self.dir_name, TEXT_DIR, text_name)]
+        if entry.get("classification"):
+            paths.append(os.path.join(self.dir_name, A2P_TEXT_DIR, f"a2p_{text_name}"))
+        if entry.get("html"):
+            paths.append(os.path.join(self.dir_name, HTML_DIR, entry["html"]))
+        if entry.get("ner"):
+            paths.append(os.path.join(self.dir_name, JSON_DIR, entry["ner"]))
+        return paths
+
+    def remove_input(self, rel_path):
+        """Forgets an input and deletes all outputs derived from it (store rows and exported files)."""
+        entry = self.inputs.pop(rel_path, None)
+        if entry and self.store is not None:
+            self.store.delete(entry["texts"])
+        for text_name in entry["texts"] if entry else []:
+            for path in self.output_paths(text_name):
+                if os.path.exists(path):
+                    os.remove(path)
+                    print(f"🗑️ Removed stale output: {path}")
+            self.texts.pop(text_name, None)
+
+    def pending(self, stage):
+        """
+        Lists the texts that still need `stage` ("classification", "html" or "ner").
+
+        HTML conversion and NER only apply to texts classified as A2P.
+        """
+        pending = []
+        for name, entry in self.texts.items():
+            if entry[stage] is not None:
+                continue
+            if stage != "classification" and not entry["classification"]:
+                continue
+            pending.append(name)
+        return sorted(pending)
@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import bisect
+import threading
+from datetime import datetime
+
+
+ENABLED = os.getenv("SERENA_METRICS", "off").lower() not in ("", "0", "off")
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)  # Seconds
+REPORT_NAME = "serena_metrics"  # Reports are written as serena_metrics.json and serena_metrics.prom
+
+# USD per million input / output tokens; models are matched by prefix ("gpt-4o-2024-08-06" -> "gpt-4o").
+# SERENA_MODEL_PRICES='{"model": [input, output]}' adds or overrides prices.
+MODEL_PRICES = {"gpt-4o": (2.50, 10.00), "gpt-4o-mini": (0.15, 0.60), "gpt-4.1": (2.00, 8.00),
+                "gpt-4.1-mini": (0.40, 1.60), "gpt-4.1-nano": (0.10, 0.40)}
+MODEL_PRICES.update({model: tuple(price) for model, price in json.loads(os.getenv("SERENA_MODEL_PRICES", "{}")).items()})
+
+# Name -> (type, help) of every metric, in the order of the Prometheus file
+METRICS = {
+    "stage_seconds": ("histogram", "Wall time of one unit of work of a processing stage."),
+    "stage_items_total": ("counter", "Items processed by a stage."),
+    "stage_wall_seconds": ("gauge", "Time from a stage's first item to the end of a pipeline run, per case."),
+    "llm_request_seconds": ("histogram", "Latency of one GPT request attempt."),
+    "llm_requests_total": ("counter", "GPT request attempts by outcome (ok, retry, error)."),
+    "llm_cache_hits_total": ("counter", "GPT requests answered from the response cache."),
+    "llm_input_tokens_total": ("counter", "Prompt tokens reported by the API."),
+    "llm_output_tokens_total": ("counter", "Completion tokens reported by the API."),
+    "llm_cost_usd_total": ("counter", "Estimated cost of the GPT requests (see MODEL_PRICES)."),
+}
+
+
+def model_price(model):
+    """Returns (input, output) USD per million tokens for a model, or None if it is unknown."""
+    matches = [name for name in MODEL_PRICES if model == name or model.startswith(name + "-")]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and maximum of observed values."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot counts values above every bucket (+Inf)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the maximum for the +Inf bucket)."""
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return round(min(bound, self.max), 6)
+        return round(self.max, 6)
+
+    def summary(self):
+        return {"count": self.count, "sum": round(self.sum, 6),
+                "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "max": round(self.max, 6)}
+
+
+class Registry:
+    """Thread-safe counters and histograms keyed by metric name and labels."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+
+    def increment(self, name, amount, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, labels):
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def report(self):
+        """
+        Builds the JSON run report.
+
+        Returns:
+            dict: stages (per-stage timing summaries and item counts), llm (per-model requests, retries,
+            errors, cache hits, tokens, estimated cost and latency), plus every counter and histogram.
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {key: histogram.summary() for key, histogram in self.histograms.items()}
+
+        stages, models = {}, {}
+        for (name, labels), summary in histograms.items():
+            labels = dict(labels)
+            if name == "stage_seconds":
+                stages.setdefault(labels["stage"], {})["seconds"] = summary
+            elif name == "llm_request_seconds":
+                models.setdefault(labels["model"], {})["latency"] = summary
+        for (name, labels), value in counters.items():
+            labels = dict(labels)
+            if name == "stage_items_total":
+                stages.setdefault(labels["stage"], {}).setdefault("items", {})[labels.get("outcome", "done")] = value
+            elif name.startswith("llm_"):
+                model = models.setdefault(labels["model"], {})
+                field = name[len("llm_"):-len("_total")]
+                if name == "llm_requests_total":
+                    model[labels["outcome"]] = model.get(labels["outcome"], 0) + value
+                else:
+                    model[field] = round(value, 6) if isinstance(value, float) else value
+        for (name, labels), value in gauges.items():
+            labels = dict(labels)
+            if name == "stage_wall_seconds":
+                stages.setdefault(labels["stage"], {}).setdefault("wall_seconds", {})[labels["case"]] = value
+
+        return {
+            "generated": datetime.now().isoformat(timespec="seconds"),
+            "elapsed": round(time.time() - self.started, 3),
+            "stages": stages,
+            "llm": models,
+            "cost_usd": round(sum(model.get("cost_usd", 0.0) for model in models.values()), 6),
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in sorted(counters.items())],
+            "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                       for (name, labels), value in sorted(gauges.items())],
+            "histograms": [{"name": name, "labels": dict(labels), **summary}
+                           for (name, labels), summary in sorted(histograms.items())],
+        }
+
+    def prometheus(self):
+        """Renders every metric in the Prometheus text exposition format (names prefixed with serena_)."""
+        def label_text(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+            return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted((key, (list(h.counts), h.count, h.sum)) for key, h in self.histograms.items())
+
+        lines = []
+        for metric, (kind, help_text) in METRICS.items():
+            name = f"serena_{metric}"
+            source = {"counter": counters, "gauge": gauges, "histogram": histograms}[kind]
+            series = [(labels, value) for (key, labels), value in source if key == metric]
+            if not series:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for labels, value in series:
+                if kind != "histogram":
+                    lines.append(f"{name}{label_text(labels)} {value}")
+                    continue
+                counts, count, total = value
+                cumulative = 0
+                for bound, bucket_count in zip([*LATENCY_BUCKETS, "+Inf"], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{label_text(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{label_text(labels)} {total}")
+                lines.append(f"{name}_count{label_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class Timer:
+    """Context manager that observes its duration in `stage_seconds` and counts one item per stage."""
+
+    __slots__ = ("stage", "items", "started")
+
+    def __init__(self, stage, items):
+        self.stage = stage
+        self.items = items
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        registry.observe("stage_seconds", time.perf_counter() - self.started, {"stage": self.stage})
+        registry.increment("stage_items_total", self.items, {"stage": self.stage,
+                                                             "outcome": "error" if exc_type else "done"})
+        return False
+
+
+class NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+def enable(enabled=True):
+    """Turns recording on or off for the whole process (SERENA_METRICS sets the initial state)."""
+    global ENABLED
+    ENABLED = enabled
+
+
+def stage_timer(stage, items=1):
+    """
+    Times one unit of work of a stage:
+
+        with metrics.stage_timer("classification", items=len(batch)):
+            ...
+
+    Returns a shared no-op context manager when metrics are disabled.
+    """
+    return Timer(stage, items) if ENABLED else NULL_TIMER
+
+
+def observe_stage(stage, seconds, items=1, error=False):
+    """Records a unit of work that was timed elsewhere (e.g. in a worker process)."""
+    if ENABLED:
+        registry.observe("stage_seconds", seconds, {"stage": stage})
+        registry.increment("stage_items_total", items, {"stage": stage, "outcome": "error" if error else "done"})
+
+
+def set_stage_wall_time(stage, case, seconds):
+    if ENABLED:
+        registry.set("stage_wall_seconds", seconds, {"stage": stage, "case": case})
+
+
+def record_llm_request(model, seconds, outcome="ok", prompt_tokens=0, completion_tokens=0):
+    """
+    Records one GPT request attempt.
+
+    Args:
+        model (str): Requested model.
+        seconds (float): Latency of the attempt.
+        outcome (str): "ok", "retry" (failed and retried) or "error" (failed for good).
+        prompt_tokens (int): Input tokens reported in `completion.usage`.
+        completion_tokens (int): Output tokens reported in `completion.usage`.
+    """
+    if not ENABLED:
+        return
+    labels = {"model": model}
+    registry.observe("llm_request_seconds", seconds, labels)
+    registry.increment("llm_requests_total", 1, {**labels, "outcome": outcome})
+    if prompt_tokens or completion_tokens:
+        registry.increment("llm_input_tokens_total", prompt_tokens, labels)
+        registry.increment("llm_output_tokens_total", completion_tokens, labels)
+        price = model_price(model)
+        if price is not None:
+            registry.increment("llm_cost_usd_total",
+                               (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000, labels)
+
+
+def record_cache_hit(model):
+    if ENABLED:
+        registry.increment("llm_cache_hits_total", 1, {"model": model})
+
+
+def write_reports(path_prefix):
+    """
+    Writes `<path_prefix>.json` (run report) and `<path_prefix>.prom` (Prometheus text format,
+    e.g. for node_exporter's textfile collector).
+
+    Returns:
+        tuple: (JSON path, Prometheus path)
+    """
+    json_path, prometheus_path = f"{path_prefix}.json", f"{path_prefix}.prom"
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(registry.report(), f, ensure_ascii=False, indent=2)
+    # Written under a temporary name first so collectors never read a partial file
+    with open(prometheus_path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(registry.prometheus())
+    os.replace(prometheus_path + ".tmp", prometheus_path)
+    return json_path, prometheus_path
@@ -0,0 +1,212 @@
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+A2P_KEYWORDS = re.compile(r"\b(order|receipt|payment|shipped|booking|confirm\w*|transaction|tracking|invoice|ticket)\b",
+                          re.IGNORECASE)
+BATCH_MESSAGE = re.compile(r"^### MESSAGE (\S+)\n(.*?)(?=^### MESSAGE |\Z)", re.MULTILINE | re.DOTALL)
+AMOUNT = re.compile(r"(?:USD|\$)\s?\d[\d,]*(?:\.\d{2})?")
+DATE = re.compile(r"\b(?:January|February|March|April|May|June|July|August|September|October|November|December)"
+                  r" \d{1,2}, \d{4}(?:,? \d{1,2}:\d{2})?")
+SERVICE = re.compile(r"(?:From: ([^<\n]+?) <|thank you for shopping with (\w+)|booking with (\w+)|payment of [^\n]+ to (\w+)"
+                     r"|^\[(\w+)\]|, (\w+?)Official: )", re.IGNORECASE | re.MULTILINE)
+PHONE = re.compile(r"\+?\d[\d\- ]{8,}\d")
+
+
+def is_a2p(text):
+    return bool(A2P_KEYWORDS.search(text))
+
+
+def extract_fields(text):
+    """Deterministic stand-in for GPT keyword extraction (regular expressions over the message)."""
+    service = SERVICE.search(text)
+    amount = AMOUNT.search(text)
+    dates = DATE.findall(text)
+    keyword = A2P_KEYWORDS.search(text)
+    phone = PHONE.search(text)
+    return {
+        "service_name": next((group for group in service.groups() if group), "NULL").strip() if service else "NULL",
+        "action_datetime": dates[-1] if dates else "NULL",
+        "message_datetime": dates[0] if dates else "NULL",
+        "action_keyword": keyword.group(1).lower() if keyword else "NULL",
+        "address1": "NULL",
+        "address2": "NULL",
+        "amount": amount.group(0) if amount else "NULL",
+        "item": "NULL",
+        "mobile_number": phone.group(0) if phone else "NULL",
+    }
+
+
+def answer(body):
+    """
+    Builds the assistant message for a chat completion request, recognizing SERENA's prompts.
+
+    Returns:
+        str: Batched or single classification verdicts, extraction JSON, normalization JSON or "OK".
+    """
+    messages = body.get("messages", [])
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    wants_json = (body.get("response_format") or {}).get("type") in ("json_object", "json_schema")
+
+    if "### MESSAGE" in system:
+        verdicts = [{"id": message_id, "label": "A2P" if is_a2p(text) else "P2P"}
+                    for message_id, text in BATCH_MESSAGE.findall(user)]
+        return json.dumps({"verdicts": verdicts})
+    if "classifying" in system:
+        return "This is A2P." if is_a2p(user) else "This is P2P."
+    if "extracting keywords" in system:
+        fields = json.dumps(extract_fields(user), ensure_ascii=False)
+        return fields if wants_json else f"```json\n{fields}\n```"
+    if "normalizing" in system:
+        try:
+            return json.dumps({value_id: "" for value_id in json.loads(user)})
+        except (ValueError, TypeError):
+            return "{}"
+    return "{}" if wants_json else "OK"
+
+
+class MockOpenAIServer:
+    """
+    Local OpenAI-compatible chat completions endpoint for benchmarks and offline runs.
+
+    Point SERENA at it with OPENAI_BASE_URL=<server.url>. Each request waits `latency` seconds plus up to
+    `jitter`; a share of `error_rate` requests fails with HTTP 500 and a share of `throttle_rate` with 429,
+    and with `requests_per_minute` set, requests above that rate get 429 with a Retry-After header.
+    Responses are deterministic for a given request, and token usage is reported as characters / 4.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 requests_per_minute=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+        self.stats = {"requests": 0, "errors": 0, "throttled": 0}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                server.handle(self)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def draw(self):
+        """Returns (delay, failure status or None, Retry-After seconds) for one request."""
+        with self.lock:
+            self.stats["requests"] += 1
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+            roll = self.random.random()
+            if roll < self.error_rate:
+                self.stats["errors"] += 1
+                return delay, 500, None
+            if roll < self.error_rate + self.throttle_rate:
+                self.stats["throttled"] += 1
+                return 0.0, 429, 0.1
+            if self.interval:
+                now = time.monotonic()
+                if now < self.next_slot:
+                    self.stats["throttled"] += 1
+                    return 0.0, 429, round(self.next_slot - now, 3)
+                self.next_slot = max(self.next_slot, now) + self.interval
+            return delay, None, None
+
+    def handle(self, request):
+        try:
+            body = json.loads(request.rfile.read(int(request.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            return self.respond(request, 400, {"error": {"message": "invalid JSON"}})
+        if not request.path.rstrip("/").endswith("/chat/completions"):
+            return self.respond(request, 404, {"error": {"message": f"unknown endpoint {request.path}"}})
+
+        delay, status, retry_after = self.draw()
+        if delay:
+            time.sleep(delay)
+        if status == 429:
+            return self.respond(request, 429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                {"retry-after": str(retry_after)})
+        if status:
+            return self.respond(request, status, {"error": {"message": "The server had an error"}})
+
+        content = answer(body)
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in body.get("messages", [])) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        self.respond(request, 200, {
+            "id": f"chatcmpl-mock-{self.stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    @staticmethod
+    def respond(request, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra seconds per request.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with HTTP 500.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests failing with HTTP 429.")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before 429 responses (0 = no limit).")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    server = MockOpenAIServer(args.host, args.port, args.latency, args.jitter, args.error_rate, args.throttle_rate,
+                              args.rpm, args.seed)
+    print(f"Mock OpenAI server listening on {server.url} (set OPENAI_BASE_URL to this URL).")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"Served {server.stats}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,166 @@
 import os
 import re
 import json
-from openai import OpenAI
+from llm_client import chat_completion, truncate_to_tokens, MODEL, TEMPERATURE
+from normalization import normalize_records
+from dedup import dedup_records
+from field_patterns import extract_structured_fields
+from structured_output import json_schema_format, parse_json_object
+import metrics
+
+
+# GPT prompt for keyword extraction
+EXTRACTION_PROMPT = (
+    "You are an expert in extracting keywords from text messages, emails, and messenger apps "
+    "to infer user actions. Extract the following fields and return JSON output:\n\n"
+    "- service_name\n- action_datetime\n- message_datetime\n- action_keyword\n"
+    "- address1\n- address2\n- amount\n- item\n- mobile_number\n\n"
+    "Rules:\n"
+    "- If a value is not found, insert NULL.\n"
+    "- Extract dates exactly as they appear.\n"
+    "- If multiple payments exist, extract only the highest one.\n"
+    "- If multiple ordered items are found, include all items as a list."
+)
+
+# "hybrid" fills dates, amounts and phone numbers locally and asks GPT for the remaining fields; "llm" asks GPT for all
+NER_MODE = os.getenv("SERENA_NER_MODE", "hybrid").lower()
+FIELDS = ["service_name", "action_datetime", "message_datetime", "action_keyword", "address1", "address2", "amount",
+          "item", "mobile_number"]
+MAX_COMPLETION_TOKENS = 2048
+HYBRID_MAX_COMPLETION_TOKENS = 512  # Only the semantic fields are generated in hybrid mode
+EXTRACTION_ATTEMPTS = 2  # Requests per message when the response is not readable JSON
+
+# JSON schema of each field for structured outputs ("NULL" marks a missing value)
+FIELD_SCHEMAS = {field: {"type": "string"} for field in FIELDS}
+FIELD_SCHEMAS["item"] = {"anyOf": [{"type": "string"}, {"type": "array", "items": {"type": "string"}}]}
+
+# GPT prompt for the fields left after local extraction ({fields} is the list of fields requested)
+HYBRID_EXTRACTION_PROMPT = (
+    "You are an expert in extracting keywords from text messages, emails, and messenger apps "
+    "to infer user actions. Extract the following fields and return JSON output:\n\n"
+    "{fields}\n\n"
+    "Rules:\n"
+    "- If a value is not found, insert NULL.\n"
+    "- If multiple ordered items are found, include all items as a list.\n"
+    "- DETECTED VALUES after the message were found by pattern matching; reference IDs are not items."
+)
+ACTION_DATETIME_FIELD = "- action_datetime (copy one of the DETECTED VALUES dates)"
+
+
+def request_params(fields, max_completion_tokens):
+    """Token limit and, unless SERENA_STRUCTURED_OUTPUTS is off, a strict JSON schema of the requested fields."""
+    params = {"max_completion_tokens": max_completion_tokens}
+    response_format = json_schema_format("extracted_record", {field: FIELD_SCHEMAS[field] for field in fields})
+    if response_format is not None:
+        params["response_format"] = response_format
+    return params
+
+
+def extraction_request(content):
+    """
+    Builds the GPT messages for keyword extraction of one message text.
+
+    In hybrid mode (SERENA_NER_MODE, default), dates, amounts and phone numbers are extracted locally
+    (see `field_patterns`) and passed to GPT as hints, and GPT only returns the other fields.
+
+    Args:
+        content (str): Message text.
+
+    Returns:
+        tuple: (messages, request parameters (token limit, response format),
+                locally extracted fields or None in "llm" mode)
+    """
+    if NER_MODE == "llm":
+        return ([{"role": "system", "content": EXTRACTION_PROMPT},
+                 {"role": "user", "content": truncate_to_tokens(content)}],
+                request_params(FIELDS, MAX_COMPLETION_TOKENS), None)
+
+    local_fields, hints = extract_structured_fields(content)
+    requested = [field for field in FIELDS if field not in local_fields]
+    field_list = "\n".join(ACTION_DATETIME_FIELD if field == "action_datetime" else f"- {field}" for field in requested)
+    user_content = truncate_to_tokens(content)
+    if hints:
+        user_content += "\n\n### DETECTED VALUES\n" + "\n".join(f"{kind}: {' | '.join(values)}"
+                                                             for kind, values in hints.items())
+    return ([{"role": "system", "content": HYBRID_EXTRACTION_PROMPT.format(fields=field_list)},
+             {"role": "user", "content": user_content}],
+            request_params(requested, HYBRID_MAX_COMPLETION_TOKENS), local_fields)
+
 
+def local_extraction(content):
+    """Locally extracted fields of a message text (as in `extraction_request`), or None in "llm" mode."""
+    return None if NER_MODE == "llm" else extract_structured_fields(content)[0]
 
-# Read API key from environment variables
-api_key = os.getenv("OPENAI_API_KEY")
 
-# Initiate OpenAI client
-client = OpenAI(api_key=api_key)
+def parse_extraction_response(gpt_response, file_path, local_fields=None):
+    """
+    Parses the JSON returned for keyword extraction and attaches the source file path.
+
+    Args:
+        gpt_response (str): Model response.
+        file_path (str): Source text file.
+        local_fields (dict): Fields extracted locally in hybrid mode; they take precedence over the response.
+
+    Returns:
+        dict: Extracted fields with `source_path`.
+
+    Raises:
+        ValueError: If the response has no readable JSON object.
+    """
+    data = parse_json_object(gpt_response)
+    if local_fields is not None:
+        data = {field: local_fields[field] if field in local_fields else data.get(field, "NULL") for field in FIELDS}
+
+    # Validate and log extracted items
+    if isinstance(data.get("item"), list):
+        print(f"Extracted items: {data['item']}")
+    else:
+        print("No items found or invalid format.")
+
+    # Attach source file path
+    data["source_path"] = file_path
+
+    return data
+
+
+def extract_entities(content, source_path):
+    """
+    Extracts relevant keywords from a message text using the GPT model.
+
+    Args:
+        content (str): Message text.
+        source_path (str): Path recorded as the record's "source_path".
+
+    Returns:
+        dict: Extracted keywords, or {"source_path", "error"} if the request failed.
+    """
+    error = None
+    for attempt in range(EXTRACTION_ATTEMPTS):
+        try:
+            messages, params, local_fields = extraction_request(content)
+
+            # Call GPT model (identical inputs are answered from the response cache, unless unreadable)
+            with metrics.stage_timer("ner"):
+                gpt_response = chat_completion(
+                    model=MODEL,
+                    store=True,
+                    messages=messages,
+                    temperature=TEMPERATURE,
+                    validate=parse_json_object,
+                    **params,
+                )
+
+            # Parse GPT response
+            return parse_extraction_response(gpt_response, source_path, local_fields)
+        except ValueError as e:
+            # Only this message is asked again
+            error = e
+            print(f"Unreadable extraction response for {os.path.basename(source_path)} "
+                  f"(attempt {attempt + 1}/{EXTRACTION_ATTEMPTS}): {e}")
+        except Exception as e:
+            return {"source_path": source_path, "error": str(e)}
+    return {"source_path": source_path, "error": str(error)}
+
 
 def process_text_with_gpt(file_path):
     """Process text file using GPT model to extract relevant keywords."""
@@ -17,89 +169,17 @@ def process_text_with_gpt(file_path):
         # Read file content
         with open(file_path, "r", encoding="utf-8") as file:
             content = file.read()
-
-        # GPT prompt for keyword extraction
-        prompt = {
-            "role": "system",
-            "content": (
-                "You are an expert in extracting keywords from text messages, emails, and messenger apps "
-                "to infer user actions. Extract the following fields and return JSON output:\n\n"
-                "- service_name\n- action_datetime\n- message_datetime\n- action_keyword\n"
-                "- address1\n- address2\n- amount\n- item\n- mobile_number\n\n"
-                "Rules:\n"
-                "- If a value is not found, insert NULL.\n"
-                "- Extract dates exactly as they appear.\n"
-                "- If multiple payments exist, extract only the highest one.\n"
-                "- If multiple ordered items are found, include all items as a list."
-            )
-        }
-
-        # Call GPT model
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            store=True,
-            messages=[prompt, {"role": "user", "content": content}],
-            temperature=0.65,
-            max_completion_tokens=2048,
-        )
-
-        # Parse GPT response
-        gpt_response = completion.choices[0].message.content.strip()
-        data = json.loads(gpt_response.strip("```json").strip())
-
-        # Validate and log extracted items
-        if isinstance(data.get("item"), list):
-            print(f"Extracted items: {data['item']}")
-        else:
-            print("No items found or invalid format.")
-
-        # Attach source file path
-        data["source_path"] = file_path
-
-        return data
     except Exception as e:
         return {"source_path": file_path, "error": str(e)}
+    return extract_entities(content, file_path)
 
 
 def normalize_json_data(json_data):
     """
-    Uses GPT API to normalize JSON fields (dates, currency).
+    Normalizes JSON fields (dates, currency) with the local normalizer; GPT is only asked for
+    values it cannot parse.
     """
-    try:
-        prompt = {
-            "role": "system",
-            "content": (
-                "You are an expert in formatting and normalizing JSON data. "
-                "You will receive a JSON object containing fields such as dates and amounts. "
-                "Your task is to:\n"
-                "- Convert dates to format: YYYY/MM/DD HH:MM:ss.\n"
-                "- Ensure missing values are empty (\"\").\n"
-                "- Format amount fields with currency codes (e.g., 'USD 100', 'AUD 50').\n"
-                "- Return the updated JSON with all fields properly formatted."
-            )
-        }
-
-        # Send data to GPT API
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[prompt, {"role": "user", "content": json.dumps(json_data)}],
-            temperature=0,
-            max_tokens=1000,
-        )
-
-        # Parse response
-        gpt_response = completion.choices[0].message.content.strip()
-        match = re.search(r"```json\s*(\{.*?\})\s*```", gpt_response, re.DOTALL)
-        if match:
-            json_str = match.group(1)
-            normalized_data = json.loads(json_str)
-            return normalized_data
-        else:
-            raise ValueError("Cannot find JSON code block")
-
-    except Exception as e:
-        print(f"Error normalizing JSON: {e}")
-        return json_data  # Return original if GPT fails
+    return normalize_records([json_data])[0]
 
 
 
@@ -123,6 +203,60 @@ def save_cache(data):
 
 
 
+def extract_keywords_from_texts(messages):
+    """
+    Extracts and normalizes keywords from message texts.
+
+    Args:
+        messages (list): (source path, text) tuples of A2P messages.
+
+    Returns:
+        dict: Source path -> (raw JSON, normalized JSON)
+    """
+    extracted = []
+    for source_path, content in messages:
+        print(f"✅ Processing text: {os.path.basename(source_path)}")
+
+        extracted_json = extract_entities(content, source_path)
+        if not extracted_json:
+            continue
+        extracted.append((source_path, extracted_json))
+
+    # ✅ Normalize all extracted JSON in one pass
+    normalized_json_list = normalize_records([extracted_json for _, extracted_json in extracted])
+    return {source_path: (extracted_json, normalized_json)
+            for (source_path, extracted_json), normalized_json in zip(extracted, normalized_json_list)}
+
+
+def extract_keywords_from_files(file_paths, output_directory):
+    """
+    Extracts keywords from the given text files and saves raw JSON for highlighting.
+
+    Args:
+        file_paths (list): Paths of A2P text files.
+        output_directory (str): Directory for the raw JSON files.
+
+    Returns:
+        dict: File path -> (raw JSON path, normalized JSON)
+    """
+    os.makedirs(output_directory, exist_ok=True)
+
+    messages = []
+    for file_path in file_paths:
+        with open(file_path, "r", encoding="utf-8") as file:
+            messages.append((file_path, file.read()))
+
+    results = {}
+    for file_path, (extracted_json, normalized_json) in extract_keywords_from_texts(messages).items():
+        # ✅ Save raw JSON for HTML highlighting
+        raw_output_path = os.path.join(output_directory, f"raw_{os.path.basename(file_path)}.json")
+        with open(raw_output_path, "w", encoding="utf-8") as raw_file:
+            json.dump(extracted_json, raw_file, ensure_ascii=False, indent=4)
+        print(f"✅ Raw JSON saved for highlighting: {raw_output_path}")
+        results[file_path] = (raw_output_path, normalized_json)
+    return results
+
+
 def extract_keywords(input_directories, output_directory):
     """Extracts keywords from text files, saves raw JSON, and returns normalized JSON."""
     # ✅ Load previously cached data
@@ -142,29 +276,10 @@ def extract_keywords(input_directories, output_directory):
             #print("⚠ No .txt files found, returning cached data.")
             return normalized_json_list  # ✅ Return previous cache if no new files
 
-        for file_name in txt_files:
-            file_path = os.path.join(directory, file_name)
-            print(f"✅ Processing text file: {file_name}")
-
-            # Extract JSON from text file
-            extracted_json = process_text_with_gpt(file_path)
-
-            if not extracted_json:
-                #print(f"⚠ Skipping file (extraction failed): {file_name}")
-                continue
-
-            # ✅ Save raw JSON for HTML highlighting
-            raw_output_path = os.path.join(output_directory, f"raw_{file_name}.json")
-            with open(raw_output_path, "w", encoding="utf-8") as raw_file:
-                json.dump(extracted_json, raw_file, ensure_ascii=False, indent=4)
-            print(f"✅ Raw JSON saved for highlighting: {raw_output_path}")
-
-            # ✅ Normalize extracted JSON
-            normalized_json = normalize_json_data(extracted_json)
-
-            # ✅ Prevent duplicate entries
-            if normalized_json not in normalized_json_list:
-                normalized_json_list.append(normalized_json)
+        results = extract_keywords_from_files([os.path.join(directory, f) for f in txt_files], output_directory)
+        # ✅ Prevent duplicate entries (hash lookup instead of comparing with every cached record)
+        normalized_json_list = dedup_records([normalized_json for _, normalized_json in results.values()],
+                                             normalized_json_list)
 
     # ✅ Save updated data to cache
     save_cache(normalized_json_list)
@@ -0,0 +1,369 @@
+import re
+import json
+from datetime import datetime, timedelta, timezone
+from llm_client import chat_completion, MODEL
+from structured_output import json_schema_format, parse_json_object
+import metrics
+
+try:
+    from dateutil import parser as dateutil_parser
+except ImportError:  # python-dateutil is optional; the built-in formats cover the common cases
+    dateutil_parser = None
+
+
+DATETIME_FIELDS = ("action_datetime", "message_datetime")
+AMOUNT_FIELDS = ("amount",)
+OUTPUT_DATETIME_FORMAT = "%Y/%m/%d %H:%M:%S"
+NORMALIZED_DATETIME = re.compile(r"^\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}$")
+NORMALIZED_AMOUNT = re.compile(r"^[A-Z]{3} -?\d+(\.\d+)?$")
+
+GPT_ATTEMPTS = 2  # Values without a valid answer are sent once more, on their own
+
+NULL_VALUES = {"", "null", "none", "nan", "n/a", "na", "-", "unknown", "not found", "not available"}
+
+# Timezone abbreviations commonly found in receipts and notifications
+TIMEZONE_OFFSETS = {
+    "UTC": 0, "GMT": 0, "Z": 0, "WET": 0, "BST": 1, "CET": 1, "CEST": 2, "EET": 2, "EEST": 3,
+    "IST": 5.5, "SGT": 8, "HKT": 8, "KST": 9, "JST": 9, "AEST": 10, "AEDT": 11, "NZST": 12, "NZDT": 13,
+    "EST": -5, "EDT": -4, "CST": -6, "CDT": -5, "MST": -7, "MDT": -6, "PST": -8, "PDT": -7,
+    "AKST": -9, "AKDT": -8, "HST": -10,
+}
+
+# Currency symbols and words; longer prefixes are matched first
+CURRENCY_SYMBOLS = [
+    ("US$", "USD"), ("AU$", "AUD"), ("A$", "AUD"), ("CA$", "CAD"), ("C$", "CAD"), ("NZ$", "NZD"),
+    ("HK$", "HKD"), ("S$", "SGD"), ("R$", "BRL"), ("$", "USD"), ("€", "EUR"), ("£", "GBP"), ("¥", "JPY"),
+    ("₩", "KRW"), ("₹", "INR"), ("₽", "RUB"), ("₺", "TRY"), ("₱", "PHP"), ("฿", "THB"), ("元", "CNY"),
+    ("원", "KRW"), ("円", "JPY"),
+]
+CURRENCY_WORDS = {
+    "dollar": "USD", "dollars": "USD", "euro": "EUR", "euros": "EUR", "pound": "GBP", "pounds": "GBP",
+    "won": "KRW", "yen": "JPY", "rmb": "CNY", "yuan": "CNY", "rupee": "INR", "rupees": "INR",
+}
+CURRENCY_CODES = {
+    "USD", "EUR", "GBP", "JPY", "KRW", "CNY", "AUD", "CAD", "NZD", "HKD", "SGD", "CHF", "SEK", "NOK", "DKK",
+    "INR", "BRL", "MXN", "RUB", "TRY", "PHP", "THB", "TWD", "VND", "IDR", "MYR", "ZAR", "AED", "SAR", "PLN",
+}
+
+WEEKDAY = re.compile(r"\b(mon|tue|tues|wed|thu|thur|thurs|fri|sat|sun)(day|sday|nesday|rsday|urday)?\b\.?,?",
+                     re.IGNORECASE)
+ORDINAL = re.compile(r"\b(\d{1,2})(st|nd|rd|th)\b", re.IGNORECASE)
+LEADING_MERIDIEM = re.compile(r"\b(AM|PM)\s+(\d{1,2}:\d{2}(?::\d{2})?)", re.IGNORECASE)
+TZ_OFFSET = re.compile(r"(?:\b(?:UTC|GMT))?\s*([+-])(\d{1,2}):?(\d{2})?\s*$")
+TZ_NAME = re.compile(r"\(?\b(" + "|".join(sorted(TIMEZONE_OFFSETS, key=len, reverse=True)) + r")\b\)?\s*$")
+DATE_RANGE = re.compile(r"\b\d{1,2}\s*(?:-|–|~|to)\s*\d{1,2}\b(?![-/.:]\d)")
+NUMBER = re.compile(r"-?\d[\d,.' ]*\d|-?\d")
+
+DATE_FORMATS = [
+    "%Y-%m-%d", "%Y/%m/%d", "%Y.%m.%d", "%Y %m %d", "%m/%d/%Y", "%m/%d/%y", "%m-%d-%Y", "%d.%m.%Y",
+    "%B %d %Y", "%b %d %Y", "%d %B %Y", "%d %b %Y", "%d-%b-%Y", "%d-%b-%y", "%b. %d %Y", "%Y %B %d",
+]
+YEARLESS_DATE_FORMATS = ["%B %d", "%b %d", "%d %B", "%d %b", "%m/%d"]
+TIME_FORMATS = ["", " %H:%M:%S", " %H:%M", " %I:%M:%S %p", " %I:%M %p", " %I %p", " %I%p", " %I:%M%p"]
+
+
+def is_null(value):
+    """Returns True for values that mean 'not found' (None, NULL, N/A, empty, ...)."""
+    return value is None or (isinstance(value, str) and value.strip().lower() in NULL_VALUES)
+
+
+def split_timezone(text):
+    """
+    Removes a trailing timezone (offset or abbreviation) from a date string.
+
+    Returns:
+        tuple: (text without timezone, tzinfo or None)
+    """
+    match = TZ_NAME.search(text)
+    if match:
+        hours = TIMEZONE_OFFSETS[match.group(1).upper()]
+        return text[:match.start()].strip(), timezone(timedelta(hours=hours))
+    match = TZ_OFFSET.search(text)
+    if match and re.search(r"\d{1,2}:\d{2}", text[:match.start()]):
+        sign = -1 if match.group(1) == "-" else 1
+        offset = timedelta(hours=int(match.group(2)), minutes=int(match.group(3) or 0))
+        return text[:match.start()].strip(), timezone(sign * offset)
+    return text, None
+
+
+def clean_datetime_text(text):
+    """Canonicalises separators, weekdays, ordinals and AM/PM markers before parsing."""
+    text = text.strip()
+    text = text.replace("오전", "AM").replace("오후", "PM")
+    text = re.sub(r"\b([ap])\.\s?m\.", lambda m: m.group(1).upper() + "M", text, flags=re.IGNORECASE)
+    text = WEEKDAY.sub(" ", text)
+    text = ORDINAL.sub(r"\1", text)
+    text = re.sub(r"\s+(at|@)\s+", " ", text, flags=re.IGNORECASE)
+    text = LEADING_MERIDIEM.sub(r"\2 \1", text)
+    text = text.replace(",", " ")
+    text = re.sub(r"(\d)T(\d)", r"\1 \2", text)
+    text = re.sub(r"(\d{1,2}:\d{2}:\d{2})\.\d+", r"\1", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def parse_datetime(value, reference=None):
+    """
+    Parses a date/time string written in any of the common formats.
+
+    Args:
+        value (str): Date string as it appears in the message.
+        reference (datetime): Supplies the year for dates written without one.
+
+    Returns:
+        datetime or None: Parsed value (timezone-aware if the string carried a timezone).
+    """
+    text, tzinfo = split_timezone(clean_datetime_text(value))
+    if not re.search(r"\d", text):
+        return None
+
+    try:
+        parsed = datetime.fromisoformat(text)
+        return parsed if parsed.tzinfo or not tzinfo else parsed.replace(tzinfo=tzinfo)
+    except ValueError:
+        pass
+
+    for date_format in DATE_FORMATS:
+        for time_format in TIME_FORMATS:
+            try:
+                parsed = datetime.strptime(text, date_format + time_format)
+                return parsed.replace(tzinfo=tzinfo) if tzinfo else parsed
+            except ValueError:
+                continue
+
+    if reference is not None:
+        for date_format in YEARLESS_DATE_FORMATS:
+            for time_format in TIME_FORMATS:
+                try:
+                    parsed = datetime.strptime(f"{reference.year} {text}", "%Y " + date_format + time_format)
+                    return parsed.replace(tzinfo=tzinfo) if tzinfo else parsed
+                except ValueError:
+                    continue
+
+    if dateutil_parser is not None and re.search(r"\b\d{4}\b", text) and not DATE_RANGE.search(text):
+        try:
+            parsed = dateutil_parser.parse(text)
+            return parsed.replace(tzinfo=tzinfo) if tzinfo and not parsed.tzinfo else parsed
+        except (ValueError, OverflowError):
+            pass
+    return None
+
+
+def normalize_datetime(value, reference=None, target_tz=None):
+    """
+    Formats a date string as YYYY/MM/DD HH:MM:ss.
+
+    Args:
+        value (str): Date string.
+        reference (datetime): Supplies the year for dates written without one.
+        target_tz (tzinfo): Convert timezone-aware values to this timezone; by default the wall
+            time written in the message is kept.
+
+    Returns:
+        str or None: Normalized value, "" for NULL-like input, None if it cannot be parsed.
+    """
+    if is_null(value):
+        return ""
+    if not isinstance(value, str):
+        return None
+    if NORMALIZED_DATETIME.match(value.strip()):
+        return value.strip()
+
+    parsed = parse_datetime(value, reference)
+    if parsed is None:
+        return None
+    if target_tz is not None and parsed.tzinfo is not None:
+        parsed = parsed.astimezone(target_tz)
+    return parsed.strftime(OUTPUT_DATETIME_FORMAT)
+
+
+def parse_number(text):
+    """Parses a number written with thousands separators or a decimal comma ('1,234.50', '1.234,50')."""
+    text = text.replace(" ", "").replace("'", "")
+    if "," in text and "." in text:
+        text = text.replace(".", "").replace(",", ".") if text.rfind(",") > text.rfind(".") else text.replace(",", "")
+    elif "," in text:
+        head, _, tail = text.rpartition(",")
+        text = text.replace(",", "") if len(tail) == 3 else f"{head.replace(',', '')}.{tail}"
+    elif text.count(".") > 1:
+        text = text.replace(".", "")
+    float(text)
+    return text
+
+
+def detect_currency(text):
+    """Returns the ISO currency code written in an amount string, or None."""
+    for code in re.findall(r"\b[A-Z]{3}\b", text.upper()):
+        if code in CURRENCY_CODES:
+            return code
+    for symbol, code in CURRENCY_SYMBOLS:
+        if symbol in text:
+            return code
+    for word in re.findall(r"[a-z]+", text.lower()):
+        if word in CURRENCY_WORDS:
+            return CURRENCY_WORDS[word]
+    return None
+
+
+def normalize_amount(value):
+    """
+    Formats an amount as '<ISO code> <number>' (e.g. '$18.00 USD' -> 'USD 18.00').
+
+    Returns:
+        str or None: Normalized value, "" for NULL-like input, None if the amount or currency is ambiguous.
+    """
+    if is_null(value):
+        return ""
+    if isinstance(value, (int, float)):
+        return None
+    if not isinstance(value, str):
+        return None
+    if NORMALIZED_AMOUNT.match(value.strip()):
+        return value.strip()
+
+    numbers = NUMBER.findall(value)
+    currency = detect_currency(value)
+    if len(numbers) != 1 or currency is None:
+        return None
+    try:
+        return f"{currency} {parse_number(numbers[0])}"
+    except ValueError:
+        return None
+
+
+def normalize_value(value):
+    """Canonicalises NULL-like values to "" and strips strings; lists drop NULL entries."""
+    if isinstance(value, list):
+        return [normalize_value(v) for v in value if not is_null(v)]
+    if is_null(value):
+        return ""
+    return value.strip() if isinstance(value, str) else value
+
+
+def normalize_record(record, target_tz=None):
+    """
+    Normalizes one extracted record locally.
+
+    Args:
+        record (dict): Record returned by keyword extraction.
+        target_tz (tzinfo): Optional timezone to convert aware datetimes to.
+
+    Returns:
+        tuple: (normalized record, {field: raw value} for values that could not be parsed)
+    """
+    normalized, unresolved = {}, {}
+    reference = None
+    if isinstance(record.get("message_datetime"), str) and not is_null(record["message_datetime"]):
+        reference = parse_datetime(record["message_datetime"])
+
+    for key, value in record.items():
+        if key in DATETIME_FIELDS:
+            result = normalize_datetime(value, reference, target_tz)
+        elif key in AMOUNT_FIELDS:
+            result = normalize_amount(value)
+        else:
+            result = normalize_value(value)
+
+        if result is None:
+            unresolved[key] = value
+            result = value
+        normalized[key] = result
+    return normalized, unresolved
+
+
+def normalize_values_with_gpt(values):
+    """
+    Asks GPT to normalize only the values the local parser could not handle.
+
+    Args:
+        values (dict): ID -> {"field": ..., "value": ..., "message_datetime": ...}
+
+    Returns:
+        dict: ID -> normalized string (invalid answers are dropped).
+    """
+    prompt = {
+        "role": "system",
+        "content": (
+            "You are an expert in formatting and normalizing values extracted from messages. "
+            "You will receive a JSON object mapping IDs to a field name, its raw value and the message date. "
+            "Your task is to:\n"
+            "- Convert dates to format: YYYY/MM/DD HH:MM:ss (use the message date for a missing year).\n"
+            "- Format amount fields with currency codes (e.g., 'USD 100', 'AUD 50').\n"
+            "- Use an empty string (\"\") if a value cannot be normalized.\n"
+            "- Return only a JSON object mapping every ID to its normalized string."
+        )
+    }
+    params = {"max_tokens": 40 * len(values) + 50}
+    response_format = json_schema_format("normalized_values", {value_id: {"type": "string"} for value_id in values})
+    if response_format is not None:
+        params["response_format"] = response_format
+    response = chat_completion(
+        model=MODEL,
+        messages=[prompt, {"role": "user", "content": json.dumps(values, ensure_ascii=False)}],
+        temperature=0,
+        validate=parse_json_object,
+        **params,
+    )
+    answers = parse_json_object(response)
+
+    normalized = {}
+    for value_id, answer in answers.items():
+        field = values.get(value_id, {}).get("field")
+        if not isinstance(answer, str) or field is None:
+            continue
+        answer = answer.strip()
+        pattern = NORMALIZED_DATETIME if field in DATETIME_FIELDS else NORMALIZED_AMOUNT
+        if answer == "" or pattern.match(answer):
+            normalized[value_id] = answer
+    return normalized
+
+
+def normalize_records(records, use_llm=True, target_tz=None, llm_chunk_size=50):
+    """
+    Normalizes a batch of extracted records in-process, calling GPT only for unparsed values.
+
+    Args:
+        records (list): Records returned by keyword extraction.
+        use_llm (bool): Send values the local parser cannot handle to GPT.
+        target_tz (tzinfo): Optional timezone to convert aware datetimes to.
+        llm_chunk_size (int): Maximum number of values per GPT request.
+
+    Returns:
+        list: Normalized records (unparsed values are kept as extracted).
+    """
+    with metrics.stage_timer("normalization", items=len(records)):
+        return normalize_record_batch(records, use_llm, target_tz, llm_chunk_size)
+
+
+def normalize_record_batch(records, use_llm, target_tz, llm_chunk_size):
+    """Body of `normalize_records`, timed as the "normalization" stage."""
+    normalized_records, pending = [], {}
+    for idx, record in enumerate(records):
+        normalized, unresolved = normalize_record(record, target_tz)
+        normalized_records.append(normalized)
+        for key, value in unresolved.items():
+            pending[f"{idx}.{key}"] = {"field": key, "value": value,
+                                       "message_datetime": normalized.get("message_datetime", "")}
+
+    if pending and use_llm:
+        print(f"Normalizing {len(pending)} unparsed values with GPT...")
+        for attempt in range(GPT_ATTEMPTS):
+            failed = {}
+            value_ids = list(pending)
+            for start in range(0, len(value_ids), llm_chunk_size):
+                chunk = {value_id: pending[value_id] for value_id in value_ids[start:start + llm_chunk_size]}
+                try:
+                    answers = normalize_values_with_gpt(chunk)
+                except Exception as e:
+                    print(f"Error normalizing JSON: {e}")
+                    answers = {}
+                for value_id, answer in answers.items():
+                    idx, key = value_id.split(".", 1)
+                    normalized_records[int(idx)][key] = answer
+                failed.update({value_id: value for value_id, value in chunk.items() if value_id not in answers})
+            if not failed or attempt + 1 == GPT_ATTEMPTS:
+                break
+            # Only the values without a valid answer are asked again
+            print(f"Retrying normalization of {len(failed)} values...")
+            pending = failed
+
+    return normalized_records
@@ -0,0 +1,514 @@
+import os
+import time
+import queue
+import threading
+from data_preprocessing import iter_files, eml_output_name, convert_input_files, SPREADSHEET_EXTENSIONS
+from A2P_classifying import classify_texts, text_to_html, BATCH_SIZE
+from named_entitiy_recognition import extract_keywords_from_texts
+from manifest import Manifest, A2P_TEXT_DIR
+from corpus_store import CorpusStore, html_name, raw_json_name
+from a2p_prefilter import load_default_prefilter
+from llm_client import MAX_CONCURRENCY, MAX_INPUT_TOKENS, estimate_tokens, UsageCounter, use_usage_counter
+from dedup import Deduplicator, DEDUP_ENABLED, exact_hash
+import metrics
+
+
+QUEUE_SIZE = 64  # Messages waiting between two stages (backpressure)
+NER_BATCH_SIZE = 8  # Records normalized together by one NER worker
+CHECKPOINT_EVERY = 50  # Manifest updates between saves
+CHECKPOINT_SECONDS = 30  # ... or seconds, whichever comes first
+PROGRESS_INTERVAL = 0.5  # Seconds between progress events of one stage
+STAGES = ["extraction", "classification", "html", "ner"]
+_STOP = object()
+
+
+def discover_inputs(dir_name):
+    """
+    Lists the input files of a case folder (emails are searched recursively).
+
+    Returns:
+        list: (path relative to the case folder, converter) tuples.
+    """
+    inputs = [(os.path.relpath(path, dir_name), "eml") for path in iter_files(os.path.join(dir_name, "emls"), ".eml")]
+    for folder, extensions, converter in [("textmessage", SPREADSHEET_EXTENSIONS, "excel"),
+                                         ("messagingapp", (".txt",), "messagingapp")]:
+        for file_name in sorted(os.listdir(os.path.join(dir_name, folder))):
+            if file_name.lower().endswith(extensions):
+                inputs.append((os.path.join(folder, file_name), converter))
+    return inputs
+
+
+def extraction_task(dir_name, rel_path, converter, store_dir=None):
+    """Builds the `convert_input_file` task for one input of a case (messages go into the store in `store_dir` or the case)."""
+    output_name = eml_output_name(os.path.relpath(rel_path, "emls")) if converter == "eml" else None
+    return os.path.join(dir_name, rel_path), converter, store_dir or dir_name, output_name, rel_path
+
+
+def take_batch(work_queue, max_items):
+    """
+    Blocks for one item, then drains up to `max_items - 1` more without waiting.
+
+    Returns:
+        list or None: The items, or None once the stop marker is reached (it is put back for the other workers).
+    """
+    item = work_queue.get()
+    if item is _STOP:
+        work_queue.put(_STOP)
+        return None
+    items = [item]
+    while len(items) < max_items:
+        try:
+            item = work_queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is _STOP:
+            work_queue.put(_STOP)
+            break
+        items.append(item)
+    return items
+
+
+class StageProgress:
+    """Done/total counts, throughput and ETA of one pipeline stage (totals grow as upstream stages hand work over)."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.total = 0
+        self.done = 0
+        self.errors = 0
+        self.started = None
+        self.reported = 0.0
+
+    def update(self, total=0, done=0, errors=0):
+        if self.started is None:
+            self.started = time.monotonic()
+        self.total += total
+        self.done += done + errors
+        self.errors += errors
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: stage, done, total, errors, rate (items per second), eta (seconds, None while unknown) and elapsed.
+        """
+        elapsed = time.monotonic() - self.started if self.started is not None else 0.0
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - self.done, 0)
+        eta = remaining / rate if rate > 0 else (0.0 if not remaining else None)
+        return {"stage": self.stage, "done": self.done, "total": self.total, "errors": self.errors,
+                "rate": round(rate, 2), "eta": None if eta is None else round(eta, 1), "elapsed": round(elapsed, 1)}
+
+
+class Pipeline:
+    """
+    Streams every message of a case through extraction -> classification -> HTML -> NER.
+
+    Each stage runs in its own thread(s) and hands messages to the next stage through a bounded
+    queue, so results for the first messages are available long before the whole corpus is done.
+    Progress is reported through `on_event(event)` with dicts such as:
+
+        {"event": "extracted", "text": name, "source": rel_path, "tokens": estimated tokens}
+        {"event": "classified", "text": name, "a2p": bool, "duplicate_of": representative name or None}
+        {"event": "html", "text": name, "html_name": document name}
+        {"event": "message_done", "text": name, "html_name": document name, "entities": dict, "record": dict}
+        {"event": "error", "stage": stage, "text": name, "error": message}
+        {"event": "progress", "stage": stage, "done": int, "total": int, "errors": int,
+         "rate": items per second, "eta": seconds or None, "elapsed": seconds}
+
+    `on_event` is called from worker threads; GUI consumers should hand events over through a queue.
+    Progress events are sent at most every PROGRESS_INTERVAL seconds per stage, and once more for
+    every stage when the run ends.
+    Message texts and stage outputs are kept in the case's corpus store rather than in per-message
+    files. The case manifest is updated as messages complete and checkpointed every CHECKPOINT_EVERY updates or
+    CHECKPOINT_SECONDS, so the pipeline is incremental and resumable.
+
+    Before classification, messages are grouped into clusters of exact and near duplicates (see
+    `dedup.Deduplicator`); only the first message of a cluster is classified and its verdict is
+    reused for the others. NER results are reused for exact duplicates only, since near duplicates
+    differ in the very values being extracted (order numbers, dates, amounts).
+
+    Setting `cancel_event` (or calling `cancel`) stops the run at message boundaries: messages already
+    sent to GPT are finished, everything else stays pending in the manifest and is resumed by the next run.
+    """
+
+    def __init__(self, dir_name, on_event=None, queue_size=QUEUE_SIZE, classify_workers=None, ner_workers=None,
+                 cancel_event=None):
+        self.dir_name = dir_name
+        self.on_event = on_event
+        self.cancel_event = cancel_event or threading.Event()
+        self.classify_workers = classify_workers or MAX_CONCURRENCY
+        self.ner_workers = ner_workers or MAX_CONCURRENCY
+        self.a2p_dir = os.path.join(dir_name, A2P_TEXT_DIR)
+
+        self.classify_queue = queue.Queue(maxsize=queue_size)
+        self.html_queue = queue.Queue(maxsize=queue_size)
+        self.ner_queue = queue.Queue(maxsize=queue_size)
+
+        self.store = CorpusStore(dir_name)
+        self.manifest = Manifest(dir_name, self.store)
+        self.prefilter = load_default_prefilter()
+        self.lock = threading.Lock()
+        self.updates = 0  # Manifest updates since the last save
+        self.saved = time.monotonic()
+        self.progress = {stage: StageProgress(stage) for stage in STAGES}
+        self.progress_lock = threading.Lock()
+
+        self.dedup = Deduplicator() if DEDUP_ENABLED else None
+        self.dedup_lock = threading.Lock()
+        self.verdicts = {}  # Cluster representative -> A2P verdict (None if it failed)
+        self.followers = {}  # Cluster representative -> duplicates waiting for its verdict
+        self.ner_results = {}  # Exact text hash -> (raw entities, normalized record)
+        self.ner_reused = 0
+        self.usage = UsageCounter()  # GPT requests made by this pipeline's workers
+        self.counts = None
+
+    def emit(self, event, **fields):
+        if self.on_event is not None:
+            fields["event"] = event
+            try:
+                self.on_event(fields)
+            except Exception as e:
+                print(f"Error in pipeline event handler: {e}")
+
+    def cancel(self):
+        """Asks the pipeline to stop after the messages currently being processed."""
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def track(self, stage, total=0, done=0, errors=0, force=False):
+        """Updates the progress of a stage and emits a progress event when one is due."""
+        with self.progress_lock:
+            progress = self.progress[stage]
+            progress.update(total, done, errors)
+            now = time.monotonic()
+            if not force and now - progress.reported < PROGRESS_INTERVAL and progress.done < progress.total:
+                return
+            progress.reported = now
+            snapshot = progress.snapshot()
+        self.emit("progress", **snapshot)
+
+    def checkpoint(self):
+        """Saves the manifest every CHECKPOINT_EVERY updates or CHECKPOINT_SECONDS (call with `self.lock` held)."""
+        self.updates += 1
+        now = time.monotonic()
+        if self.updates >= CHECKPOINT_EVERY or now - self.saved >= CHECKPOINT_SECONDS:
+            self.manifest.save()
+            self.updates, self.saved = 0, now
+
+    def update_text(self, name, **fields):
+        """Records stage results for a text and periodically checkpoints the manifest."""
+        with self.lock:
+            entry = self.manifest.texts.get(name)
+            if entry is None:
+                return
+            entry.update(fields)
+            self.checkpoint()
+
+    def run_source(self):
+        """Queues unfinished work from a previous run, then extracts new or changed inputs."""
+        with self.lock:
+            resumed_html = self.manifest.pending("html")
+            html_names = set(resumed_html)
+            resumed_ner = [name for name in self.manifest.pending("ner") if name not in html_names]
+            resumed_classification = self.manifest.pending("classification")
+        self.track("ner", total=len(resumed_ner))
+        self.track("html", total=len(resumed_html))
+        self.track("classification", total=len(resumed_classification))
+        for name in resumed_ner:
+            self.ner_queue.put(name)
+        for name in resumed_html:
+            self.html_queue.put(name)
+        for name in resumed_classification:
+            self.classify_queue.put(name)
+
+        inputs = discover_inputs(self.dir_name)
+        current = {rel_path for rel_path, _ in inputs}
+        with self.lock:
+            for rel_path in [p for p in self.manifest.inputs if p not in current]:
+                print(f"Input removed: {rel_path}")
+                self.manifest.remove_input(rel_path)
+            self.manifest.save()
+
+        changed = []
+        for rel_path, converter in inputs:
+            with self.lock:
+                sha256 = self.manifest.input_changed(rel_path)
+                if sha256 is None:
+                    continue
+                self.manifest.remove_input(rel_path)
+            changed.append((rel_path, converter, sha256))
+
+        # Inputs are converted on a process pool whose workers write the messages into the store in bounded
+        # chunks; only their names and lengths come back, in order as the inputs finish
+        self.track("extraction", total=len(changed))
+        tasks = [extraction_task(self.dir_name, rel_path, converter) for rel_path, converter, _ in changed]
+        results = convert_input_files(tasks)
+        try:
+            for (rel_path, _, sha256), (stored, error) in zip(changed, results):
+                if self.cancelled:
+                    # Inputs not recorded yet count as changed again on the next run
+                    break
+                if error:
+                    print(f"Failed to process {rel_path}: {error}")
+                    self.emit("error", stage="extraction", text=rel_path, error=error)
+                    self.track("extraction", errors=1)
+                    continue
+                names = [name for name, _ in stored]
+                with self.lock:
+                    # Until the next checkpoint, a crash only means the input is extracted again
+                    self.manifest.record_input(rel_path, sha256, names)
+                    self.checkpoint()
+                self.track("classification", total=len(stored))
+                for name, length in stored:
+                    tokens = estimate_tokens(length)
+                    if MAX_INPUT_TOKENS and tokens > MAX_INPUT_TOKENS:
+                        print(f"{name}: ~{tokens} tokens, truncated to {MAX_INPUT_TOKENS} for GPT requests")
+                    self.emit("extracted", text=name, source=rel_path, tokens=tokens)
+                    self.classify_queue.put(name)
+                self.track("extraction", done=1)
+        finally:
+            # Closing the generator cancels conversions that have not started
+            results.close()
+
+    def record_classification(self, name, is_a2p, duplicate_of=None):
+        """Stores a verdict, hands A2P messages to the HTML stage and releases duplicates waiting for it."""
+        try:
+            self.store.set_classification(name, is_a2p)
+            print(f"DEBUG: {name} classified as: {'A2P' if is_a2p else 'P2P'}"
+                  + (f" (duplicate of {duplicate_of})" if duplicate_of else ""))
+            self.update_text(name, classification=is_a2p)
+            self.emit("classified", text=name, a2p=is_a2p, duplicate_of=duplicate_of)
+            if is_a2p:
+                self.track("html", total=1)
+                self.html_queue.put(name)
+            self.track("classification", done=1)
+        except Exception as e:
+            self.emit("error", stage="classification", text=name, error=str(e))
+            self.track("classification", errors=1)
+        self.release_followers(name, is_a2p)
+
+    def fail_classification(self, name, error):
+        self.emit("error", stage="classification", text=name, error=error)
+        self.track("classification", errors=1)
+        self.release_followers(name, None)
+
+    def release_followers(self, name, verdict):
+        if self.dedup is None:
+            return
+        with self.dedup_lock:
+            self.verdicts[name] = verdict
+            followers = self.followers.pop(name, [])
+        for follower in followers:
+            self.follow(follower, name)
+
+    def follow(self, name, representative):
+        """Applies the verdict of a cluster representative to a duplicate, or waits for it if it is still being classified."""
+        with self.dedup_lock:
+            if representative not in self.verdicts:
+                self.followers.setdefault(representative, []).append(name)
+                return
+            verdict = self.verdicts[representative]
+        if verdict is None:
+            # Left pending in the manifest, so the next run classifies it
+            self.fail_classification(name, f"duplicate of {representative}, which could not be classified")
+        else:
+            self.record_classification(name, verdict, duplicate_of=representative)
+
+    def run_classification(self):
+        while True:
+            names = take_batch(self.classify_queue, BATCH_SIZE)
+            if names is None:
+                return
+            if self.cancelled:
+                continue
+            try:
+                texts = self.store.get_texts(names)
+            except Exception as e:
+                for name in names:
+                    self.fail_classification(name, str(e))
+                continue
+
+            # Only the first message of each duplicate cluster is sent for classification
+            representatives, duplicates = [], []
+            for name, text in texts.items():
+                representative = self.dedup.assign(name, text)[0] if self.dedup is not None else None
+                if representative is None:
+                    representatives.append((name, text))
+                else:
+                    duplicates.append((name, representative))
+            try:
+                results = classify_texts(representatives, self.prefilter) if representatives else {}
+            except Exception as e:
+                for name, _ in representatives:
+                    self.fail_classification(name, str(e))
+                results = {}
+
+            for name, (is_a2p, decided_locally) in results.items():
+                if is_a2p is None:
+                    # Left pending in the manifest, so the next run asks GPT again instead of keeping a guess
+                    self.fail_classification(name, "GPT classification failed")
+                else:
+                    self.record_classification(name, is_a2p)
+            for name, representative in duplicates:
+                self.follow(name, representative)
+            # Texts missing from the store (removed inputs) are not retried
+            self.track("classification", done=len(names) - len(texts))
+
+    def run_html(self):
+        while True:
+            name = self.html_queue.get()
+            if name is _STOP:
+                return
+            if self.cancelled:
+                continue
+            try:
+                document_name = html_name(name)
+                with metrics.stage_timer("html"):
+                    self.store.set_html(name, text_to_html(os.path.splitext(document_name)[0],
+                                                           self.store.get_text(name)))
+                self.update_text(name, html=document_name)
+                self.emit("html", text=name, html_name=document_name)
+                self.track("ner", total=1)
+                self.ner_queue.put(name)
+                self.track("html", done=1)
+            except Exception as e:
+                print(f"Error converting {name}: {e}")
+                self.emit("error", stage="html", text=name, error=str(e))
+                self.track("html", errors=1)
+
+    def run_ner(self):
+        while True:
+            names = take_batch(self.ner_queue, NER_BATCH_SIZE)
+            if names is None:
+                return
+            if self.cancelled:
+                continue
+            try:
+                # Records keep the exported text path as "source_path" (see CorpusStore.export)
+                texts = self.store.get_texts(names)
+                pending, reused = self.split_ner_duplicates(texts)
+                results = extract_keywords_from_texts(
+                    [(os.path.join(self.a2p_dir, f"a2p_{name}"), text) for name, text in pending.items()])
+            except Exception as e:
+                for name in names:
+                    self.emit("error", stage="ner", text=name, error=str(e))
+                self.track("ner", errors=len(names))
+                continue
+
+            results = {os.path.basename(source_path)[len("a2p_"):]: result for source_path, result in results.items()}
+            if self.dedup is not None:
+                self.share_ner_results(texts, results, reused)
+            for name, (extracted_json, normalized_json) in results.items():
+                if "error" in extracted_json:
+                    # Left pending in the manifest, so the next run retries only the failed messages
+                    self.emit("error", stage="ner", text=name, error=extracted_json["error"])
+                    self.track("ner", errors=1)
+                    continue
+                self.store.set_entities(name, extracted_json, normalized_json)
+                self.update_text(name, ner=raw_json_name(name))
+                self.emit("message_done", text=name, html_name=html_name(name), entities=extracted_json,
+                          record=normalized_json)
+                self.track("ner", done=1)
+            self.track("ner", done=len(names) - len(results))
+
+    def split_ner_duplicates(self, texts):
+        """
+        Separates texts that need extraction from exact duplicates of texts already extracted in this run.
+
+        Returns:
+            tuple: ({name: text} to send to GPT, {name: text hash} of duplicates to fill in afterwards)
+        """
+        if self.dedup is None:
+            return texts, {}
+        pending, reused, keys = {}, {}, set()
+        with self.dedup_lock:
+            for name, text in texts.items():
+                key = exact_hash(text)
+                if key in self.ner_results or key in keys:
+                    reused[name] = key
+                else:
+                    keys.add(key)
+                    pending[name] = text
+        return pending, reused
+
+    def share_ner_results(self, texts, results, reused):
+        """Remembers successful extractions and copies them to the exact duplicates of the batch."""
+        with self.dedup_lock:
+            for name, (extracted_json, normalized_json) in results.items():
+                if "error" not in extracted_json:
+                    self.ner_results.setdefault(exact_hash(texts[name]), (extracted_json, normalized_json))
+            shared = {name: self.ner_results[key] for name, key in reused.items() if key in self.ner_results}
+            self.ner_reused += len(shared)
+        for name, (extracted_json, normalized_json) in shared.items():
+            source_path = os.path.join(self.a2p_dir, f"a2p_{name}")
+            results[name] = ({**extracted_json, "source_path": source_path},
+                             {**normalized_json, "source_path": source_path})
+
+    def run(self):
+        """
+        Runs the pipeline to completion, or until it is cancelled.
+
+        Returns:
+            list: Normalized records of every A2P message in the case.
+        """
+        def work(target):
+            use_usage_counter(self.usage)
+            target()
+
+        def start(target, count=1):
+            threads = [threading.Thread(target=work, args=(target,), daemon=True) for _ in range(count)]
+            for thread in threads:
+                thread.start()
+            return threads
+
+        classifiers = start(self.run_classification, self.classify_workers)
+        html_converters = start(self.run_html)
+        ner_workers = start(self.run_ner, self.ner_workers)
+
+        # Each stage is stopped once every producer feeding it has finished
+        try:
+            self.run_source()
+        finally:
+            self.classify_queue.put(_STOP)
+            for thread in classifiers:
+                thread.join()
+            self.html_queue.put(_STOP)
+            for thread in html_converters:
+                thread.join()
+            self.ner_queue.put(_STOP)
+            for thread in ner_workers:
+                thread.join()
+
+            with self.lock:
+                self.manifest.save()
+            self.counts = self.store.counts()
+            records = self.store.records()
+            self.store.close()
+            for stage in STAGES:
+                self.track(stage, force=True)
+                metrics.set_stage_wall_time(stage, os.path.basename(os.path.normpath(self.dir_name)),
+                                            self.progress[stage].snapshot()["elapsed"])
+            if self.dedup is not None and self.dedup.duplicates:
+                print(f"Skipped GPT classification of {self.dedup.duplicates} duplicate messages "
+                      f"({self.dedup.near_duplicates} near duplicates) and extraction of {self.ner_reused}.")
+        return records
+
+    def summary(self):
+        """
+        Summarizes a finished run.
+
+        Returns:
+            dict: counts (texts, a2p, html, records in the store), stages (final progress per stage),
+                llm (GPT requests, cache hits and tokens) and duplicates (messages not sent to GPT).
+        """
+        return {
+            "counts": self.counts,
+            "stages": {stage: self.progress[stage].snapshot() for stage in STAGES},
+            "llm": self.usage.snapshot(),
+            "duplicates": {"classification": self.dedup.duplicates if self.dedup is not None else 0,
+                           "near": self.dedup.near_duplicates if self.dedup is not None else 0,
+                           "ner": self.ner_reused},
+        }
@@ -1,23 +1,26 @@
 import os
-from data_preprocessing import save_eml_to_txt, save_excel_rows_to_txt, split_messagingapp_files
-from A2P_classifying import process_txt_files, convert_text_to_html
-from named_entitiy_recognition import extract_keywords
+from named_entitiy_recognition import save_cache
+from manifest import MANIFEST_FILE, HTML_DIR, JSON_DIR
+from pipeline import Pipeline
+from llm_client import get_cache
+import metrics
 
 CACHE_FILE = "cache.json"  # Define the cache file path
 
-def preprocess(dir_name):
-    """Main function to preprocess data, classify messages, and extract keywords."""
 
-    # ✅ Step 0: Delete cache.json if it exists
-    if os.path.exists(CACHE_FILE):
-        os.remove(CACHE_FILE)
-        print("🗑️ Deleted existing cache.json. Starting fresh.")
+def run_case(dir_name, on_event=None, cancel_event=None):
+    """
+    Runs the streaming pipeline over one case folder without touching the GUI's JSON table cache.
 
-    text_output_dir = os.path.join(dir_name, "text")
-
-    # Step 1: Data Preprocessing
-    print("Step 1: Data Preprocessing...")
+    Args:
+        dir_name (str): Case folder with emls/, textmessage/ and messagingapp/.
+        on_event (callable): Receives per-message and progress pipeline events (called from worker threads).
+        cancel_event (threading.Event): Set to stop processing at message boundaries; the next run resumes.
 
+    Returns:
+        tuple: (Pipeline after its run, normalized records of the case), or (None, None) for a case
+        processed before manifests existed, which is left untouched.
+    """
     # ✅ Create input subdirectories if they don't exist
     for folder in ["emls", "textmessage", "messagingapp"]:
         path = os.path.join(dir_name, folder)
@@ -25,32 +28,65 @@ def preprocess(dir_name):
             os.makedirs(path)
             print(f"📁 Created missing folder: {folder}")
 
-    already_precessed = False
-    for name in os.listdir(dir_name):
-        full_path = os.path.join(dir_name, name)
-        if os.path.isdir(full_path) and "A2P-classified" in name:
-            already_precessed = True
-    if not already_precessed:
-        save_eml_to_txt(os.path.join(dir_name, "emls"), text_output_dir)
-        save_excel_rows_to_txt(os.path.join(dir_name, "textmessage"), text_output_dir)
-        split_messagingapp_files(os.path.join(dir_name, "messagingapp"), text_output_dir)
-
-        # Step 2: Classifying A2P messages
-        print("Step 2: Classifying A2P messages...")
-        a2p_classified_dir = os.path.join(dir_name, "A2P-classified-text")
-        process_txt_files([text_output_dir], a2p_classified_dir)
-
-        html_output_dir = os.path.join(dir_name, "A2P-classified-html")
-        convert_text_to_html(a2p_classified_dir, html_output_dir)
-
-        # Step 3: Extracting keywords
-        print("Step 3: Extracting keywords from A2P messages...")
-        keyword_output_dir = os.path.join(dir_name, "A2P-classified-json")
-        extract_keywords([a2p_classified_dir], keyword_output_dir)
-    else:
-        html_output_dir = os.path.join(dir_name, "A2P-classified-html")
-        keyword_output_dir = os.path.join(dir_name, "A2P-classified-json")
+    # ✅ Cases processed before manifests existed are left untouched
+    if not os.path.exists(os.path.join(dir_name, MANIFEST_FILE)) and any(
+            os.path.isdir(os.path.join(dir_name, name)) and "A2P-classified" in name for name in os.listdir(dir_name)):
+        print("Case was processed without a manifest; skipping. Remove the A2P-classified folders to re-process it.")
+        return None, None
+
+    print("Streaming messages through preprocessing, A2P classification and keyword extraction...")
+    pipeline = Pipeline(dir_name, on_event=on_event, cancel_event=cancel_event)
+    return pipeline, pipeline.run()
+
+
+def preprocess(dir_name, on_event=None, cancel_event=None):
+    """
+    Main function to preprocess data, classify messages, and extract keywords.
+
+    Messages stream through extraction -> classification -> HTML -> NER independently (see `pipeline.Pipeline`),
+    and processing is incremental: the case manifest records every input's content hash and the outputs of
+    each stage, so a re-run only processes new or changed inputs and removes outputs of deleted inputs.
+
+    Args:
+        dir_name (str): Case folder with emls/, textmessage/ and messagingapp/.
+        on_event (callable): Receives per-message and progress pipeline events (called from worker threads).
+        cancel_event (threading.Event): Set to stop processing at message boundaries; the next run resumes.
+
+    Returns:
+        tuple: (JSON output directory, HTML output directory) as written by `corpus_store` export
+    """
 
-    print("Processing completed.")
+    # ✅ Step 0: Delete cache.json if it exists (GPT responses stay in the persistent LLM cache)
+    if os.path.exists(CACHE_FILE):
+        os.remove(CACHE_FILE)
+        print("🗑️ Deleted existing cache.json. Starting fresh.")
+
+    html_output_dir = os.path.join(dir_name, HTML_DIR)
+    keyword_output_dir = os.path.join(dir_name, JSON_DIR)
+
+    # ✅ SERENA_METRICS=on writes serena_metrics.json / .prom to the case folder after the run
+    metrics.registry.reset()
+
+    pipeline, records = run_case(dir_name, on_event, cancel_event)
+    if pipeline is None:
+        print("Processing completed.")
+        return keyword_output_dir, html_output_dir
+
+    # ✅ The JSON table is rebuilt from every record of the case, not only the new ones
+    save_cache(records)
+
+    cache = get_cache()
+    if cache:
+        stats = cache.stats()
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries.")
+
+    if metrics.ENABLED:
+        json_path, _ = metrics.write_reports(os.path.join(dir_name, metrics.REPORT_NAME))
+        print(f"📊 Run metrics written to {json_path} (cost estimate: ${metrics.registry.report()['cost_usd']}).")
+
+    if pipeline.cancelled:
+        print("Processing cancelled. Select the folder again to resume.")
+    else:
+        print("Processing completed.")
 
     return keyword_output_dir, html_output_dir
@@ -0,0 +1,180 @@
+import re
+import bisect
+from normalization import is_null, parse_number, NUMBER
+
+
+DATE_PREFIX = re.compile(r"^(\d{4})[/-](\d{1,2})[/-](\d{1,2})")
+MISSING = (1, "")  # Sort key of empty values (always after filled ones)
+
+
+def display_value(value):
+    """Formats a record value for a table cell (lists are joined, NULL-like values are blank)."""
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value if not is_null(item))
+    return "" if is_null(value) else str(value)
+
+
+def parse_amount(value):
+    """Returns the number of an amount such as 'USD 18.00' or '$1,234.50', or None."""
+    numbers = NUMBER.findall(value) if isinstance(value, str) else []
+    if not numbers:
+        return float(value) if isinstance(value, (int, float)) else None
+    try:
+        return float(parse_number(numbers[0]))
+    except ValueError:
+        return None
+
+
+def parse_date(value):
+    """Returns 'YYYY/MM/DD' for a normalized datetime or a date typed as YYYY-MM-DD / YYYY/M/D, or None."""
+    match = DATE_PREFIX.match(value.strip()) if isinstance(value, str) else None
+    if not match:
+        return None
+    year, month, day = match.groups()
+    return f"{year}/{int(month):02d}/{int(day):02d}"
+
+
+def sort_key(column, value):
+    """Precomputed sort key of a cell: amounts sort by number, other columns by case-folded text."""
+    if column == "amount":
+        amount = parse_amount(value)
+        return MISSING if amount is None else (0, amount)
+    text = display_value(value)
+    return (0, text.casefold()) if text else MISSING
+
+
+class RecordFilter:
+    """Service name substring, inclusive action date range and inclusive amount range (None means unbounded)."""
+
+    def __init__(self, service="", date_from=None, date_to=None, amount_min=None, amount_max=None):
+        self.service = service.strip().casefold()
+        self.date_from = date_from
+        self.date_to = date_to
+        self.amount_min = amount_min
+        self.amount_max = amount_max
+
+    def is_empty(self):
+        return not self.service and self.date_from is self.date_to is self.amount_min is self.amount_max is None
+
+    def narrows(self, other):
+        """Checks whether every record this filter accepts is also accepted by `other` (so it can refine other's result)."""
+        def within(new, old, tighter):
+            return old is None or (new is not None and (new == old or tighter(new, old)))
+
+        return (other.service in self.service
+                and within(self.date_from, other.date_from, lambda new, old: new > old)
+                and within(self.date_to, other.date_to, lambda new, old: new < old)
+                and within(self.amount_min, other.amount_min, lambda new, old: new > old)
+                and within(self.amount_max, other.amount_max, lambda new, old: new < old))
+
+
+class RecordTable:
+    """
+    Table model of the normalized records of a case, built for tens of thousands of rows.
+
+    Records are kept once; sorting and filtering work on lists of record indices (every record in
+    sort order, and the filtered view), using sort keys and filter fields that are computed once per
+    record (sort keys per column on first use).
+    Only the rows a widget actually shows are formatted, through `rows(start, count)`.
+    A filter that narrows the previous one only re-checks the rows of the current view.
+    """
+
+    def __init__(self, columns, records=None):
+        """
+        Args:
+            columns (list): Record keys shown as columns.
+            records (list): Initial normalized records.
+        """
+        self.columns = columns
+        self.records = []
+        self.services = []
+        self.dates = []
+        self.amounts = []
+        self.sort_keys = {}
+        self.sort_column = None
+        self.descending = False
+        self.filter = RecordFilter()
+        self.order = []
+        self.view = []
+        self.extend(records or [])
+
+    def extend(self, records):
+        """Adds records (e.g. as the pipeline completes them), keeping the current sort order and filter."""
+        for record in records:
+            index = len(self.records)
+            self.records.append(record)
+            self.services.append(display_value(record.get("service_name")).casefold())
+            self.dates.append(parse_date(record.get("action_datetime")) or parse_date(record.get("message_datetime")))
+            self.amounts.append(parse_amount(record.get("amount")))
+            for column, keys in self.sort_keys.items():
+                keys.append(sort_key(column, record.get(column)))
+
+            targets = [self.order, self.view] if self.accepts(index, self.filter) else [self.order]
+            for indices in targets:
+                if self.sort_column is None:
+                    indices.append(index)
+                else:
+                    bisect.insort(indices, index, key=self.sort_keys[self.sort_column].__getitem__)
+
+    def append(self, record):
+        self.extend([record])
+
+    def accepts(self, index, record_filter):
+        if record_filter.service and record_filter.service not in self.services[index]:
+            return False
+        if record_filter.date_from is not None or record_filter.date_to is not None:
+            date = self.dates[index]
+            if date is None or (record_filter.date_from is not None and date < record_filter.date_from) \
+                    or (record_filter.date_to is not None and date > record_filter.date_to):
+                return False
+        if record_filter.amount_min is not None or record_filter.amount_max is not None:
+            amount = self.amounts[index]
+            if amount is None or (record_filter.amount_min is not None and amount < record_filter.amount_min) \
+                    or (record_filter.amount_max is not None and amount > record_filter.amount_max):
+                return False
+        return True
+
+    def set_filter(self, record_filter):
+        """
+        Applies a filter to the table.
+
+        Args:
+            record_filter (RecordFilter): New filter (dates as 'YYYY/MM/DD', see `parse_date`).
+
+        Returns:
+            int: Number of matching records.
+        """
+        candidates = self.view if record_filter.narrows(self.filter) else self.order
+        self.filter = record_filter
+        if record_filter.is_empty():
+            self.view = list(candidates)
+        else:
+            self.view = [index for index in candidates if self.accepts(index, record_filter)]
+        return len(self.view)
+
+    def sort(self, column, descending=False):
+        """Sorts the view by a column (empty values last in ascending order)."""
+        if column not in self.sort_keys:
+            self.sort_keys[column] = [sort_key(column, record.get(column)) for record in self.records]
+        if column != self.sort_column:
+            self.order.sort(key=self.sort_keys[column].__getitem__)
+            self.view.sort(key=self.sort_keys[column].__getitem__)
+        self.sort_column, self.descending = column, descending
+
+    def __len__(self):
+        return len(self.view)
+
+    def record(self, position):
+        """Returns the record shown at a position of the view."""
+        return self.records[self.view[-1 - position if self.descending else position]]
+
+    def rows(self, start, count):
+        """
+        Formats the rows of one window of the view.
+
+        Returns:
+            list: Cell values per row, for positions `start` to `start + count - 1`.
+        """
+        end = min(start + count, len(self.view))
+        return [[display_value(self.record(position).get(column)) for column in self.columns]
+                for position in range(max(start, 0), end)]
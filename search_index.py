@@ -0,0 +1,309 @@
+import os
+import re
+import sys
+import json
+import shlex
+import sqlite3
+import argparse
+
+
+FTS_TOKENIZER = "unicode61 remove_diacritics 2"
+NORMALIZED_AMOUNT = re.compile(r"^([A-Z]{3}) (-?\d+(?:\.\d+)?)$")  # As written by normalization.normalize_amount
+PHONE_NUMBER = re.compile(r"\+?\d[\d ().-]{5,}\d")
+PHONE_SUFFIX_DIGITS = 8  # Numbers also match on their last digits, so country and area prefixes may differ
+DEFAULT_LIMIT = 100
+
+# Search query fields (see `parse_query`)
+QUERY_FIELD = re.compile(r"^(service|date|from|to|currency|mobile|amount)(:|>=|<=|>|<)(.+)$", re.IGNORECASE)
+
+
+def digits(value):
+    return re.sub(r"\D", "", value) if isinstance(value, str) else ""
+
+
+def phone_key(number):
+    """Digits a phone number is matched on (its last PHONE_SUFFIX_DIGITS digits)."""
+    return digits(number)[-PHONE_SUFFIX_DIGITS:]
+
+
+def phone_numbers(text):
+    """Returns the digits and match keys of phone-number-like sequences in a text, space separated."""
+    numbers = {digits(match) for match in PHONE_NUMBER.findall(text)}
+    numbers = {number for number in numbers if 7 <= len(number) <= 15}
+    return " ".join(sorted(numbers | {phone_key(number) for number in numbers}))
+
+
+def record_fields(record):
+    """
+    Extracts the typed search fields of a normalized record.
+
+    Returns:
+        tuple: (service name, case-folded service name, action datetime, amount, currency, mobile number digits)
+    """
+    def text(key):
+        value = record.get(key)
+        return value.strip() if isinstance(value, str) else ""
+
+    amount, currency = None, None
+    match = NORMALIZED_AMOUNT.match(text("amount"))
+    if match:
+        currency, amount = match.group(1), float(match.group(2))
+    service = text("service_name")
+    return service, service.casefold(), text("action_datetime") or None, amount, currency, digits(text("mobile_number")) or None
+
+
+def fts_query(terms):
+    """Builds an FTS5 query that requires every term (a trailing * makes a term a prefix search)."""
+    parts = []
+    for term in terms:
+        prefix = term.endswith("*")
+        term = term.rstrip("*").replace('"', '""')
+        if term:
+            parts.append(f'"{term}"*' if prefix else f'"{term}"')
+    return " ".join(parts)
+
+
+class SearchIndex:
+    """
+    Full-text and entity index over the extracted A2P records of a case.
+
+    Lives in the corpus store's SQLite file: an FTS5 table over the message text (plus the phone
+    numbers found in it) and a table of typed record fields with B-tree indexes on service name,
+    action datetime, currency + amount and mobile number. `CorpusStore` keeps it current: a message
+    is indexed when its NER record is stored and unindexed when the message is replaced or deleted.
+    Without FTS5 support in the SQLite library, text search falls back to LIKE scans.
+    """
+
+    def __init__(self, conn):
+        """
+        Args:
+            conn (sqlite3.Connection): Corpus store connection (callers hold the store's lock).
+        """
+        self.conn = conn
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_records ("
+            "doc_id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, service TEXT, service_key TEXT, "
+            "action_datetime TEXT, amount REAL, currency TEXT, mobile TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_search_service ON search_records(service_key)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_search_datetime ON search_records(action_datetime)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_search_amount ON search_records(currency, amount)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_search_mobile ON search_records(mobile)")
+        try:
+            conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS search_text USING fts5(text, numbers, tokenize='{FTS_TOKENIZER}')")
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False
+
+    def add(self, name, text, record):
+        """Indexes (or re-indexes) one message with its normalized record."""
+        self.remove([name])
+        cursor = self.conn.execute(
+            "INSERT INTO search_records (name, service, service_key, action_datetime, amount, currency, mobile) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", (name, *record_fields(record)))
+        if self.fts:
+            self.conn.execute("INSERT INTO search_text (rowid, text, numbers) VALUES (?, ?, ?)",
+                              (cursor.lastrowid, text, phone_numbers(text)))
+
+    def remove(self, names):
+        for name in names:
+            row = self.conn.execute("SELECT doc_id FROM search_records WHERE name = ?", (name,)).fetchone()
+            if row:
+                if self.fts:
+                    self.conn.execute("DELETE FROM search_text WHERE rowid = ?", row)
+                self.conn.execute("DELETE FROM search_records WHERE doc_id = ?", row)
+
+    def clear(self):
+        self.conn.execute("DELETE FROM search_records")
+        if self.fts:
+            self.conn.execute("DELETE FROM search_text")
+
+    def is_stale(self):
+        """Checks whether some stored records are missing from the index (stores created before the index existed)."""
+        indexed = self.conn.execute("SELECT COUNT(*) FROM search_records").fetchone()[0]
+        stored = self.conn.execute("SELECT COUNT(*) FROM messages WHERE record IS NOT NULL").fetchone()[0]
+        return indexed != stored
+
+    def rebuild(self):
+        """Re-indexes every message that has a normalized record."""
+        self.clear()
+        rows = self.conn.execute("SELECT name, text, record FROM messages WHERE record IS NOT NULL").fetchall()
+        for name, text, record in rows:
+            self.add(name, text, json.loads(record))
+        return len(rows)
+
+    def search(self, text=None, service=None, date_from=None, date_to=None, amount_min=None, amount_max=None,
+               amount_above=None, amount_below=None, currency=None, mobile=None, limit=DEFAULT_LIMIT):
+        """
+        Finds indexed messages matching every given condition.
+
+        Args:
+            text (str or list): Words that must all appear in the message (a trailing * matches a prefix).
+            service (str): Case-insensitive substring of the service name.
+            date_from (str): Earliest action datetime, or a prefix of it ("2024/03", "2024/03/01").
+            date_to (str): Latest action datetime; a prefix includes the whole period ("2024/03" = end of March).
+            amount_min, amount_max (float): Inclusive amount bounds.
+            amount_above, amount_below (float): Exclusive amount bounds.
+            currency (str): ISO currency code ("USD").
+            mobile (str): Phone number in the record's mobile_number or anywhere in the message (digits are compared).
+            limit (int): Maximum number of results (None for all).
+
+        Raises:
+            ValueError: If `mobile` has no digits.
+
+        Returns:
+            list: Dicts with name, service, action_datetime, amount, currency, mobile and snippet
+            (text matches are ordered by relevance, other results by action datetime).
+        """
+        conditions, params = [], []
+        terms = text.split() if isinstance(text, str) else list(text or [])
+        match = fts_query(terms)
+        joined = bool(match) and self.fts
+        if joined:
+            conditions.append("search_text MATCH ?")
+            params.append(f"text : ({match})")
+        elif terms:
+            for term in terms:
+                conditions.append("m.text LIKE ? ESCAPE '\\'")
+                params.append("%" + re.sub(r"([%_\\])", r"\\\1", term.rstrip("*")) + "%")
+
+        if service:
+            conditions.append("r.service_key LIKE ? ESCAPE '\\'")
+            params.append("%" + re.sub(r"([%_\\])", r"\\\1", service.strip().casefold()) + "%")
+        if date_from:
+            conditions.append("r.action_datetime >= ?")
+            params.append(date_from.replace("-", "/"))
+        if date_to:
+            date_to = date_to.replace("-", "/")
+            conditions.append("substr(r.action_datetime, 1, ?) <= ?")
+            params.extend([len(date_to), date_to])
+        for value, operator in [(amount_min, ">="), (amount_max, "<="), (amount_above, ">"), (amount_below, "<")]:
+            if value is not None:
+                conditions.append(f"r.amount {operator} ?")
+                params.append(float(value))
+        if currency:
+            conditions.append("r.currency = ?")
+            params.append(currency.strip().upper())
+        if mobile:
+            key = phone_key(mobile)
+            if not key:
+                # An empty key would match every record (LIKE '%%') and an empty FTS phrase
+                raise ValueError(f"mobile number {mobile!r} has no digits")
+            if self.fts:
+                conditions.append("(r.mobile LIKE ? OR r.doc_id IN (SELECT rowid FROM search_text WHERE search_text MATCH ?))")
+                params.extend([f"%{key}%", f'numbers : "{key}"'])
+            else:
+                conditions.append("(r.mobile LIKE ? OR m.text LIKE ?)")
+                params.extend([f"%{key}%", f"%{mobile.strip()}%"])
+
+        snippet = "snippet(search_text, 0, '[', ']', '…', 12)" if joined else "NULL"
+        query = (f"SELECT r.name, r.service, r.action_datetime, r.amount, r.currency, r.mobile, {snippet} "
+                 "FROM search_records r JOIN messages m ON m.name = r.name "
+                 + ("JOIN search_text ON search_text.rowid = r.doc_id " if joined else "")
+                 + ("WHERE " + " AND ".join(conditions) + " " if conditions else "")
+                 + ("ORDER BY rank" if joined else "ORDER BY r.action_datetime IS NULL, r.action_datetime, r.name"))
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        columns = ["name", "service", "action_datetime", "amount", "currency", "mobile", "snippet"]
+        return [dict(zip(columns, row)) for row in self.conn.execute(query, params).fetchall()]
+
+
+def parse_query(query):
+    """
+    Turns a search box query into `SearchIndex.search` arguments.
+
+    Fields: service:<name>, date:<prefix> (e.g. date:2024/03), from:<date>, to:<date>, currency:<code>,
+    mobile:<number>, amount>=N, amount<=N, amount>N, amount<N and amount:N (exact). Quoted values may
+    contain spaces; every other word must appear in the message text.
+
+    Example:
+        'receipt service:amazon currency:USD amount>100 date:2024/03'
+
+    Raises:
+        ValueError: If an amount is not a number, a mobile number has no digits or the quotes are unbalanced.
+    """
+    arguments, terms = {}, []
+    for token in shlex.split(query):
+        match = QUERY_FIELD.match(token)
+        if not match:
+            terms.append(token)
+            continue
+        field, operator, value = match.group(1).lower(), match.group(2), match.group(3)
+        if field == "amount":
+            number = float(value.replace(",", ""))
+            if operator == ":":
+                arguments["amount_min"] = arguments["amount_max"] = number
+            else:
+                key = {">=": "amount_min", "<=": "amount_max", ">": "amount_above", "<": "amount_below"}[operator]
+                arguments[key] = number
+        elif operator != ":":
+            terms.append(token)
+        elif field == "date":
+            arguments["date_from"] = arguments["date_to"] = value
+        elif field in ("from", "to"):
+            arguments[f"date_{field}"] = value
+        elif field == "mobile" and not phone_key(value):
+            raise ValueError(f"mobile number {value!r} has no digits")
+        else:
+            arguments[field] = value
+    if terms:
+        arguments["text"] = terms
+    return arguments
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search the extracted A2P records of a processed case.")
+    parser.add_argument("case_dir", help="Processed case folder.")
+    parser.add_argument("query", nargs="*", help="Words to find in the message text, and/or fields such as "
+                                                 "service:amazon amount>100 date:2024/03 mobile:01012345678.")
+    parser.add_argument("--service", help="Service name substring.")
+    parser.add_argument("--from", dest="date_from", help="Earliest action date (YYYY/MM/DD or a prefix such as 2024/03).")
+    parser.add_argument("--to", dest="date_to", help="Latest action date (a prefix includes the whole period).")
+    parser.add_argument("--min", dest="amount_min", type=float, help="Minimum amount.")
+    parser.add_argument("--max", dest="amount_max", type=float, help="Maximum amount.")
+    parser.add_argument("--currency", help="ISO currency code (e.g. USD).")
+    parser.add_argument("--mobile", help="Phone number (in the record or anywhere in the message).")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="Maximum number of results (0 for all).")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines.")
+    parser.add_argument("--rebuild", action="store_true", help="Re-index every record before searching.")
+    args = parser.parse_args(argv)
+
+    from corpus_store import CorpusStore, CORPUS_FILE  # corpus_store imports this module
+    if not os.path.exists(os.path.join(args.case_dir, CORPUS_FILE)):
+        print(f"No {CORPUS_FILE} in {args.case_dir}.")
+        return 1
+
+    try:
+        arguments = parse_query(" ".join(shlex.quote(word) for word in args.query))
+    except ValueError as e:
+        print(f"Invalid query: {e}")
+        return 2
+    for key in ["service", "date_from", "date_to", "amount_min", "amount_max", "currency", "mobile"]:
+        if getattr(args, key) is not None:
+            arguments[key] = getattr(args, key)
+
+    store = CorpusStore(args.case_dir)
+    try:
+        if args.rebuild:
+            print(f"Indexed {store.rebuild_search_index()} records.")
+        results = store.search(limit=args.limit or None, **arguments)
+    except ValueError as e:
+        print(f"Invalid query: {e}")
+        return 2
+    finally:
+        store.close()
+
+    for result in results:
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+        else:
+            amount = f"{result['currency'] or ''} {result['amount']:.2f}".strip() if result["amount"] is not None else ""
+            line = f"{result['name']}\t{result['service'] or ''}\t{result['action_datetime'] or ''}\t{amount}"
+            print(line + (f"\n    {result['snippet']}" if result["snippet"] else ""))
+    if not args.json:
+        print(f"{len(results)} result(s).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+import os
+import re
+import json
+
+
+# Strict JSON-schema response formats for extraction and normalization ("off" for servers without support)
+STRUCTURED_OUTPUTS = os.getenv("SERENA_STRUCTURED_OUTPUTS", "on").lower() not in ("", "0", "off")
+
+CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+BARE_VALUE = re.compile(r"[A-Za-z0-9_.+-]+")  # NULL, None, true, 12.50 ... written without quotes
+WHITESPACE = " \t\r\n"
+
+
+def json_schema_format(name, properties):
+    """
+    Builds a strict `response_format` for an object with exactly the given properties.
+
+    Args:
+        name (str): Schema name reported to the API.
+        properties (dict): Property name -> JSON schema (every property is required).
+
+    Returns:
+        dict: The `response_format` request parameter, or None when SERENA_STRUCTURED_OUTPUTS is off.
+    """
+    if not STRUCTURED_OUTPUTS:
+        return None
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": {
+        "type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}}}
+
+
+def skip(text, pos, characters):
+    while pos < len(text) and text[pos] in characters:
+        pos += 1
+    return pos
+
+
+def iter_json_fields(text):
+    """
+    Yields the (key, value) pairs of the first JSON object in a model response, one field at a time.
+
+    Code fences and prose around the object, trailing commas and bare values (NULL, None) are tolerated.
+    Parsing stops at the first field that is incomplete or unreadable, so the fields of a response cut off
+    by the token limit are still returned.
+
+    Raises:
+        ValueError: If the response contains no JSON object.
+    """
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("No JSON object in the response")
+    pos = start + 1
+    while True:
+        pos = skip(text, pos, WHITESPACE + ",")
+        if pos >= len(text) or text[pos] == "}":
+            return
+        try:
+            key, pos = decoder.raw_decode(text, pos)
+        except ValueError:
+            return
+        pos = skip(text, pos, WHITESPACE)
+        if not isinstance(key, str) or pos >= len(text) or text[pos] != ":":
+            return
+        pos = skip(text, pos + 1, WHITESPACE)
+        try:
+            value, pos = decoder.raw_decode(text, pos)
+        except ValueError:
+            bare = BARE_VALUE.match(text, pos)
+            # A value running to the end of the text may have been cut off
+            if bare is None or bare.end() >= len(text):
+                return
+            value, pos = bare.group(0), bare.end()
+        yield key, value
+
+
+def parse_json_object(text):
+    """
+    Parses the JSON object of a model response, falling back to `iter_json_fields` for malformed output.
+
+    Returns:
+        dict: The parsed object (only its readable fields if the response was malformed).
+
+    Raises:
+        ValueError: If no field can be read.
+    """
+    try:
+        data = json.loads(CODE_FENCE.sub("", text))
+        if isinstance(data, dict):
+            return data
+    except ValueError:
+        pass
+    data = dict(iter_json_fields(text))
+    if not data:
+        raise ValueError(f"Unreadable JSON response: {text[:80]!r}")
+    return data
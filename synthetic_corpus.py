@@ -0,0 +1,224 @@
+import os
+import csv
+import sys
+import random
+import argparse
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import format_datetime
+
+
+EMAILS_PER_FOLDER = 1000  # .eml files per emls/ subfolder
+ROWS_PER_SPREADSHEET = 50000  # Text messages per textmessage/ file
+MESSAGES_PER_CHAT = 200  # Messages per messagingapp/ chat log
+EPOCH = datetime(2023, 1, 1, 8, 0)
+
+SERVICES = ["Amazon", "Weee", "Nike", "Zara", "Expedia", "Amtrak", "Uber", "Lyft", "DoorDash", "Walmart", "Target",
+            "BestBuy", "Costco", "Etsy", "eBay", "Airbnb", "Delta", "United", "Hilton", "Marriott", "Netflix",
+            "Spotify", "PayPal", "Venmo", "Chase", "Citi", "FedEx", "UPS", "DHL", "Starbucks"]
+FIRST_NAMES = ["John", "Jane", "Alex", "Maria", "Wei", "Ahmed", "Olivia", "Liam", "Sofia", "Noah", "Emma", "Lucas",
+               "Mia", "Ethan", "Ava", "Mason", "Chloe", "Leo", "Zoe", "Omar"]
+LAST_NAMES = ["Doe", "Smith", "Kim", "Garcia", "Chen", "Patel", "Nguyen", "Brown", "Lee", "Martin", "Lopez", "Wilson"]
+ADJECTIVES = ["red", "blue", "wireless", "organic", "leather", "compact", "deluxe", "vintage", "smart", "portable",
+              "ceramic", "bamboo", "stainless", "waterproof", "ergonomic", "classic", "mini", "premium"]
+PRODUCTS = ["headphones", "backpack", "coffee beans", "running shoes", "desk lamp", "water bottle", "phone case",
+            "notebook", "yoga mat", "blender", "jacket", "sunglasses", "keyboard", "charger", "tea set", "watch"]
+STREETS = ["S Ewing Ave", "W 87th St", "N Michigan Ave", "Elm St", "Oak Dr", "Maple Ln", "Pine Rd", "Cedar Blvd"]
+CITIES = [("Chicago", "IL"), ("Baltimore", "MD"), ("Seattle", "WA"), ("Austin", "TX"), ("Denver", "CO"),
+          ("Boston", "MA"), ("Portland", "OR"), ("Miami", "FL")]
+CHAT_WORDS = ["hey", "are", "we", "still", "on", "for", "dinner", "tonight", "running", "late", "see", "you", "soon",
+              "thanks", "call", "me", "later", "did", "get", "the", "photos", "sounds", "good", "lol", "ok", "tomorrow",
+              "weekend", "plans", "movie", "meeting", "moved", "to", "3pm", "happy", "birthday", "miss", "you"]
+
+A2P_TEMPLATES = [
+    ("Your {service} order #{order} has been confirmed",
+     "Hi {name},\n\nThank you for shopping with {service}! We received your order #{order} on {date}.\n\n"
+     "Item: {product} x{quantity}\nTotal: ${amount}\nShip to: {address}\n\n"
+     "We'll let you know as soon as it ships.\n\nThe {service} Team"),
+    ("Payment receipt from {service}",
+     "Dear {name},\n\nYour payment of USD {amount} to {service} was completed on {date}.\n"
+     "Transaction ID: {order}\nCard ending in {card}\n\nKeep this receipt for your records."),
+    ("{service}: your item has been shipped",
+     "Good news, {name}! Your {product} has been shipped.\n\nTracking number: {tracking}\n"
+     "Estimated delivery: {delivery}\nDelivery address: {address}\n\nTrack your package in the {service} app."),
+    ("Booking confirmation {order}",
+     "Hello {name},\n\nYour booking with {service} is confirmed.\nConfirmation code: {order}\n"
+     "Check-in: {date}\nGuests: {quantity}\nTotal charged: ${amount}\n\nWe look forward to welcoming you."),
+]
+P2P_TEMPLATES = [
+    ("Re: {topic}", "Hi {name},\n\n{chatter}\n\nTalk soon,\n{sender}"),
+    ("{topic}", "{chatter}\n\n{chatter2}\n\n- {sender}"),
+]
+P2P_TOPICS = ["weekend plans", "lunch tomorrow?", "photos from the trip", "quick question", "happy birthday!",
+              "meeting notes", "catching up"]
+
+
+class MessageFactory:
+    """Builds reproducible A2P and P2P message contents from a seeded random generator."""
+
+    def __init__(self, seed=0, a2p_rate=0.5, duplicate_rate=0.1):
+        self.random = random.Random(seed)
+        self.a2p_rate = a2p_rate
+        self.duplicate_rate = duplicate_rate
+        self.recent = []  # Earlier messages that exact duplicates are copied from
+
+    def fields(self):
+        r = self.random
+        city, state = r.choice(CITIES)
+        when = EPOCH + timedelta(minutes=r.randrange(0, 60 * 24 * 700))
+        return {
+            "service": r.choice(SERVICES),
+            "name": f"{r.choice(FIRST_NAMES)} {r.choice(LAST_NAMES)}",
+            "sender": r.choice(FIRST_NAMES),
+            "order": str(r.randrange(10 ** 7, 10 ** 9)),
+            "tracking": "".join(r.choice("0123456789") for _ in range(12)),
+            "card": str(r.randrange(1000, 9999)),
+            "date": when.strftime("%B %d, %Y %H:%M"),
+            "delivery": (when + timedelta(days=r.randrange(1, 7))).strftime("%A, %B %d"),
+            "product": f"{r.choice(ADJECTIVES)} {r.choice(PRODUCTS)}",
+            "quantity": r.randrange(1, 5),
+            "amount": f"{r.randrange(5, 900)}.{r.randrange(0, 100):02d}",
+            "address": f"{r.randrange(10, 9999)} {r.choice(STREETS)}, {city}, {state} {r.randrange(10000, 99999)}",
+            "topic": r.choice(P2P_TOPICS),
+            "chatter": " ".join(r.choice(CHAT_WORDS) for _ in range(r.randrange(6, 30))).capitalize() + ".",
+            "chatter2": " ".join(r.choice(CHAT_WORDS) for _ in range(r.randrange(4, 20))).capitalize() + "?",
+            "when": when,
+        }
+
+    def message(self):
+        """
+        Returns:
+            tuple: (is_a2p, subject, body, fields); a share of `duplicate_rate` repeats an earlier message.
+        """
+        if self.recent and self.random.random() < self.duplicate_rate:
+            return self.random.choice(self.recent)
+        values = self.fields()
+        is_a2p = self.random.random() < self.a2p_rate
+        subject, body = self.random.choice(A2P_TEMPLATES if is_a2p else P2P_TEMPLATES)
+        message = (is_a2p, subject.format(**values), body.format(**values), values)
+        self.recent = (self.recent + [message])[-500:]
+        return message
+
+
+def write_emails(dir_name, count, factory):
+    for index in range(count):
+        folder = os.path.join(dir_name, "emls", f"batch_{index // EMAILS_PER_FOLDER:05d}")
+        if index % EMAILS_PER_FOLDER == 0:
+            os.makedirs(folder, exist_ok=True)
+        is_a2p, subject, body, values = factory.message()
+        email = EmailMessage()
+        email["From"] = f"{values['service']} <no-reply@{values['service'].lower()}.com>" if is_a2p \
+            else f"{values['sender']} <{values['sender'].lower()}@example.com>"
+        email["To"] = "john.doe@example.com"
+        email["Subject"] = subject
+        email["Date"] = format_datetime(values["when"])
+        email.set_content(body)
+        with open(os.path.join(folder, f"message_{index:07d}.eml"), "wb") as f:
+            f.write(bytes(email))
+
+
+def write_text_messages(dir_name, count, factory, spreadsheet="csv"):
+    folder = os.path.join(dir_name, "textmessage")
+    os.makedirs(folder, exist_ok=True)
+    header = ["#", "from", "to", "direction", "body", "status", "message type", "folder", "timestamp-date",
+              "timestamp-time"]
+    for start in range(0, count, ROWS_PER_SPREADSHEET):
+        rows = []
+        for number in range(start + 1, min(start + ROWS_PER_SPREADSHEET, count) + 1):
+            is_a2p, subject, body, values = factory.message()
+            # Short codes for services, mobile numbers for people
+            sender = str(factory.random.randrange(1000, 99999)) if is_a2p \
+                else f"010{factory.random.randrange(10 ** 7, 10 ** 8)}"
+            rows.append([number, sender, "", "Incoming", f"[{values['service']}] {subject}\n{body}" if is_a2p else body,
+                         "Read", "MMS" if len(body) > 80 else "SMS", "Inbox", "",
+                         values["when"].strftime("%Y-%m-%d %p %I:%M:%S")])
+        path = os.path.join(folder, f"textmessage_{start // ROWS_PER_SPREADSHEET:04d}.{spreadsheet}")
+        if spreadsheet == "csv":
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(rows)
+        else:
+            from openpyxl import Workbook
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet()
+            sheet.append(header)
+            for row in rows:
+                sheet.append(row)
+            workbook.save(path)
+
+
+def write_chats(dir_name, count, factory):
+    """Chat logs in the messaging app export format; A2P messages come from service accounts, P2P ones from people."""
+    folder = os.path.join(dir_name, "messagingapp")
+    os.makedirs(folder, exist_ok=True)
+    for chat_index, start in enumerate(range(0, count, MESSAGES_PER_CHAT)):
+        lines, day = [], None
+        when = EPOCH + timedelta(days=chat_index)
+        for _ in range(min(MESSAGES_PER_CHAT, count - start)):
+            is_a2p, subject, body, values = factory.message()
+            when += timedelta(minutes=factory.random.randrange(1, 600))
+            if when.date() != day:
+                day = when.date()
+                lines.append(f"--------------- {when.strftime('%A, %B')} {when.day}, {when.year} ---------------")
+            sender = f"{values['service']}Official" if is_a2p else values["sender"]
+            text = f"{subject}\n{body}" if is_a2p else values["chatter"]
+            lines.append(f"{when.strftime('%B')} {when.day}, {when.year}, {when.strftime('%H:%M')}, {sender}: {text}")
+        with open(os.path.join(folder, f"MessagingApp_chat_{chat_index:05d}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def generate_case(dir_name, messages=1000, seed=0, email_share=0.4, text_share=0.4, a2p_rate=0.5,
+                  duplicate_rate=0.1, spreadsheet="csv"):
+    """
+    Writes a synthetic case folder with emls/, textmessage/ and messagingapp/ inputs.
+
+    The same arguments always produce the same files. Messages follow a handful of order, receipt,
+    shipping and booking templates (A2P) or casual chat (P2P), with names, products, amounts and dates drawn
+    at random; a share of `duplicate_rate` repeats an earlier message verbatim.
+
+    Args:
+        dir_name (str): Case folder to create.
+        messages (int): Total number of messages.
+        seed (int): Random seed.
+        email_share (float): Share of messages written as .eml files (one per file).
+        text_share (float): Share written as spreadsheet rows; the rest goes to chat logs.
+        a2p_rate (float): Share of A2P messages.
+        duplicate_rate (float): Share of exact repeats of earlier messages.
+        spreadsheet (str): "csv" or "xlsx".
+
+    Returns:
+        dict: Number of emails, text messages and chat messages written.
+    """
+    factory = MessageFactory(seed, a2p_rate, duplicate_rate)
+    emails = int(messages * email_share)
+    texts = int(messages * text_share)
+    chats = messages - emails - texts
+    for folder in ["emls", "textmessage", "messagingapp"]:
+        os.makedirs(os.path.join(dir_name, folder), exist_ok=True)
+    write_emails(dir_name, emails, factory)
+    write_text_messages(dir_name, texts, factory, spreadsheet)
+    write_chats(dir_name, chats, factory)
+    return {"emails": emails, "text_messages": texts, "chat_messages": chats}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic case folder for benchmarks.")
+    parser.add_argument("case_dir", help="Folder to create.")
+    parser.add_argument("-n", "--messages", type=int, default=1000, help="Total number of messages (default 1000).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--email-share", type=float, default=0.4)
+    parser.add_argument("--text-share", type=float, default=0.4)
+    parser.add_argument("--a2p-rate", type=float, default=0.5)
+    parser.add_argument("--duplicate-rate", type=float, default=0.1)
+    parser.add_argument("--spreadsheet", choices=["csv", "xlsx"], default="csv")
+    args = parser.parse_args(argv)
+
+    counts = generate_case(args.case_dir, args.messages, args.seed, args.email_share, args.text_share,
+                           args.a2p_rate, args.duplicate_rate, args.spreadsheet)
+    print(f"Generated {args.case_dir}: {counts}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
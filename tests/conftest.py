@@ -0,0 +1,42 @@
+import os
+import sys
+import pytest
+
+# The modules live at the repository root; llm_client builds its client at import time, and tests never
+# touch the user's response cache unless they ask for one
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["SERENA_LLM_CACHE"] = "off"
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    """A MockOpenAIServer that every GPT call of the test goes to (attributes such as error_rate can be changed)."""
+    from openai import OpenAI
+    import llm_client
+    from mock_openai_server import MockOpenAIServer
+
+    server = MockOpenAIServer().start()
+    monkeypatch.setattr(llm_client, "client", OpenAI(api_key="test", base_url=server.url, max_retries=0))
+    monkeypatch.setattr(llm_client, "BACKOFF_BASE", 0.01)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def llm_cache(tmp_path, monkeypatch):
+    """A fresh response cache for the test."""
+    import llm_client
+
+    monkeypatch.setattr(llm_client, "LLM_CACHE_PATH", str(tmp_path / "llm_cache.sqlite3"))
+    monkeypatch.setattr(llm_client, "_cache", None)
+    yield llm_client.get_cache()
+    llm_client.get_cache().close()
+
+
+def replace_answers(monkeypatch, rewrite):
+    """Makes the mock server pass every answer through `rewrite(body, answer)`."""
+    import mock_openai_server
+
+    answer = mock_openai_server.answer
+    monkeypatch.setattr(mock_openai_server, "answer", lambda body: rewrite(body, answer(body)))
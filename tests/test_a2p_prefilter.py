@@ -0,0 +1,34 @@
+from a2p_prefilter import A2PPrefilter, rule_log_odds
+
+
+def sms(sender, body):
+    return f"#: 1\nfrom: {sender}\nto: nan\nbody: {body}\nstatus: Read\nmessage type: SMS\n"
+
+
+def test_personal_chat_is_decided_p2p_locally():
+    prefilter = A2PPrefilter()
+    assert prefilter.classify(sms("14155550123", "hey are you still coming tonight? running late lol")) is False
+
+
+def test_conversational_chat_window_is_decided_p2p_locally():
+    window = ("--------------- Wednesday, October 9, 2024 ---------------\n"
+              "October 9, 2024, 20:01, Alice Kim: omg I miss you, see you tomorrow?\n"
+              "October 9, 2024, 20:02, Alice Kim: call me when you're free\n")
+    assert A2PPrefilter().classify(window) is False
+
+
+def test_personal_number_alone_is_left_to_gpt():
+    notice = sms("14153900123", "Your package is ready to be picked up.  Access code is 685957  Locker Location:")
+    assert A2PPrefilter().classify(notice) is None
+
+
+def test_automated_content_cancels_conversation_evidence():
+    text = sms("14155550123", "Hey! Your order is ready lol. Track it at https://example.com/t/1 Reply STOP to end")
+    assert rule_log_odds(text) > -1.0
+    assert A2PPrefilter().classify(text) is not False
+
+
+def test_transactional_email_is_decided_a2p_locally():
+    email = ("From: Orders <no-reply@shop.example>\nSubject: Your order receipt\n\n"
+             "Order number: 123456\nTotal: $45.00\n")
+    assert A2PPrefilter().classify(email) is True
@@ -0,0 +1,105 @@
+import os
+import json
+import llm_client
+import batch_processing
+from batch_processing import (LocalBatchClient, run_batch_classification, run_batch_extraction,
+                              run_batch_stage)
+from A2P_classifying import classify_email
+from structured_output import parse_json_object
+
+
+def stage_requests(temperature=0):
+    bodies = {"ner-0": "unreadable", "ner-1": "readable"}
+    return lambda: [(custom_id, f"{custom_id}.txt", {"model": "gpt-4o", "temperature": temperature,
+                                                      "messages": [{"role": "user", "content": text}]})
+                    for custom_id, text in bodies.items()]
+
+
+def respond(body):
+    return '{"service_name": "Shopco"}' if body["messages"][0]["content"] == "readable" else "Sorry."
+
+
+def run_stage(tmp_path, requests):
+    state = {}
+    client = LocalBatchClient(str(tmp_path / "jobs"), respond)
+    status, results, _ = run_batch_stage("extraction", requests, client, state, str(tmp_path / "state.json"),
+                                         str(tmp_path), validate=parse_json_object)
+    os.remove(tmp_path / "batch_extraction_output.jsonl")
+    return status, results, state["extraction"]
+
+
+def test_only_valid_batch_responses_are_cached(tmp_path, llm_cache):
+    status, results, _ = run_stage(tmp_path, stage_requests())
+    assert status == "completed"
+    assert results["ner-0"] == "Sorry."
+    assert llm_cache.stats()["entries"] == 1
+
+    # The next job takes the valid answer from the cache and submits only the unreadable one again
+    _, _, stage = run_stage(tmp_path, stage_requests())
+    assert list(stage["cached"]) == ["ner-1"]
+
+
+def test_sampled_batch_responses_are_not_cached(tmp_path, llm_cache):
+    run_stage(tmp_path, stage_requests(temperature=0.65))
+    assert llm_cache.stats()["entries"] == 0
+
+
+def test_unreadable_batch_extraction_falls_back_to_single_requests(tmp_path, mock_server, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    input_dir = tmp_path / "A2P-classified-text"
+    input_dir.mkdir()
+    for index in range(3):
+        (input_dir / f"a2p_{index}.txt").write_text(
+            f"Thank you for shopping with Shopco. Order total: ${index + 10}.00", encoding="utf-8")
+
+    client = LocalBatchClient(str(tmp_path / "jobs"), lambda body: "Sorry.")
+    status = run_batch_extraction([str(input_dir)], str(tmp_path / "json"), client, {},
+                                  str(tmp_path / "state.json"), str(tmp_path))
+    assert status == "completed"
+    assert mock_server.stats["requests"] >= 3
+    for index in range(3):
+        with open(tmp_path / "json" / f"raw_a2p_{index}.txt.json", encoding="utf-8") as f:
+            record = json.load(f)
+        assert record["service_name"] == "Shopco"
+        assert record["amount"] == f"${index + 10}.00"
+
+
+def test_failed_classification_fallback_leaves_files_pending(tmp_path, mock_server, monkeypatch):
+    input_dir = tmp_path / "text"
+    input_dir.mkdir()
+    for index in range(2):
+        (input_dir / f"msg_{index}.txt").write_text(f"Your Shopco order #{index}7 has shipped.", encoding="utf-8")
+    monkeypatch.setattr(batch_processing, "load_default_prefilter", lambda: None)
+    monkeypatch.setattr(batch_processing, "read_batch_output", lambda path: {"cls-0": None, "cls-1": None})
+    monkeypatch.setattr(llm_client, "MAX_RETRIES", 0)
+    client = LocalBatchClient(str(tmp_path / "jobs"), lambda body: "A2P")
+    state, state_path, output_dir = {}, str(tmp_path / "state.json"), str(tmp_path / "a2p")
+
+    mock_server.error_rate = 1.0
+    status = run_batch_classification([str(input_dir)], output_dir, client, state, state_path, str(tmp_path))
+    assert status == "incomplete"
+    assert state["classification"]["status"] != "ingested"
+
+    # The paid batch is not submitted again; only the pending files are retried
+    mock_server.error_rate = 0.0
+    requests = mock_server.stats["requests"]
+    status = run_batch_classification([str(input_dir)], output_dir, client, state, state_path, str(tmp_path))
+    assert status == "completed"
+    assert state["classification"]["status"] == "ingested"
+    assert mock_server.stats["requests"] - requests == 2
+
+
+def test_batch_classifications_answer_online_requests(tmp_path, mock_server, llm_cache, monkeypatch):
+    input_dir = tmp_path / "text"
+    input_dir.mkdir()
+    content = "Your Shopco order #17 has shipped."
+    (input_dir / "msg_0.txt").write_text(content, encoding="utf-8")
+    monkeypatch.setattr(batch_processing, "load_default_prefilter", lambda: None)
+    client = LocalBatchClient(str(tmp_path / "jobs"), lambda body: "A2P")
+    status = run_batch_classification([str(input_dir)], str(tmp_path / "a2p"), client, {},
+                                      str(tmp_path / "state.json"), str(tmp_path))
+    assert status == "completed"
+
+    # Both paths send the same model, so the batch answer is the online request's cache entry
+    assert classify_email(content) is True
+    assert mock_server.stats["requests"] == 0
@@ -0,0 +1,60 @@
+import json
+import llm_client
+from A2P_classifying import classify_emails_batch
+from conftest import replace_answers
+
+A2P_TEXT = "Your order receipt: order number 1234, total $45.00"
+P2P_TEXT = "hey, see you tonight?"
+
+
+def messages(count):
+    # Stable EML names run to about 80 characters
+    return [(f"eml_{'Your_order_from_a_very_long_store_name_' * 2}{index}_0123abcd.txt",
+             A2P_TEXT if index % 2 else P2P_TEXT) for index in range(count)]
+
+
+def test_batch_is_classified_with_one_request(mock_server):
+    batch = messages(20)
+    verdicts = classify_emails_batch(batch)
+    assert verdicts == {name: content == A2P_TEXT for name, content in batch}
+    assert mock_server.stats["requests"] == 1
+
+
+def test_prompt_ids_are_short(mock_server, monkeypatch):
+    prompts = []
+
+    def record(body, answer):
+        prompts.append(body["messages"][-1]["content"])
+        return answer
+
+    replace_answers(monkeypatch, record)
+    classify_emails_batch(messages(3))
+    assert [line for line in prompts[0].splitlines() if line.startswith("###")] == [
+        "### MESSAGE 1", "### MESSAGE 2", "### MESSAGE 3"]
+
+
+def test_missing_verdicts_fall_back_to_single_requests(mock_server, monkeypatch):
+    def drop_first_verdict(body, answer):
+        if answer.startswith('{"verdicts"'):
+            return json.dumps({"verdicts": json.loads(answer)["verdicts"][1:]})
+        return answer
+
+    replace_answers(monkeypatch, drop_first_verdict)
+    batch = messages(4)
+    verdicts = classify_emails_batch(batch)
+    assert verdicts == {name: content == A2P_TEXT for name, content in batch}
+    assert mock_server.stats["requests"] == 2
+
+
+def test_failed_requests_are_not_reported_as_p2p(mock_server, monkeypatch):
+    monkeypatch.setattr(llm_client, "MAX_RETRIES", 0)
+    mock_server.error_rate = 1.0
+    assert set(classify_emails_batch(messages(3)).values()) == {None}
+    # A failed batch request is not repeated once per message
+    assert mock_server.stats["requests"] == 1
+
+
+def test_classifications_are_cached_by_default(mock_server, llm_cache):
+    batch = messages(4)
+    assert classify_emails_batch(batch) == classify_emails_batch(batch)
+    assert mock_server.stats["requests"] == 1
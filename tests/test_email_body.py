@@ -0,0 +1,24 @@
+import pytest
+from email_body import HIDDEN_STYLE, compact_text, html_to_text
+
+
+@pytest.mark.parametrize("style", ["display:none", "visibility: hidden", "font-size:0", "font-size: 0px !important;",
+                                   "max-height:0; overflow:hidden", "FONT-SIZE:0%"])
+def test_hidden_styles(style):
+    assert HIDDEN_STYLE.search(style)
+
+
+@pytest.mark.parametrize("style", ["font-size:0.9em", "font-size: 0.75rem; color:#333", "max-height:0.5in",
+                                   "max-height: 05px"])
+def test_small_but_visible_styles(style):
+    assert not HIDDEN_STYLE.search(style)
+
+
+def test_small_print_reaches_the_text():
+    html = '<div style="font-size:0.9em">Order total: $45.00</div><p>Thanks</p>'
+    assert compact_text(html_to_text(html)) == "Order total: $45.00\n\nThanks"
+
+
+def test_hidden_preheader_is_dropped():
+    html = '<div style="display:none;max-height:0">Preview text</div><p>Your order has shipped</p>'
+    assert compact_text(html_to_text(html)) == "Your order has shipped"
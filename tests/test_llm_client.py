@@ -0,0 +1,68 @@
+import openai
+import pytest
+import llm_client
+from llm_client import RateLimiter, TokenBucket, chat_completion
+from structured_output import parse_json_object
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+def test_token_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(60)
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+
+
+def test_rate_limiter_waits_for_the_token_budget(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(llm_client.time, "sleep", sleeps.append)
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=600)
+    limiter.acquire(600)
+    assert sleeps == []
+    limiter.acquire(100)
+    assert sleeps == [pytest.approx(10.0, abs=0.1)]
+
+
+def test_throttled_request_is_retried_after_retry_after(mock_server):
+    mock_server.interval = 0.2  # 300 requests per minute
+    assert chat_completion("gpt-4o", MESSAGES, temperature=0) == "OK"
+    assert chat_completion("gpt-4o", MESSAGES, temperature=0) == "OK"
+    assert mock_server.stats["throttled"] >= 1
+    assert mock_server.stats["requests"] == 2 + mock_server.stats["throttled"]
+
+
+def test_server_errors_are_retried_up_to_the_limit(mock_server, monkeypatch):
+    monkeypatch.setattr(llm_client, "MAX_RETRIES", 2)
+    mock_server.error_rate = 1.0
+    with pytest.raises(openai.InternalServerError):
+        chat_completion("gpt-4o", MESSAGES, temperature=0)
+    assert mock_server.stats["requests"] == 3
+
+
+def test_deterministic_requests_are_answered_from_the_cache(mock_server, llm_cache):
+    assert chat_completion("gpt-4o", MESSAGES, temperature=0) == chat_completion("gpt-4o", MESSAGES, temperature=0)
+    assert mock_server.stats["requests"] == 1
+    assert llm_cache.stats()["entries"] == 1
+
+
+def test_sampled_requests_are_never_cached(mock_server, llm_cache):
+    chat_completion("gpt-4o", MESSAGES, temperature=0.65)
+    chat_completion("gpt-4o", MESSAGES, temperature=0.65)
+    assert mock_server.stats["requests"] == 2
+    assert llm_cache.stats()["entries"] == 0
+
+
+def test_invalid_responses_are_not_cached(mock_server, llm_cache):
+    # The mock answers an unknown prompt with "OK", which is not JSON
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            chat_completion("gpt-4o", MESSAGES, temperature=0, validate=parse_json_object)
+    assert mock_server.stats["requests"] == 2
+    assert llm_cache.stats()["entries"] == 0
+
+
+def test_cached_responses_are_validated(mock_server, llm_cache):
+    chat_completion("gpt-4o", MESSAGES, temperature=0)
+    with pytest.raises(ValueError):
+        chat_completion("gpt-4o", MESSAGES, temperature=0, validate=parse_json_object)
+    assert mock_server.stats["requests"] == 2
@@ -0,0 +1,64 @@
+import named_entitiy_recognition
+from named_entitiy_recognition import EXTRACTION_ATTEMPTS, extract_entities, extract_keywords_from_texts
+from conftest import replace_answers
+
+RECEIPT = "Subject: Your order\n\nThank you for shopping with Shopco. Order total: $45.00"
+
+
+def garbage_first(monkeypatch, count):
+    """
+    Answers the first `count` extraction requests with text that is not JSON.
+
+    Returns:
+        list: Bodies of the extraction requests the mock server received.
+    """
+    calls = []
+
+    def rewrite(body, answer):
+        if "extracting keywords" not in body["messages"][0]["content"]:
+            return answer
+        calls.append(body)
+        return "Sorry, I cannot help with that." if len(calls) <= count else answer
+
+    replace_answers(monkeypatch, rewrite)
+    return calls
+
+
+def test_unreadable_response_is_retried_once(mock_server, monkeypatch):
+    calls = garbage_first(monkeypatch, 1)
+    record = extract_entities(RECEIPT, "a2p_receipt.txt")
+    assert "error" not in record
+    assert record["service_name"] == "Shopco"
+    assert record["amount"] == "$45.00"
+    assert len(calls) == 2
+
+
+def test_message_that_stays_unreadable_is_reported(mock_server, monkeypatch):
+    calls = garbage_first(monkeypatch, EXTRACTION_ATTEMPTS)
+    record = extract_entities(RECEIPT, "a2p_receipt.txt")
+    assert set(record) == {"source_path", "error"}
+    assert len(calls) == EXTRACTION_ATTEMPTS
+
+
+def test_retry_is_limited_to_the_failed_message(mock_server, monkeypatch):
+    calls = garbage_first(monkeypatch, 1)
+    results = extract_keywords_from_texts([("a.txt", RECEIPT), ("b.txt", RECEIPT.replace("45.00", "12.00"))])
+    assert all("error" not in extracted for extracted, _ in results.values())
+    assert len(calls) == 3
+
+
+def test_truncated_response_keeps_complete_fields(mock_server, monkeypatch):
+    monkeypatch.setattr(named_entitiy_recognition, "NER_MODE", "llm")
+
+    def truncate(body, answer):
+        if "extracting keywords" not in body["messages"][0]["content"]:
+            return answer
+        return answer[:answer.index('"address1"')]
+
+    replace_answers(monkeypatch, truncate)
+    record = extract_entities(RECEIPT, "a2p_receipt.txt")
+    assert "error" not in record
+    assert record["service_name"] == "Shopco"
+    assert record["action_keyword"] == "order"
+    assert "address1" not in record
+    assert mock_server.stats["requests"] == 1
@@ -0,0 +1,124 @@
+import os
+import json
+import llm_client
+from corpus_store import CorpusStore
+from data_preprocessing import store_messages
+from manifest import Manifest, MANIFEST_FILE
+from pipeline import Pipeline
+from synthetic_corpus import generate_case
+from conftest import replace_answers
+
+
+def pending(case_dir, stage):
+    store = CorpusStore(case_dir)
+    try:
+        return Manifest(case_dir, store).pending(stage)
+    finally:
+        store.close()
+
+
+def run(case_dir):
+    errors = []
+    pipeline = Pipeline(case_dir, on_event=lambda event: errors.append(event) if event["event"] == "error" else None)
+    pipeline.run()
+    return pipeline.summary()["llm"]["requests"], errors
+
+
+def test_failed_classifications_are_resumed(tmp_path, mock_server, monkeypatch):
+    case_dir = str(tmp_path / "case")
+    generate_case(case_dir, messages=20, seed=1)
+    monkeypatch.setattr(llm_client, "MAX_RETRIES", 0)
+
+    mock_server.error_rate = 1.0
+    _, errors = run(case_dir)
+    failed = pending(case_dir, "classification")
+    assert failed
+    assert {event["stage"] for event in errors} == {"classification"}
+
+    mock_server.error_rate = 0.0
+    requests, errors = run(case_dir)
+    assert errors == []
+    assert pending(case_dir, "classification") == []
+    assert pending(case_dir, "ner") == []
+    assert requests > 0
+
+    # Nothing is left to do, so a third run sends no requests
+    requests, _ = run(case_dir)
+    assert requests == 0
+
+
+def test_failed_extractions_are_resumed_without_reclassifying(tmp_path, mock_server, monkeypatch):
+    case_dir = str(tmp_path / "case")
+    generate_case(case_dir, messages=20, seed=1)
+    extraction = {"readable": False, "requests": 0}
+
+    def rewrite(body, answer):
+        if "extracting keywords" not in body["messages"][0]["content"]:
+            return answer
+        extraction["requests"] += 1
+        return answer if extraction["readable"] else "Sorry."
+
+    replace_answers(monkeypatch, rewrite)
+    _, errors = run(case_dir)
+    failed = pending(case_dir, "ner")
+    assert failed
+    assert pending(case_dir, "classification") == []
+    assert {event["stage"] for event in errors} == {"ner"}
+
+    extraction.update(readable=True, requests=0)
+    requests, errors = run(case_dir)
+    assert errors == []
+    assert pending(case_dir, "ner") == []
+    # Only the failed messages were sent again (duplicates share one request), and nothing was reclassified
+    assert 0 < extraction["requests"] <= len(failed)
+    assert requests == extraction["requests"]
+
+
+def test_records_are_kept_in_the_store_only(tmp_path, mock_server):
+    case_dir = str(tmp_path / "case")
+    generate_case(case_dir, messages=20, seed=1)
+    pipeline = Pipeline(case_dir)
+    records = pipeline.run()
+    assert records and len(records) == pipeline.counts["records"]
+    with open(os.path.join(case_dir, MANIFEST_FILE), encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert all("record" not in entry for entry in manifest["texts"].values())
+
+
+def test_extracted_messages_are_stored_in_chunks(tmp_path, monkeypatch):
+    case_dir = str(tmp_path)
+    messages = [(f"msg_{index}.txt", f"line {index}\r\nend") for index in range(25)]
+    chunks = []
+    put_texts = CorpusStore.put_texts
+    monkeypatch.setattr(CorpusStore, "put_texts",
+                        lambda self, source, chunk: (chunks.append(len(chunk)), put_texts(self, source, chunk)))
+    stored = store_messages(iter(messages), case_dir, "input.csv", chunk_size=10)
+    assert chunks == [10, 10, 5]
+    assert [name for name, _ in stored] == [name for name, _ in messages]
+
+    store = CorpusStore(case_dir)
+    try:
+        assert store.get_text("msg_3.txt") == "line 3\nend"
+    finally:
+        store.close()
+
+
+def test_failed_extraction_leaves_no_stored_messages(tmp_path):
+    case_dir = str(tmp_path)
+
+    def messages():
+        for index in range(15):
+            yield f"msg_{index}.txt", "text"
+        raise ValueError("truncated input")
+
+    try:
+        store_messages(messages(), case_dir, "input.csv", chunk_size=10)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("the extraction error was not raised")
+    store = CorpusStore(case_dir)
+    try:
+        assert store.text_names() == []
+    finally:
+        store.close()